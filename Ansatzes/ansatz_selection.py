@@ -0,0 +1,78 @@
+# from Ansatzes.ry_cx_ansatz import create_encoder_decoder_circuit, update_circuit_parameters
+from Ansatzes.rx_rz_ansatz import (
+    create_encoder_decoder_circuit as create_encoder_decoder_circuit_rx_rz,
+    update_circuit_parameters as update_circuit_parameters_rx_rz
+)
+
+from Ansatzes.Ansatz_19_tt import (
+    create_encoder_decoder_circuit as create_encoder_decoder_circuit_19_tt,
+    update_circuit_parameters as update_circuit_parameters_19_tt
+)
+
+from Ansatzes.Ansatz_19 import (
+    create_encoder_decoder_circuit as create_encoder_decoder_circuit_19,
+    update_circuit_parameters as update_circuit_parameters_19
+)
+from Ansatzes.Ansatz_19_ttt import (
+    create_encoder_decoder_circuit as create_encoder_decoder_circuit_19_ttt,
+    update_circuit_parameters as update_circuit_parameters_19_ttt
+)
+from Ansatzes.adaptive_Ansatz import (
+    create_encoder_decoder_circuit as create_encoder_decoder_circuit_19_adaptive,
+    update_circuit_parameters as update_circuit_parameters_19_adaptive
+)
+
+def create_ansatz_circuit(ansatz_choice, num_qubits, compression_level, decoder_option):
+    """
+    Create the encoder-decoder circuit of the chosen ansatz.
+
+    Args:
+    ansatz_choice (int): The ansatz to use (1-5).
+    num_qubits (int): Number of qubits for a single amplitude encoding instance.
+    compression_level (int): Number of qubits to compress to.
+    decoder_option (int): Option for decoder circuit (1 or 2).
+
+    Returns:
+    QuantumCircuit: The parameterized encoder-decoder circuit.
+    ParameterVector: The encoder parameters.
+    ParameterVector: The decoder parameters (None for decoder option 1).
+    """
+    if ansatz_choice == 1:
+        return create_encoder_decoder_circuit_rx_rz(num_qubits, compression_level, decoder_option)
+    elif ansatz_choice == 2:
+        return create_encoder_decoder_circuit_19(num_qubits, compression_level, decoder_option)
+    elif ansatz_choice == 3:
+        return create_encoder_decoder_circuit_19_tt(num_qubits, compression_level, decoder_option)
+    elif ansatz_choice == 4:
+        return create_encoder_decoder_circuit_19_ttt(num_qubits, compression_level, decoder_option)
+    elif ansatz_choice == 5:
+        return create_encoder_decoder_circuit_19_adaptive(num_qubits, compression_level, decoder_option)
+    else:
+        raise ValueError(f"Unknown ansatz_choice: {ansatz_choice}")
+
+def update_ansatz_parameters(ansatz_choice, ansatz, encoder_params, decoder_params, random_angles):
+    """
+    Bind new angles to the encoder-decoder circuit of the chosen ansatz.
+
+    Args:
+    ansatz_choice (int): The ansatz (1-5) the circuit was created with.
+    ansatz (QuantumCircuit): The parameterized encoder-decoder circuit.
+    encoder_params (ParameterVector): The encoder parameters.
+    decoder_params (ParameterVector or None): The decoder parameters or None.
+    random_angles (np.ndarray): New angles for both encoder and decoder.
+
+    Returns:
+    QuantumCircuit: The bound circuit.
+    """
+    if ansatz_choice == 1:
+        return update_circuit_parameters_rx_rz(ansatz, encoder_params, decoder_params, random_angles)
+    elif ansatz_choice == 2:
+        return update_circuit_parameters_19(ansatz, encoder_params, decoder_params, random_angles)
+    elif ansatz_choice == 3:
+        return update_circuit_parameters_19_tt(ansatz, encoder_params, decoder_params, random_angles)
+    elif ansatz_choice == 4:
+        return update_circuit_parameters_19_ttt(ansatz, encoder_params, decoder_params, random_angles)
+    elif ansatz_choice == 5:
+        return update_circuit_parameters_19_adaptive(ansatz, encoder_params, decoder_params, random_angles)
+    else:
+        raise ValueError(f"Unknown ansatz_choice: {ansatz_choice}")
@@ -1,52 +1,54 @@
 import numpy as np
 import pandas as pd
-from qiskit import QuantumCircuit
-from qiskit.circuit.library import Initialize
-from qiskit.quantum_info import Statevector
 
 def prepare_for_embedding(data_point: np.ndarray) -> np.ndarray:
     """
-    Prepare a single data point for amplitude embedding.
+    Prepare data points for amplitude embedding.
+    
+    Works on a single data point or, vectorized, on a matrix with one data point per row.
     
     Args:
-    data_point (np.ndarray): Data point
+    data_point (np.ndarray): Data point of shape (F,) or data points of shape (N, F)
     
     Returns:
-    np.ndarray: Prepared state vector
+    np.ndarray: Prepared state vector(s) of shape (F + 1,) or (N, F + 1)
     """
-    probabilities = data_point ** 2
+    probabilities = np.asarray(data_point) ** 2
     
-    sum_prob = np.sum(probabilities)
+    sum_prob = np.sum(probabilities, axis=-1, keepdims=True)
     
     # add a "trash state" probability for the remaining probability mass
-    trash_state_prob = max(0, 1 - sum_prob)
-    probabilities = np.append(probabilities, trash_state_prob)
+    trash_state_prob = np.maximum(0, 1 - sum_prob)
+    probabilities = np.concatenate([probabilities, trash_state_prob], axis=-1)
     
     # normalize to ensure sum of probabilities is 1
-    sum_prob = np.sum(probabilities)
-    if sum_prob > 0:
-        probabilities = probabilities / sum_prob
+    sum_prob = np.sum(probabilities, axis=-1, keepdims=True)
+    probabilities = np.divide(probabilities, sum_prob, out=probabilities, where=sum_prob > 0)
     
     amplitudes = np.sqrt(probabilities)
     
     return amplitudes
 
-def create_amplitude_encoding_circuit(data_point: np.ndarray, num_qubits: int) -> QuantumCircuit:
+def create_state_encoding_circuit(prepared_state: np.ndarray, num_qubits: int) -> 'QuantumCircuit':
     """
-    Create an amplitude encoding circuit for a single data point.
+    Create an amplitude encoding circuit for an already prepared state vector.
     The circuit performs two identical amplitude encodings and leaves an ancilla qubit.
     
     Args:
-    data_point (np.ndarray): Single data point
+    prepared_state (np.ndarray): Prepared state vector (output of prepare_for_embedding)
     num_qubits (int): Number of qubits for each encoding (total qubits will be 2*num_qubits + 1)
     
     Returns:
     QuantumCircuit: Amplitude encoding circuit
     """
+    # qiskit is only needed for circuits, prepare_for_embedding also serves the scorer without it
+    from qiskit import QuantumCircuit
+    from qiskit.circuit.library import Initialize
+    from qiskit.quantum_info import Statevector
+
     total_qubits = 2 * num_qubits + 1  # Two encodings plus one ancilla qubit
     qc = QuantumCircuit(total_qubits)
     
-    prepared_state = prepare_for_embedding(data_point)
     state_vector = Statevector(prepared_state)
     init_gate = Initialize(state_vector)
     
@@ -56,6 +58,21 @@ def create_amplitude_encoding_circuit(data_point: np.ndarray, num_qubits: int) -
     
     return qc
 
+def create_amplitude_encoding_circuit(data_point: np.ndarray, num_qubits: int) -> 'QuantumCircuit':
+    """
+    Create an amplitude encoding circuit for a single data point.
+    The circuit performs two identical amplitude encodings and leaves an ancilla qubit.
+    
+    Args:
+    data_point (np.ndarray): Single data point
+    num_qubits (int): Number of qubits for each encoding (total qubits will be 2*num_qubits + 1)
+    
+    Returns:
+    QuantumCircuit: Amplitude encoding circuit
+    """
+    prepared_state = prepare_for_embedding(data_point)
+    return create_state_encoding_circuit(prepared_state, num_qubits)
+
 def create_amplitude_encoding_circuits(data: pd.DataFrame, num_qubits: int) -> list:
     """
     Create a list of amplitude encoding circuits for all data points.
@@ -67,10 +84,8 @@ def create_amplitude_encoding_circuits(data: pd.DataFrame, num_qubits: int) -> l
     Returns:
     list: List of amplitude encoding circuits
     """
-    circuits = []
-    for _, row in data.iterrows():
-        circuit = create_amplitude_encoding_circuit(row.values, num_qubits)
-        circuits.append(circuit)
+    prepared_states = prepare_for_embedding(data.to_numpy())
+    circuits = [create_state_encoding_circuit(state, num_qubits) for state in prepared_states]
     
     print(f"Created {len(circuits)} amplitude encoding circuits, each with {2*num_qubits + 1} qubits")
     return circuits
\ No newline at end of file
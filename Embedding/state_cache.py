@@ -0,0 +1,77 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+class EncodedStateCache:
+    """
+    LRU cache of prepared amplitude matrices, keyed by the selected feature indices.
+
+    time_selector only has C(window_size, (2**q - 1) // num_sensors) distinct draws,
+    so an iteration hits the cache when it repeats the feature subset of an
+    earlier one. That only happens often in long runs over short windows (SKAB
+    with 4 qubits: 1140 subsets), hence the cache is off unless a memory cap is
+    given. Cached matrices are marked read-only since they are shared between
+    iterations (and threads).
+    """
+
+    def __init__(self, max_bytes):
+        """
+        Args:
+        max_bytes (int): Memory cap for the cached matrices, least recently used entries are evicted first.
+        """
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_prepare(self, key, prepare):
+        """
+        Return the cached matrix for `key`, or compute and cache it.
+
+        Args:
+        key (tuple): The selected feature indices.
+        prepare (callable): Computes the prepared amplitude matrix on a miss.
+
+        Returns:
+        np.ndarray: The (read-only) prepared amplitude matrix.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        prepared_states = np.asarray(prepare())
+        prepared_states.flags.writeable = False
+        if prepared_states.nbytes > self.max_bytes:
+            return prepared_states
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = prepared_states
+                self.current_bytes += prepared_states.nbytes
+                while self.current_bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.current_bytes -= evicted.nbytes
+                    self.evictions += 1
+        return prepared_states
+
+    def stats(self):
+        """
+        Returns:
+        dict: Hit/miss/eviction counters and the current size of the cache.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+            }
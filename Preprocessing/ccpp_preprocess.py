@@ -1,6 +1,6 @@
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler
+from Preprocessing.normalization import RangeNormalizer
 import os
 import pickle
 
@@ -31,9 +31,7 @@ def preprocess_ccpp(file_path, save_output=False, output_dir='preprocessed_data'
     anomaly_indices = labels[labels == 'o'].index.tolist()
     
     # normalize numerical features
-    scaler = StandardScaler()
-    scaled_features = pd.DataFrame(scaler.fit_transform(features), columns=features.columns)
-    normalized_data = range_based_normalize(scaled_features)
+    normalized_data = RangeNormalizer().fit_transform(features)
     
     # Create mapping from original to preprocessed indices
     original_to_preprocessed = dict(zip(data.index, normalized_data.index))
@@ -53,24 +51,3 @@ def preprocess_ccpp(file_path, save_output=False, output_dir='preprocessed_data'
         print(f"Preprocessed data, anomaly indices, and original to preprocessed index mapping saved to {output_dir}")
     
     return normalized_data, anomaly_indices, original_to_preprocessed
-
-def range_based_normalize(data):
-    """
-    Normalize the data using range-based normalization.
-    
-    Args:
-    data (pd.DataFrame): The input data to normalize.
-    
-    Returns:
-    pd.DataFrame: The normalized data.
-    """
-    num_features = data.shape[1]
-    max_value = 1 / num_features
-    normalized_data = pd.DataFrame()
-    
-    for column in data.columns:
-        min_val = data[column].min()
-        max_val = data[column].max()
-        normalized_data[column] = ((data[column] - min_val) / (max_val - min_val)) * max_value
-    
-    return normalized_data
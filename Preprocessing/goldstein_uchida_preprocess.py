@@ -1,6 +1,6 @@
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler
+from Preprocessing.normalization import RangeNormalizer
 import os
 import pickle
 
@@ -28,9 +28,7 @@ def preprocess_goldstein_uchida(file_path, save_output=False, output_dir='prepro
     anomaly_indices = labels[labels == 'o'].index.tolist()
     
     # Normalize numerical features
-    scaler = StandardScaler()
-    data = pd.DataFrame(scaler.fit_transform(data), columns=data.columns)
-    normalized_data = range_based_normalize(data)
+    normalized_data = RangeNormalizer().fit_transform(data)
     
     original_to_preprocessed = dict(zip(data.index, normalized_data.index))
     
@@ -46,24 +44,3 @@ def preprocess_goldstein_uchida(file_path, save_output=False, output_dir='prepro
         print(f"Preprocessed data, anomaly indices, and original to preprocessed index mapping saved to {output_dir}")
     
     return normalized_data, anomaly_indices, original_to_preprocessed
-
-def range_based_normalize(data):
-    """
-    Normalize the data using range-based normalization.
-
-    Args:
-    data (pd.DataFrame): The input data to normalize.
-
-    Returns:
-    pd.DataFrame: The normalized data.
-    """
-    num_features = data.shape[1]
-    max_value = 1 / num_features
-    normalized_data = pd.DataFrame()
-
-    for column in data.columns:
-        min_val = data[column].min()
-        max_val = data[column].max()
-        normalized_data[column] = ((data[column] - min_val) / (max_val - min_val)) * max_value
-
-    return normalized_data
\ No newline at end of file
@@ -0,0 +1,190 @@
+import numpy as np
+import pandas as pd
+
+class RangeNormalizer:
+    """
+    Standardize, then range-normalize every column to [0, 1 / num_features].
+
+    This is the StandardScaler + range_based_normalize pipeline of the
+    preprocessing modules as a single fitted transform: the per-column
+    statistics are kept, so later data (e.g. a live stream) is normalized with
+    the parameters of the reference series instead of being refitted.
+    Constant columns are mapped to 0.
+    """
+
+    def __init__(self, standardize=True, dtype=np.float64, clip=False):
+        """
+        Args:
+        standardize (bool): Standardize the columns (zero mean, unit variance) before the range normalization.
+        dtype (np.dtype): Dtype of the transformed data, np.float32 halves the memory of large inputs.
+        clip (bool): Clip transformed values to [0, 1 / num_features] (for data outside the fitted range).
+        """
+        self.standardize = standardize
+        self.dtype = dtype
+        self.clip = clip
+        self.n_samples_seen_ = 0
+        self.mean_ = None
+        self.var_ = None
+        self.data_min_ = None
+        self.data_max_ = None
+        self.max_value_ = None
+
+    def partial_fit(self, data):
+        """
+        Update the column statistics with a chunk of rows.
+
+        Args:
+        data (np.ndarray or pd.DataFrame): Rows of shape (n, num_features).
+
+        Returns:
+        RangeNormalizer: self
+        """
+        values = np.asarray(data, dtype=np.float64)
+        count = len(values)
+        if count == 0:
+            return self
+        mean = values.mean(axis=0)
+        var = values.var(axis=0)
+
+        if self.n_samples_seen_ == 0:
+            self.max_value_ = 1 / values.shape[1]
+            self.mean_, self.var_ = mean, var
+            self.data_min_, self.data_max_ = values.min(axis=0), values.max(axis=0)
+        else:
+            # Combine the running and the chunk's mean/variance (Chan et al.)
+            total = self.n_samples_seen_ + count
+            delta = mean - self.mean_
+            self.var_ = (self.var_ * self.n_samples_seen_ + var * count + delta**2 * self.n_samples_seen_ * count / total) / total
+            self.mean_ = self.mean_ + delta * count / total
+            self.data_min_ = np.minimum(self.data_min_, values.min(axis=0))
+            self.data_max_ = np.maximum(self.data_max_, values.max(axis=0))
+        self.n_samples_seen_ += count
+        return self
+
+    def fit(self, data):
+        """
+        Args:
+        data (np.ndarray or pd.DataFrame): Rows of shape (T, num_features).
+
+        Returns:
+        RangeNormalizer: self
+        """
+        self.n_samples_seen_ = 0
+        return self.partial_fit(data)
+
+    @property
+    def scale_(self):
+        # Same convention as StandardScaler: zero variance keeps a scale of 1
+        scale = np.sqrt(self.var_)
+        return np.where(scale == 0, 1.0, scale)
+
+    def transform(self, data):
+        """
+        Normalize rows with the fitted parameters.
+
+        Args:
+        data (np.ndarray or pd.DataFrame): Rows of shape (n, num_features).
+
+        Returns:
+        np.ndarray or pd.DataFrame: Normalized rows (a DataFrame with the same index and columns for DataFrame input).
+        """
+        if self.mean_ is None:
+            raise ValueError("RangeNormalizer has to be fitted before transform")
+        values = np.asarray(data, dtype=self.dtype)
+        max_value = self.max_value_
+
+        data_min, data_max = self.data_min_, self.data_max_
+        offset = np.zeros_like(data_min)
+        scale = np.ones_like(data_min)
+        if self.standardize:
+            offset, scale = self.mean_, self.scale_
+        range_min = (data_min - offset) / scale
+        data_range = (data_max - offset) / scale - range_min
+
+        # x -> (((x - offset) / scale) - range_min) / range * max_value, folded into one multiply-add
+        constant = data_range == 0
+        factor = np.where(constant, 0.0, max_value / np.where(constant, 1.0, data_range) / scale)
+        shift = offset + range_min * scale
+        normalized = (values - shift.astype(self.dtype)) * factor.astype(self.dtype)
+        if self.clip:
+            np.clip(normalized, 0, max_value, out=normalized)
+
+        if isinstance(data, pd.DataFrame):
+            return pd.DataFrame(normalized, index=data.index, columns=data.columns, copy=False)
+        return normalized
+
+    def select(self, columns):
+        """
+        Restrict the fitted normalizer to a subset of its columns.
+
+        The columns keep the range [0, 1 / num_features] of the full fit, e.g. the
+        SKAB sensors picked by PCA after normalizing all pivoted sensors.
+
+        Args:
+        columns (array-like): Positions of the kept columns.
+
+        Returns:
+        RangeNormalizer: The restricted normalizer.
+        """
+        columns = np.asarray(columns)
+        params = self.get_params()
+        for name in ('mean', 'var', 'data_min', 'data_max'):
+            params[name] = params[name][columns]
+        return RangeNormalizer.from_params(params, self.dtype, self.clip)
+
+    def fit_transform(self, data):
+        """
+        Args:
+        data (np.ndarray or pd.DataFrame): Rows of shape (T, num_features).
+
+        Returns:
+        np.ndarray or pd.DataFrame: The normalized data.
+        """
+        return self.fit(data).transform(data)
+
+    def get_params(self):
+        """
+        Returns:
+        dict: The fitted parameters as arrays (e.g. to store next to a trained ensemble).
+        """
+        return {
+            'standardize': self.standardize,
+            'n_samples_seen': self.n_samples_seen_,
+            'mean': self.mean_,
+            'var': self.var_,
+            'data_min': self.data_min_,
+            'data_max': self.data_max_,
+            'max_value': self.max_value_,
+        }
+
+    @classmethod
+    def from_params(cls, params, dtype=np.float64, clip=False):
+        """
+        Args:
+        params (dict): Output of get_params.
+        dtype (np.dtype): Dtype of the transformed data.
+        clip (bool): Clip transformed values to [0, 1 / num_features].
+
+        Returns:
+        RangeNormalizer: The fitted normalizer.
+        """
+        normalizer = cls(standardize=bool(params['standardize']), dtype=dtype, clip=clip)
+        normalizer.n_samples_seen_ = int(params['n_samples_seen'])
+        normalizer.mean_ = np.asarray(params['mean'], dtype=np.float64)
+        normalizer.var_ = np.asarray(params['var'], dtype=np.float64)
+        normalizer.data_min_ = np.asarray(params['data_min'], dtype=np.float64)
+        normalizer.data_max_ = np.asarray(params['data_max'], dtype=np.float64)
+        normalizer.max_value_ = float(params['max_value'])
+        return normalizer
+
+def range_based_normalize(data):
+    """
+    Normalize the data using range-based normalization.
+
+    Args:
+    data (pd.DataFrame): The input data to normalize.
+
+    Returns:
+    pd.DataFrame: The normalized data, every column in [0, 1 / num_features] (constant columns are 0).
+    """
+    return RangeNormalizer(standardize=False).fit_transform(data)
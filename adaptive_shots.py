@@ -0,0 +1,150 @@
+import threading
+from collections import deque
+import numpy as np
+
+class RunningThreshold:
+    """
+    Running percentile of the window deviation scores |p - mean_b| / std_b.
+
+    This is the score the evaluation notebooks threshold at their anomaly
+    percentile, computed here per iteration instead of averaged over the
+    ensemble. Only the most recent max_scores scores are kept.
+    """
+
+    def __init__(self, percentile=90, max_scores=100000, min_scores=200):
+        """
+        Args:
+        percentile (float): Percentile of the scores used as decision threshold.
+        max_scores (int): Number of most recent scores the percentile is taken over.
+        min_scores (int): Scores needed before a threshold is reported.
+        """
+        self.percentile = percentile
+        self.min_scores = min_scores
+        self._scores = deque(maxlen=max_scores)
+        self._lock = threading.Lock()
+
+    def update(self, scores):
+        """
+        Args:
+        scores (np.ndarray): Deviation scores of a finished bucket.
+        """
+        with self._lock:
+            self._scores.extend(np.asarray(scores, dtype=float).tolist())
+
+    def value(self):
+        """
+        Returns:
+        float or None: The current threshold, None until min_scores scores were seen.
+        """
+        with self._lock:
+            if len(self._scores) < self.min_scores:
+                return None
+            return float(np.percentile(self._scores, self.percentile))
+
+def deviation_scores(proportions):
+    """
+    Deviation of each window from its bucket, as scored in the evaluation notebooks.
+
+    Args:
+    proportions (np.ndarray): proportion_zero of the windows of one bucket.
+
+    Returns:
+    np.ndarray: |p - mean| / std (std 0 is replaced by 1e-8).
+    """
+    std = np.std(proportions)
+    return np.abs(proportions - np.mean(proportions)) / (std if std > 0 else 1e-8)
+
+def confidence_half_width(counts, shots, z=1.96):
+    """
+    Half-width of the Agresti-Coull confidence interval of a binomial proportion.
+
+    Args:
+    counts (np.ndarray): Number of '0' outcomes.
+    shots (np.ndarray): Number of shots.
+    z (float): Normal quantile of the confidence level (1.96 for 95%).
+
+    Returns:
+    np.ndarray: Half-widths of the intervals.
+    """
+    adjusted_shots = shots + z**2
+    adjusted_p = (counts + z**2 / 2) / adjusted_shots
+    return z * np.sqrt(adjusted_p * (1 - adjusted_p) / adjusted_shots)
+
+class AdaptiveShotSampler:
+    """
+    Sequential shot allocation for the swap tests of a bucket.
+
+    All windows start with min_shots shots, then active windows get round_shots
+    more per round until their confidence interval on proportion_zero is narrower
+    than tolerance, their score interval lies clearly above or below the running
+    threshold, they reach max_shots, or the bucket's shot budget runs out.
+    """
+
+    def __init__(self, min_shots=256, max_shots=4096, round_shots=256, tolerance=0.02, shot_budget=None, percentile=90, z=1.96):
+        """
+        Args:
+        min_shots (int): Shots every window gets in the first round.
+        max_shots (int): Shot cap per window.
+        round_shots (int): Shots added to each active window per round.
+        tolerance (float): Target half-width of the confidence interval on proportion_zero.
+        shot_budget (int or None): Total shots per iteration (None for no budget).
+        percentile (float): Percentile of the running decision threshold.
+        z (float): Normal quantile of the confidence level.
+        """
+        self.min_shots = min_shots
+        self.max_shots = max_shots
+        self.round_shots = round_shots
+        self.tolerance = tolerance
+        self.shot_budget = shot_budget
+        self.z = z
+        self.threshold = RunningThreshold(percentile)
+
+    def sample(self, sample_counts, num_windows, budget=None):
+        """
+        Estimate proportion_zero for the windows of a bucket with adaptive shot counts.
+
+        Args:
+        sample_counts (callable): (window indices, shots) -> counts of '0' for those windows,
+            one batched job per call.
+        num_windows (int): Number of windows in the bucket.
+        budget (int or None): Shots available for this bucket (None for no budget).
+
+        Returns:
+        tuple: (proportions, shots_used), both np.ndarrays of shape (num_windows,).
+        """
+        counts = np.zeros(num_windows, dtype=np.int64)
+        shots_used = np.zeros(num_windows, dtype=np.int64)
+        remaining = budget
+        threshold = self.threshold.value()
+
+        active = np.arange(num_windows)
+        round_size = self.min_shots
+        while active.size:
+            round_size = min(round_size, self.max_shots - shots_used[active[0]])
+            if remaining is not None:
+                round_size = min(round_size, remaining // active.size)
+            if round_size <= 0:
+                if shots_used[active[0]] > 0:
+                    break
+                round_size = 1  # every window needs at least one shot, even over budget
+            counts[active] += np.asarray(sample_counts(active, round_size), dtype=np.int64)
+            shots_used[active] += round_size
+            if remaining is not None:
+                remaining -= round_size * active.size
+            round_size = self.round_shots
+
+            proportions = counts / shots_used
+            half_width = confidence_half_width(counts[active], shots_used[active], self.z)
+            done = (half_width <= self.tolerance) | (shots_used[active] >= self.max_shots)
+            if threshold is not None:
+                # The window is decided if its whole score interval lies on one side of the threshold
+                std = np.std(proportions)
+                std = std if std > 0 else 1e-8
+                scores = np.abs(proportions[active] - np.mean(proportions)) / std
+                score_half_width = half_width / std
+                done |= (scores - score_half_width > threshold) | (scores + score_half_width < threshold)
+            active = active[~done]
+
+        proportions = counts / shots_used
+        self.threshold.update(deviation_scores(proportions))
+        return proportions, shots_used
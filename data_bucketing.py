@@ -1,5 +1,7 @@
 import numpy as np
-from typing import List, Tuple
+from typing import List, Optional, Tuple
+
+NUM_ANOMALIES = 49 #########todo
 
 def estimate_bucket_size(p_anomaly: float, target_probability: float, tolerance: float = 1e-6, max_iterations: int = 1000) -> int:
     """
@@ -30,7 +32,7 @@ def estimate_bucket_size(p_anomaly: float, target_probability: float, tolerance:
     
     raise ValueError(f"Failed to converge after {max_iterations} iterations")
 
-def create_data_buckets(num_datapoints: int, num_anomalies: int, target_probability: float = 0.5) -> List[List[int]]:
+def create_data_buckets(num_datapoints: int, num_anomalies: int, target_probability: float = 0.5, rng: Optional[np.random.Generator] = None) -> List[List[int]]:
     """
     Create buckets of random indices for the dataset.
     
@@ -38,6 +40,7 @@ def create_data_buckets(num_datapoints: int, num_anomalies: int, target_probabil
     num_datapoints (int): Total number of datapoints in the dataset
     num_anomalies (int): Total number of anomalies in the dataset
     target_probability (float): Desired probability of having at least one anomaly in a bucket
+    rng (np.random.Generator, optional): Generator of the shuffle, the global numpy RNG if None
     
     Returns:
     List[List[int]]: List of buckets, where each bucket is a list of indices
@@ -46,13 +49,16 @@ def create_data_buckets(num_datapoints: int, num_anomalies: int, target_probabil
     bucket_size = estimate_bucket_size(p_anomaly, target_probability)
     
     all_indices = list(range(num_datapoints))
-    np.random.shuffle(all_indices)
+    if rng is None:
+        np.random.shuffle(all_indices)
+    else:
+        rng.shuffle(all_indices)
     
     buckets = [all_indices[i:i+bucket_size] for i in range(0, num_datapoints, bucket_size)]
     
     return buckets
 
-def perform_bucketing(preprocessed_data: np.ndarray, target_probability: float = 0.5) -> Tuple[List[List[int]], int]:
+def perform_bucketing(preprocessed_data: np.ndarray, target_probability: float = 0.5, rng: Optional[np.random.Generator] = None, num_anomalies: Optional[int] = None) -> Tuple[List[List[int]], int]:
     """
     Perform the bucketing process on the preprocessed data.
     
@@ -60,14 +66,17 @@ def perform_bucketing(preprocessed_data: np.ndarray, target_probability: float =
     preprocessed_data (np.ndarray): The preprocessed dataset
     high_risk_indices (List[int]): List of indices of high-risk (anomalous) datapoints
     target_probability (float): Desired probability of having at least one anomaly in a bucket
+    rng (np.random.Generator, optional): Generator of the shuffle, a seeded generator reproduces the buckets
+    num_anomalies (int, optional): Number of anomalous datapoints of the dataset, NUM_ANOMALIES if None
     
     Returns:
     Tuple[List[List[int]], int]: A tuple containing the list of buckets and the bucket size
     """
     num_datapoints = len(preprocessed_data)
-    num_anomalies = 49 #########todo
+    if num_anomalies is None:
+        num_anomalies = NUM_ANOMALIES
     
-    buckets = create_data_buckets(num_datapoints, num_anomalies, target_probability)
+    buckets = create_data_buckets(num_datapoints, num_anomalies, target_probability, rng)
     bucket_size = len(buckets[0])  # all buckets except possibly the last one will have this size
     
     print(f"Created {len(buckets)} buckets with a target size of {bucket_size} datapoints each.")
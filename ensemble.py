@@ -0,0 +1,375 @@
+import numpy as np
+from Embedding.range_amplitude_enc import prepare_for_embedding
+from exact_swap_test import swap_test_probability
+from feature_selection_MTS import select_feature_indices
+from numpy_simulator import build_channel
+from Preprocessing.normalization import RangeNormalizer
+
+ENSEMBLE_VERSION = 1
+
+# Unbound ansatz circuits, shared by all members with the same compression level. The circuit
+# modules (and qiskit) are only imported once circuits are built, a saved ensemble loads without them.
+_ansatz_cache = None
+
+def get_ansatz(ansatz_choice, num_qubits, compression_level, decoder_option):
+    """
+    Returns:
+    tuple: (parameterized ansatz, encoder ParameterVector, decoder ParameterVector or None).
+    """
+    global _ansatz_cache
+    from Ansatzes.ansatz_selection import create_ansatz_circuit
+    from template_cache import TemplateCache, find_parameter_vector
+
+    if _ansatz_cache is None:
+        _ansatz_cache = TemplateCache()
+    ansatz = _ansatz_cache.get(
+        ("ansatz", ansatz_choice, num_qubits, compression_level, decoder_option),
+        lambda: create_ansatz_circuit(ansatz_choice, num_qubits, compression_level, decoder_option)[0]
+    )
+    return ansatz, find_parameter_vector(ansatz, 'θ_enc'), find_parameter_vector(ansatz, 'θ_dec')
+
+def compression_level_for_member(member, num_members, num_qubits):
+    """
+    Compression level of an ensemble member, with the blocked schedule of process_iteration.
+
+    Args:
+    member (int): Index of the member (iteration).
+    num_members (int): Number of members (iterations).
+    num_qubits (int): Number of qubits for a single amplitude encoding instance.
+
+    Returns:
+    int: Compression level between 1 and num_qubits - 1.
+    """
+    compression_levels = num_qubits - 1
+    members_per_level = max(num_members // compression_levels, 1)
+    return min(member // members_per_level + 1, compression_levels)
+
+def num_member_angles(num_qubits, compression_level, decoder_option, ansatz_choice):
+    """
+    Returns:
+    int: Number of ansatz angles of a member (encoder, and decoder for option 2).
+    """
+    _, encoder_params, decoder_params = get_ansatz(ansatz_choice, num_qubits, compression_level, decoder_option)
+    if decoder_option == 1:
+        return len(encoder_params)
+    return len(encoder_params) + len(decoder_params)
+
+def draw_member_angles(num_qubits, compression_level, decoder_option, ansatz_choice):
+    """
+    Draw the random ansatz angles of one member, as process_iteration does per bucket run.
+
+    Returns:
+    np.ndarray: Angles for the encoder (and decoder for option 2).
+    """
+    return np.random.uniform(0, 2*np.pi, num_member_angles(num_qubits, compression_level, decoder_option, ansatz_choice))
+
+def build_member_channel(num_qubits, compression_level, decoder_option, ansatz_choice, angles):
+    """
+    Kraus operators of one member's bound encoder->reset->decoder circuit.
+
+    Returns:
+    np.ndarray: Kraus operators of shape (m, 2**num_qubits, 2**num_qubits).
+    """
+    from Ansatzes.ansatz_selection import update_ansatz_parameters
+
+    ansatz, encoder_params, decoder_params = get_ansatz(ansatz_choice, num_qubits, compression_level, decoder_option)
+    bound_ansatz = update_ansatz_parameters(ansatz_choice, ansatz, encoder_params, decoder_params, angles)
+    return build_channel(bound_ansatz, num_qubits)
+
+class Ensemble:
+    """
+    A fixed set of quantum autoencoder members (compression level, selected
+    window features, ansatz angles) that scores windows without bucketing.
+
+    Every member is reduced to its Kraus operators, padded with zero operators
+    to a common count, so the swap test probabilities of all members and a
+    batch of windows come out of one batched matrix product. The amplitude
+    encoded states are real, so <psi|K|psi> splits into real products with
+    Re(K) and Im(K). Anomaly scores compare each member's probability with its
+    mean/std on reference windows, the streaming counterpart of the per-bucket
+    deviation of the evaluation notebooks.
+    """
+
+    def __init__(self, num_qubits, decoder_option, ansatz_choice, window_size, compression_levels, features, angles, stride=None, real_kraus=None):
+        """
+        Args:
+        num_qubits (int): Number of qubits for a single amplitude encoding instance.
+        decoder_option (int): Option for decoder circuit (1 or 2).
+        ansatz_choice (int): The ansatz to use (1-5).
+        window_size (int): Number of time steps per window.
+        compression_levels (array-like): Compression level of every member, shape (M,).
+        features (array-like): Selected flattened window features of every member, shape (M, 2**num_qubits - 1).
+        angles (list): Ansatz angles of every member (lengths differ between compression levels).
+        stride (int or None): Step between window starts of the data the ensemble scores.
+        real_kraus (np.ndarray or None): Stacked real and imaginary Kraus operators of the members, shape
+            (M, 2 * m * D, D), as stored by save. Built from the members' circuits if None.
+        """
+        self.num_qubits = num_qubits
+        self.decoder_option = decoder_option
+        self.ansatz_choice = ansatz_choice
+        self.window_size = window_size
+        self.stride = stride
+        self.compression_levels = np.asarray(compression_levels, dtype=np.int64)
+        self.features = np.asarray(features, dtype=np.int64)
+        self.angles = [np.asarray(member_angles, dtype=float) for member_angles in angles]
+        self.reference_mean = None
+        self.reference_std = None
+        if real_kraus is not None:
+            self._real_kraus = np.asarray(real_kraus, dtype=np.float64)
+        else:
+            self._real_kraus = self._build_real_kraus()
+
+    def _build_real_kraus(self):
+        """
+        Returns:
+        np.ndarray: Stacked real and imaginary Kraus operators of every member's circuit, shape (M, 2 * m * D, D).
+        """
+        num_qubits = self.num_qubits
+        channels = [
+            build_member_channel(num_qubits, level, self.decoder_option, self.ansatz_choice, member_angles)
+            for level, member_angles in zip(self.compression_levels, self.angles)
+        ]
+        dim = 2**num_qubits
+        num_ops = max(len(kraus) for kraus in channels)
+        # (M, 2 * m * D, D): the real parts of all operators of a member, then the imaginary parts,
+        # filled member by member so no complex (M, m, D, D) copy is held next to it
+        real_kraus = np.zeros((len(channels), 2 * num_ops * dim, dim))
+        for member, kraus in enumerate(channels):
+            kraus = np.asarray(kraus).reshape(-1, dim)
+            real_kraus[member, :len(kraus)] = kraus.real
+            real_kraus[member, num_ops * dim:num_ops * dim + len(kraus)] = kraus.imag
+        return real_kraus
+
+    @classmethod
+    def draw(cls, num_members, num_qubits, decoder_option, ansatz_choice, window_size, seed=None, stride=None, num_sensors=5):
+        """
+        Draw an ensemble up front, one member per iteration of a batch run.
+
+        Args:
+        num_members (int): Number of members.
+        num_qubits (int): Number of qubits for a single amplitude encoding instance.
+        decoder_option (int): Option for decoder circuit (1 or 2).
+        ansatz_choice (int): The ansatz to use (1-5).
+        window_size (int): Number of time steps per window.
+        seed (int or None): Seed of the global NumPy random state used for the draws.
+        stride (int or None): Step between window starts.
+        num_sensors (int): Number of sensors per window.
+
+        Returns:
+        Ensemble: The ensemble (not yet calibrated).
+        """
+        if seed is not None:
+            np.random.seed(seed)
+        compression_levels, features, angles = [], [], []
+        for member in range(num_members):
+            level = compression_level_for_member(member, num_members, num_qubits)
+            compression_levels.append(level)
+            features.append(select_feature_indices(num_qubits, window_size, strategy='b', num_sensors=num_sensors))
+            angles.append(draw_member_angles(num_qubits, level, decoder_option, ansatz_choice))
+        return cls(num_qubits, decoder_option, ansatz_choice, window_size, compression_levels, features, angles, stride)
+
+    @classmethod
+    def from_results(cls, all_results, num_qubits, decoder_option, ansatz_choice, window_size, get_windows, stride=None):
+        """
+        Freeze the members of a batch run, one per iteration, bucket and bucket run.
+
+        Each member is calibrated on the windows of the bucket it was drawn for,
+        with exact probabilities, so its mean/std are the bucket statistics the
+        evaluation notebooks score against.
+
+        Args:
+        all_results (iterable): Iteration results of process_iteration (with 'angles' in the bucket results),
+            e.g. results_file.iter_results, only the member definitions are kept.
+        num_qubits (int): Number of qubits for a single amplitude encoding instance.
+        decoder_option (int): Option for decoder circuit (1 or 2).
+        ansatz_choice (int): The ansatz to use (1-5).
+        window_size (int): Number of time steps per window.
+        get_windows (callable): Window indices -> flattened windows of shape (len(indices), f * window_size).
+        stride (int or None): Step between window starts.
+
+        Returns:
+        Ensemble: The calibrated ensemble.
+        """
+        members = []
+        for result in all_results:
+            for bucket_result in result['bucket_results']:
+                for run_angles in bucket_result['angles']:
+                    members.append((result['iteration'], result['compression_level'], result['selected_features'],
+                                    run_angles, result['buckets'][bucket_result['bucket_idx']]))
+        # Results are written in completion order, the members are ordered by iteration
+        members.sort(key=lambda member: member[0])
+        _, compression_levels, features, angles, member_buckets = (list(column) for column in zip(*members))
+
+        ensemble = cls(num_qubits, decoder_option, ansatz_choice, window_size, compression_levels, features, angles, stride)
+        ensemble.reference_mean = np.empty(len(ensemble))
+        ensemble.reference_std = np.empty(len(ensemble))
+        for member, bucket in enumerate(member_buckets):
+            probabilities = ensemble.member_probabilities(member, get_windows(bucket))
+            ensemble.reference_mean[member] = probabilities.mean()
+            std = probabilities.std()
+            ensemble.reference_std[member] = std if std > 0 else 1e-8
+        return ensemble
+
+    def __len__(self):
+        return len(self.compression_levels)
+
+    def member_probabilities(self, member, windows):
+        """
+        Ideal swap test proportion_zero of a single member.
+
+        Args:
+        member (int): Index of the member.
+        windows (np.ndarray): Flattened windows of shape (N, f * window_size).
+
+        Returns:
+        np.ndarray: Probabilities of shape (N,).
+        """
+        states = prepare_for_embedding(np.asarray(windows, dtype=np.float64)[:, self.features[member]])
+        overlaps = (states @ self._real_kraus[member].T).reshape(len(states), -1, states.shape[1])
+        fidelities = np.sum(np.sum(overlaps * states[:, np.newaxis], axis=2)**2, axis=1)
+        return swap_test_probability(fidelities)
+
+    def probabilities(self, windows, max_block=2**22):
+        """
+        Ideal swap test proportion_zero of every member for a batch of windows.
+
+        Members and windows are contracted in blocks, so the intermediate
+        operator-state products stay below max_block elements however large
+        the ensemble (e.g. the ~15k members of an exported 1000-iteration run).
+
+        Args:
+        windows (np.ndarray): Flattened windows of shape (N, f * window_size) or a single window.
+        max_block (int): Largest number of elements of an intermediate array.
+
+        Returns:
+        np.ndarray: Probabilities of shape (N, M) (or (M,) for a single window).
+        """
+        windows = np.asarray(windows, dtype=np.float64)
+        single = windows.ndim == 1
+        windows = np.atleast_2d(windows)
+
+        num_members, num_rows, dim = self._real_kraus.shape
+        num_windows = len(windows)
+        window_block = max(1, min(num_windows, max_block // num_rows))
+        member_block = max(1, max_block // (num_rows * window_block))
+        fidelities = np.empty((num_windows, num_members))
+        for window_start in range(0, num_windows, window_block):
+            block_windows = windows[window_start:window_start + window_block]
+            for member_start in range(0, num_members, member_block):
+                members = slice(member_start, member_start + member_block)
+                states = prepare_for_embedding(block_windows[:, self.features[members]])  # (n, m, D)
+                states = np.ascontiguousarray(states.transpose(1, 2, 0))  # (m, D, n)
+                transformed = np.matmul(self._real_kraus[members], states).reshape(len(states), -1, dim, states.shape[2])
+                overlaps = np.einsum('mkdn,mdn->mkn', transformed, states)  # (m, 2 * ops, n): real and imaginary parts
+                fidelities[window_start:window_start + len(block_windows), members] = np.sum(overlaps**2, axis=1).T
+        probabilities = swap_test_probability(fidelities)
+        return probabilities[0] if single else probabilities
+
+    def calibrate(self, reference_windows, batch_size=1024):
+        """
+        Fit every member's mean and std of proportion_zero on reference windows.
+
+        Args:
+        reference_windows (np.ndarray): Flattened windows of shape (N, f * window_size).
+        batch_size (int): Windows per contraction.
+
+        Returns:
+        Ensemble: self
+        """
+        probabilities = np.concatenate([
+            self.probabilities(reference_windows[start:start + batch_size])
+            for start in range(0, len(reference_windows), batch_size)
+        ])
+        self.reference_mean = probabilities.mean(axis=0)
+        std = probabilities.std(axis=0)
+        self.reference_std = np.where(std > 0, std, 1e-8)
+        return self
+
+    def score(self, windows):
+        """
+        Ensemble anomaly score: mean over members of |p - mean_m| / std_m.
+
+        Args:
+        windows (np.ndarray): Flattened windows of shape (N, f * window_size) or a single window.
+
+        Returns:
+        np.ndarray or float: Scores of shape (N,) (or a float for a single window).
+        """
+        if self.reference_mean is None:
+            raise ValueError("Ensemble has to be calibrated before scoring")
+        deviations = np.abs(self.probabilities(windows) - self.reference_mean) / self.reference_std
+        return deviations.mean(axis=-1)
+
+    def save(self, path, normalizer=None, sensors=None):
+        """
+        Save the calibrated ensemble (and the normalizer of its input) as a versioned .npz file.
+
+        The members' Kraus operators are stored next to their definitions, so loading needs no circuits.
+
+        Args:
+        path (str): Output path.
+        normalizer (RangeNormalizer or None): Normalizer fitted on the raw series.
+        sensors (list or None): Names of the scored sensors, in window order.
+
+        Returns:
+        None
+        """
+        num_angles = np.array([len(member_angles) for member_angles in self.angles])
+        angles = np.zeros((len(self), num_angles.max()))
+        for member, member_angles in enumerate(self.angles):
+            angles[member, :len(member_angles)] = member_angles
+
+        arrays = {
+            'version': np.array(ENSEMBLE_VERSION),
+            # stride -1 stands for None
+            'config': np.array([self.num_qubits, self.decoder_option, self.ansatz_choice, self.window_size,
+                                -1 if self.stride is None else self.stride]),
+            'compression_levels': self.compression_levels,
+            'features': self.features,
+            'angles': angles,
+            'num_angles': num_angles,
+            'reference_mean': self.reference_mean,
+            'reference_std': self.reference_std,
+            'real_kraus': self._real_kraus,
+        }
+        if normalizer is not None:
+            arrays.update({f'normalizer_{name}': np.asarray(value) for name, value in normalizer.get_params().items()})
+        if sensors is not None:
+            arrays['sensors'] = np.array([str(sensor) for sensor in sensors])
+        # np.savez appends .npz to paths without it, write to an open file to keep the name
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load an ensemble saved with Ensemble.save.
+
+        Args:
+        path (str): Path of the .npz file.
+
+        Returns:
+        Ensemble: The calibrated ensemble.
+        RangeNormalizer or None: The stored normalizer.
+        list or None: Names of the scored sensors.
+        """
+        with np.load(path, allow_pickle=False) as data:
+            version = int(data['version'])
+            if version != ENSEMBLE_VERSION:
+                raise ValueError(f"Unsupported ensemble version {version} (expected {ENSEMBLE_VERSION})")
+            num_qubits, decoder_option, ansatz_choice, window_size, stride = (int(value) for value in data['config'])
+            angles = [member_angles[:count] for member_angles, count in zip(data['angles'], data['num_angles'])]
+            # files without the Kraus operators rebuild them from the member circuits (needs qiskit)
+            real_kraus = data['real_kraus'] if 'real_kraus' in data.files else None
+            ensemble = cls(num_qubits, decoder_option, ansatz_choice, window_size,
+                           data['compression_levels'], data['features'], angles, None if stride < 0 else stride, real_kraus)
+            ensemble.reference_mean = data['reference_mean']
+            ensemble.reference_std = data['reference_std']
+
+            normalizer = None
+            if 'normalizer_mean' in data.files:
+                normalizer = RangeNormalizer.from_params({
+                    name[len('normalizer_'):]: data[name] for name in data.files if name.startswith('normalizer_')
+                })
+            sensors = data['sensors'].tolist() if 'sensors' in data.files else None
+        return ensemble, normalizer, sensors
@@ -0,0 +1,641 @@
+import argparse
+import glob
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import pandas as pd
+from sklearn.metrics import roc_auc_score
+from results_file import ColumnarResults, iter_results
+
+# Ground truth anomaly intervals [start, end) in samples of the evaluated series (also used by read.ipynb and read_SMD.ipynb)
+ANOMALIES = {
+    # 18:39:22 - 18:42:32, in seconds from 18:30:00
+    'SKAB': [(562, 752)],
+    'SMD': [
+        (16964, 17515),
+        (18072, 18528),
+        (19368, 20088),
+        (20787, 21195),
+        (24680, 24682),
+        (26115, 26116),
+        (27555, 27556),
+    ],
+    'SMD2': [
+        (4630, 4688),
+        (5487, 5491),
+        (5876, 5951),
+        (15416, 15418),
+        (15541, 15605),
+        (15926, 15973),
+        (18646, 18801),
+        (20236, 20271),
+        (22265, 22336),
+        (23094, 23115),
+    ],
+}
+
+# (window_size, stride) of the datasets in main_copy_parallel.py
+WINDOW_PARAMS = {'SKAB': (20, 5), 'SMD': (100, 50), 'SMD2': (100, 50)}
+
+def flatten_results(results):
+    """
+    Flatten iteration results into one entry per measured window.
+
+    Args:
+    results (iterable): Iteration results of process_iteration (e.g. results_file.iter_results).
+
+    Returns:
+    np.ndarray: Window index of every measurement.
+    np.ndarray: Bucket of every measurement, unique across iterations.
+    np.ndarray: proportion_zero of every measurement.
+    int: Number of iterations.
+    """
+    windows, buckets, proportions = [], [], []
+    bucket_id = 0
+    num_iterations = 0
+    for result in results:
+        num_iterations += 1
+        for bucket_result in result['bucket_results']:
+            bucket = np.asarray(result['buckets'][bucket_result['bucket_idx']])
+            final_results = np.asarray(bucket_result['final_results'], dtype=np.float64)
+            # final_results are run-major, every bucket run measures every window of the bucket
+            windows.append(np.tile(bucket, len(final_results) // len(bucket)))
+            buckets.append(np.full(len(final_results), bucket_id))
+            proportions.append(final_results)
+            bucket_id += 1
+    return np.concatenate(windows), np.concatenate(buckets), np.concatenate(proportions), num_iterations
+
+def flatten_columnar(results):
+    """
+    flatten_results for columnar results, straight from the score matrix.
+
+    Args:
+    results (ColumnarResults): Columnar results of a run.
+
+    Returns:
+    tuple: As flatten_results.
+    """
+    iterations = sorted(results.completed)
+    scores = np.asarray(results.scores[iterations], dtype=np.float64)  # (iterations, runs, windows)
+    num_windows = scores.shape[2]
+
+    bucket_labels = np.empty((len(iterations), num_windows), dtype=np.int64)
+    for row, iteration in enumerate(iterations):
+        for bucket_idx, bucket in enumerate(results.buckets(iteration)):
+            bucket_labels[row, bucket] = bucket_idx
+    bucket_labels += np.arange(len(iterations))[:, np.newaxis] * results.metadata['num_buckets']
+
+    windows = np.broadcast_to(np.arange(num_windows), scores.shape)
+    buckets = np.broadcast_to(bucket_labels[:, np.newaxis, :], scores.shape)
+    return windows.ravel(), buckets.ravel(), scores.ravel(), len(iterations)
+
+def bucket_deviations(bucket_ids, proportions):
+    """
+    |p - mean_b| / std_b of every measurement, with the mean and std of its bucket b (a std of 0 is replaced by 1e-8).
+
+    Args:
+    bucket_ids (np.ndarray): Bucket of every measurement.
+    proportions (np.ndarray): proportion_zero of every measurement.
+
+    Returns:
+    np.ndarray: Deviation of every measurement.
+    """
+    bucket_counts = np.maximum(np.bincount(bucket_ids), 1)
+    bucket_mean = np.bincount(bucket_ids, weights=proportions) / bucket_counts
+    residuals = proportions - bucket_mean[bucket_ids]
+    bucket_std = np.sqrt(np.bincount(bucket_ids, weights=residuals**2) / bucket_counts)
+    bucket_std[bucket_std == 0] = 1e-8
+    return np.abs(residuals) / bucket_std[bucket_ids]
+
+def window_scores(window_indices, bucket_ids, proportions, num_windows=None):
+    """
+    Ensemble anomaly score of every window.
+
+    The score is the mean over the window's measurements of |p - mean_b| / std_b,
+    with the mean and std of the bucket b the measurement belongs to (a std of 0
+    is replaced by 1e-8), as computed by the evaluation notebooks.
+
+    Args:
+    window_indices (np.ndarray): Window index of every measurement.
+    bucket_ids (np.ndarray): Bucket of every measurement.
+    proportions (np.ndarray): proportion_zero of every measurement.
+    num_windows (int or None): Number of windows (defaults to the largest index + 1).
+
+    Returns:
+    np.ndarray: Scores of shape (num_windows,), 0 for windows without measurements.
+    np.ndarray: Number of measurements of every window.
+    """
+    deviations = bucket_deviations(bucket_ids, proportions)
+    if num_windows is None:
+        num_windows = int(window_indices.max()) + 1
+    counts = np.bincount(window_indices, minlength=num_windows)
+    sums = np.bincount(window_indices, weights=deviations, minlength=num_windows)
+    scores = np.divide(sums, counts, out=np.zeros(num_windows), where=counts > 0)
+    return scores, counts
+
+def load_window_scores(path):
+    """
+    Window scores of a run.
+
+    Args:
+    path (str): Columnar results directory, .rec results file or legacy .pkl.
+
+    Returns:
+    np.ndarray: Scores of shape (num_windows,).
+    np.ndarray: Number of measurements of every window.
+    int: Number of iterations.
+    """
+    if os.path.isdir(path):
+        results = ColumnarResults(path)
+        *flat, num_iterations = flatten_columnar(results)
+        num_windows = results.metadata['num_windows']
+    else:
+        *flat, num_iterations = flatten_results(iter_results(path))
+        num_windows = None
+    scores, counts = window_scores(*flat, num_windows=num_windows)
+    return scores, counts, num_iterations
+
+class OnlineAggregator:
+    """
+    Window scores of a running ensemble, updated as each iteration completes.
+
+    Keeps the per-window sums of deviations and measurement counts, so the
+    scores (and the metrics against a ground truth) after any number of
+    iterations equal those of window_scores over the completed iterations.
+    """
+
+    def __init__(self, num_windows, labels=None, percentile=None):
+        """
+        Args:
+        num_windows (int): Number of windows.
+        labels (np.ndarray or None): Boolean ground truth of the windows, None to only report the threshold.
+        percentile (float or None): Threshold percentile, None for 100 - the share of anomalous windows.
+        """
+        self.sums = np.zeros(num_windows)
+        self.counts = np.zeros(num_windows, dtype=np.int64)
+        self.labels = labels
+        self.percentile = percentile
+        self.num_iterations = 0
+
+    def update(self, result):
+        """
+        Args:
+        result (dict): Result of process_iteration.
+
+        Returns:
+        None
+        """
+        window_indices, bucket_ids, proportions, _ = flatten_results([result])
+        deviations = bucket_deviations(bucket_ids, proportions)
+        self.sums += np.bincount(window_indices, weights=deviations, minlength=len(self.sums))
+        self.counts += np.bincount(window_indices, minlength=len(self.counts))
+        self.num_iterations += 1
+
+    def load(self, path):
+        """
+        Start from the iterations of an existing run (e.g. when resuming).
+
+        Args:
+        path (str): Columnar results directory or .rec results file.
+
+        Returns:
+        OnlineAggregator: self
+        """
+        scores, counts, num_iterations = load_window_scores(path)
+        self.sums[:len(scores)] += scores * counts
+        self.counts[:len(counts)] += counts
+        self.num_iterations += num_iterations
+        return self
+
+    def scores(self):
+        """
+        Returns:
+        np.ndarray: Current window scores, 0 for windows without measurements.
+        """
+        return np.divide(self.sums, self.counts, out=np.zeros(len(self.sums)), where=self.counts > 0)
+
+    def metrics(self):
+        """
+        Returns:
+        dict: compute_metrics of the current scores, only the threshold and the flagged windows without labels.
+        """
+        scores = self.scores()
+        scored = self.counts > 0
+        if self.labels is not None:
+            return compute_metrics(scores, self.labels, self.percentile, scored)
+        percentile = 90 if self.percentile is None else self.percentile
+        threshold = np.percentile(scores[scored], percentile)
+        return {'percentile': float(percentile), 'threshold': float(threshold), 'flagged': int(np.count_nonzero(scores >= threshold))}
+
+    def report(self):
+        """
+        Returns:
+        str: One line with the current metrics.
+        """
+        metrics = self.metrics()
+        line = f"Live metrics after {self.num_iterations} iterations: threshold {metrics['threshold']:.4f} ({metrics['percentile']:.1f}th percentile)"
+        if 'roc_auc' in metrics:
+            line += (f", ROC AUC {metrics['roc_auc']:.3f}, F1 {metrics['f1']:.3f}, "
+                     f"precision {metrics['precision']:.3f}, recall {metrics['recall']:.3f}")
+        else:
+            line += f", {metrics['flagged']} windows flagged"
+        return line
+
+def top_k_jaccard(scores_a, scores_b, k):
+    """
+    Returns:
+    float: Jaccard index of the k highest scoring windows of two score vectors.
+    """
+    top_a = set(np.argpartition(-scores_a, k - 1)[:k].tolist())
+    top_b = set(np.argpartition(-scores_b, k - 1)[:k].tolist())
+    return len(top_a & top_b) / len(top_a | top_b)
+
+def spearman(scores_a, scores_b):
+    """
+    Returns:
+    float: Spearman rank correlation of two score vectors (average ranks for ties).
+    """
+    ranks_a = pd.Series(scores_a).rank().to_numpy()
+    ranks_b = pd.Series(scores_b).rank().to_numpy()
+    if ranks_a.std() == 0 or ranks_b.std() == 0:
+        return float('nan')
+    return float(np.corrcoef(ranks_a, ranks_b)[0, 1])
+
+class ConvergenceMonitor:
+    """
+    Stopping rule for an OnlineAggregator: the window ranking has converged
+    once the top-k windows or the rank correlation between consecutive
+    checkpoints stay within their tolerance for `patience` checkpoints in a row.
+    A single window swapped in or out of a small top-k set already costs a lot
+    of Jaccard index, hence the separate tolerances.
+
+    A checkpoint is only taken when every compression level has contributed
+    the same number of iterations, so the ensemble is never cut off with
+    some levels over-represented.
+    """
+
+    def __init__(self, aggregator, num_levels, check_every=10, top_k=None, tolerance=0.005, jaccard_tolerance=0.1, patience=3):
+        """
+        Args:
+        aggregator (OnlineAggregator): Running window scores.
+        num_levels (int): Number of compression levels (num_qubits - 1).
+        check_every (int): Minimum number of iterations between checkpoints.
+        top_k (int or None): Number of top windows compared, None for 10% of the windows.
+        tolerance (float): Largest accepted 1 - Spearman correlation of a stable checkpoint.
+        jaccard_tolerance (float): Largest accepted 1 - top-k Jaccard index of a stable checkpoint.
+        patience (int): Consecutive stable checkpoints needed to stop.
+        """
+        self.aggregator = aggregator
+        self.level_counts = np.zeros(num_levels, dtype=np.int64)
+        self.check_every = check_every
+        num_windows = len(aggregator.sums)
+        self.top_k = min(top_k or max(1, round(num_windows / 10)), num_windows)
+        self.tolerance = tolerance
+        self.jaccard_tolerance = jaccard_tolerance
+        self.patience = patience
+        self.previous = None
+        self.last_checkpoint = 0
+        self.stable = 0
+        self.trace = []
+        self.stopping_iteration = None
+
+    def add_levels(self, levels):
+        """
+        Count iterations that are already in the aggregator (e.g. of a resumed run).
+
+        Args:
+        levels (iterable): Compression level of every iteration.
+
+        Returns:
+        None
+        """
+        for level in levels:
+            self.level_counts[level - 1] += 1
+
+    def update(self, compression_level):
+        """
+        Count a completed iteration (after it was added to the aggregator) and take a checkpoint if due.
+
+        Args:
+        compression_level (int): Compression level of the iteration.
+
+        Returns:
+        bool: True once the ranking has converged.
+        """
+        self.level_counts[compression_level - 1] += 1
+        num_iterations = self.aggregator.num_iterations
+        if self.stopping_iteration is not None:
+            return True
+        if num_iterations - self.last_checkpoint < self.check_every or self.level_counts.min() != self.level_counts.max():
+            return False
+
+        scores = self.aggregator.scores()
+        self.last_checkpoint = num_iterations
+        if self.previous is not None:
+            jaccard = top_k_jaccard(scores, self.previous, self.top_k)
+            rank_correlation = spearman(scores, self.previous)
+            stable = 1 - jaccard <= self.jaccard_tolerance or 1 - rank_correlation <= self.tolerance
+            self.stable = self.stable + 1 if stable else 0
+            self.trace.append({'iterations': num_iterations, 'jaccard': jaccard, 'spearman': rank_correlation, 'stable': bool(stable)})
+            if self.stable >= self.patience:
+                self.stopping_iteration = num_iterations
+        self.previous = scores
+        return self.stopping_iteration is not None
+
+    def summary(self):
+        """
+        Returns:
+        dict: Parameters, stopping iteration (None if it did not converge) and the checkpoint trace, JSON serializable.
+        """
+        return {
+            'check_every': self.check_every,
+            'top_k': self.top_k,
+            'tolerance': self.tolerance,
+            'jaccard_tolerance': self.jaccard_tolerance,
+            'patience': self.patience,
+            'stopping_iteration': self.stopping_iteration,
+            'trace': self.trace,
+        }
+
+def window_labels(num_windows, window_size, stride, anomalies):
+    """
+    Ground truth of every window: anomalous if it overlaps an anomaly interval.
+
+    Args:
+    num_windows (int): Number of windows.
+    window_size (int): Number of time steps per window.
+    stride (int): Step between window starts.
+    anomalies (list): (start, end) anomaly intervals in time steps.
+
+    Returns:
+    np.ndarray: Boolean labels of shape (num_windows,).
+    """
+    starts = np.arange(num_windows) * stride
+    ends = starts + window_size
+    intervals = np.asarray(anomalies, dtype=np.int64).reshape(-1, 2)
+    overlap = np.minimum(ends[:, np.newaxis], intervals[:, 1]) > np.maximum(starts[:, np.newaxis], intervals[:, 0])
+    return overlap.any(axis=1)
+
+def compute_metrics(scores, labels, percentile=None, scored=None):
+    """
+    Flag windows above a percentile threshold and compute the detection metrics.
+
+    Args:
+    scores (np.ndarray): Window scores.
+    labels (np.ndarray): Boolean ground truth of the windows.
+    percentile (float or None): Threshold percentile, None for 100 - the share of anomalous windows.
+    scored (np.ndarray or None): Mask of the windows with measurements, the threshold only uses these.
+
+    Returns:
+    dict: threshold, confusion counts, precision, recall, f1, accuracy, balanced_accuracy and roc_auc (fractions).
+    """
+    labels = np.asarray(labels, dtype=bool)
+    if scored is None:
+        scored = np.ones(len(scores), dtype=bool)
+    if percentile is None:
+        percentile = 100 - labels.mean() * 100
+    threshold = np.percentile(scores[scored], percentile)
+    predicted = scores >= threshold
+
+    tp = int(np.count_nonzero(predicted & labels))
+    fp = int(np.count_nonzero(predicted & ~labels))
+    fn = int(np.count_nonzero(~predicted & labels))
+    tn = int(np.count_nonzero(~predicted & ~labels))
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    specificity = tn / (tn + fp) if tn + fp else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    # ROC AUC is undefined with a single class
+    roc_auc = roc_auc_score(labels, scores) if 0 < tp + fn < len(labels) else float('nan')
+
+    return {
+        'percentile': float(percentile),
+        'threshold': float(threshold),
+        'TP': tp, 'FP': fp, 'FN': fn, 'TN': tn,
+        'precision': precision,
+        'recall': recall,
+        'f1': f1,
+        'accuracy': (tp + tn) / len(labels),
+        'balanced_accuracy': (recall + specificity) / 2,
+        'roc_auc': float(roc_auc),
+    }
+
+def run_name(path):
+    """
+    Returns:
+    str: The run id of a results path, e.g. '500' for ensemble_res_500.pkl.
+    """
+    name = os.path.basename(os.path.normpath(path))
+    name = re.sub(r'\.(pkl|rec)$', '', name)
+    return name.rsplit('_', 1)[-1]
+
+def evaluate_file(path, anomalies, window_size, stride, percentile=None, num_windows=None, scores_dir=None):
+    """
+    Evaluate the results of one run.
+
+    Args:
+    path (str): Columnar results directory, .rec results file or legacy .pkl.
+    anomalies (list): (start, end) anomaly intervals in time steps.
+    window_size (int): Number of time steps per window.
+    stride (int): Step between window starts.
+    percentile (float or None): Threshold percentile, None for 100 - the share of anomalous windows.
+    num_windows (int or None): Evaluate only the first num_windows windows.
+    scores_dir (str or None): Directory for a CSV with the score, label and flag of every window.
+
+    Returns:
+    dict: The file, run, number of iterations and windows and the metrics of compute_metrics.
+    """
+    scores, counts, num_iterations = load_window_scores(path)
+    if num_windows is not None:
+        scores, counts = scores[:num_windows], counts[:num_windows]
+    labels = window_labels(len(scores), window_size, stride, anomalies)
+    metrics = compute_metrics(scores, labels, percentile, scored=counts > 0)
+
+    if scores_dir is not None:
+        os.makedirs(scores_dir, exist_ok=True)
+        pd.DataFrame({
+            'window': np.arange(len(scores)),
+            'start': np.arange(len(scores)) * stride,
+            'score': scores,
+            'label': labels.astype(int),
+            'flagged': (scores >= metrics['threshold']).astype(int),
+        }).to_csv(os.path.join(scores_dir, f"scores_{run_name(path)}.csv"), index=False)
+
+    return {
+        'file': path,
+        'run': run_name(path),
+        'iterations': num_iterations,
+        'windows': len(scores),
+        'anomalous_windows': int(labels.sum()),
+        **metrics,
+    }
+
+def prefix_window_scores(path, sizes):
+    """
+    Window scores of the ensembles of the first `size` iterations of a run.
+
+    Buckets never span iterations, so the deviations of every measurement are
+    computed once and each prefix only sums its own iterations.
+
+    Args:
+    path (str): Columnar results directory, .rec results file or legacy .pkl.
+    sizes (list): Ensemble sizes (numbers of iterations).
+
+    Returns:
+    dict: (scores, counts) of window_scores per size.
+    """
+    if os.path.isdir(path):
+        results = ColumnarResults(path)
+        windows, buckets, proportions, _ = flatten_columnar(results)
+        iterations = np.asarray(sorted(results.completed))[buckets // results.metadata['num_buckets']]
+        deviations = bucket_deviations(buckets, proportions)
+        num_windows = results.metadata['num_windows']
+    else:
+        parts = []
+        for result in iter_results(path):
+            window_indices, bucket_ids, proportions, _ = flatten_results([result])
+            parts.append((np.full(len(window_indices), result['iteration']), window_indices,
+                          bucket_deviations(bucket_ids, proportions)))
+        iterations, windows, deviations = (np.concatenate(column) for column in zip(*parts))
+        num_windows = int(windows.max()) + 1
+
+    completed = np.unique(iterations)
+    prefix_scores = {}
+    for size in sizes:
+        missing = size - np.count_nonzero(completed < size)
+        if missing:
+            raise ValueError(f"{path} misses {missing} of the first {size} iterations")
+        in_prefix = iterations < size
+        counts = np.bincount(windows[in_prefix], minlength=num_windows)
+        sums = np.bincount(windows[in_prefix], weights=deviations[in_prefix], minlength=num_windows)
+        prefix_scores[size] = np.divide(sums, counts, out=np.zeros(num_windows), where=counts > 0), counts
+    return prefix_scores
+
+def evaluate_prefixes(path, sizes, anomalies, window_size, stride, percentile=None, num_windows=None):
+    """
+    Evaluate the ensembles of the first `size` iterations of one run, for every size.
+
+    Args:
+    path (str): Columnar results directory, .rec results file or legacy .pkl.
+    sizes (list): Ensemble sizes (numbers of iterations).
+    anomalies, window_size, stride, percentile, num_windows: As in evaluate_file.
+
+    Returns:
+    pd.DataFrame: One row per size, with the columns of evaluate_file.
+    """
+    rows = []
+    for size, (scores, counts) in prefix_window_scores(path, sorted(sizes)).items():
+        if num_windows is not None:
+            scores, counts = scores[:num_windows], counts[:num_windows]
+        labels = window_labels(len(scores), window_size, stride, anomalies)
+        rows.append({
+            'file': path,
+            'run': run_name(path),
+            'iterations': size,
+            'windows': len(scores),
+            'anomalous_windows': int(labels.sum()),
+            **compute_metrics(scores, labels, percentile, scored=counts > 0),
+        })
+    return pd.DataFrame(rows)
+
+def find_results(directory, pattern="ensemble_res_*"):
+    """
+    Args:
+    directory (str): Directory of result files.
+    pattern (str): Glob pattern of the runs.
+
+    Returns:
+    list: .pkl and .rec result files and columnar results directories, sorted.
+    """
+    paths = []
+    for path in sorted(glob.glob(os.path.join(directory, pattern))):
+        if os.path.isdir(path):
+            if os.path.exists(os.path.join(path, 'metadata.json')):
+                paths.append(path)
+        elif path.endswith(('.pkl', '.rec')):
+            paths.append(path)
+    return paths
+
+def evaluate_directory(directory, anomalies, window_size, stride, percentile=None, num_windows=None, scores_dir=None,
+                       pattern="ensemble_res_*", max_workers=None):
+    """
+    Evaluate every run of a directory in parallel, one process per file.
+
+    Args:
+    directory (str): Directory of result files.
+    anomalies, window_size, stride, percentile, num_windows, scores_dir: As in evaluate_file.
+    pattern (str): Glob pattern of the runs.
+    max_workers (int or None): Number of processes (defaults to the number of CPUs).
+
+    Returns:
+    pd.DataFrame: One row of evaluate_file per run.
+    """
+    paths = find_results(directory, pattern)
+    if not paths:
+        raise ValueError(f"No results matching {pattern} in {directory}")
+    evaluate = partial(evaluate_file, anomalies=anomalies, window_size=window_size, stride=stride,
+                       percentile=percentile, num_windows=num_windows, scores_dir=scores_dir)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        rows = list(executor.map(evaluate, paths))
+
+    metrics = pd.DataFrame(rows)
+    # numeric runs in numeric order
+    order = pd.to_numeric(metrics['run'], errors='coerce')
+    return metrics.iloc[np.lexsort((metrics['run'], order.fillna(np.inf)))].reset_index(drop=True)
+
+def parse_anomalies(text):
+    """
+    Returns:
+    list: (start, end) intervals of a 'start:end,start:end' string.
+    """
+    return [tuple(int(value) for value in interval.split(':')) for interval in text.split(',') if interval]
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Evaluate quantum autoencoder ensemble results against the ground truth")
+    parser.add_argument("path", type=str, help="Directory of runs, or a single results directory/.rec/.pkl")
+    parser.add_argument("--dataset", type=str, default="SMD", choices=sorted(ANOMALIES), help="Ground truth and window parameters")
+    parser.add_argument("--anomalies", type=str, default=None, help="Custom anomaly intervals 'start:end,start:end' (overrides the dataset's)")
+    parser.add_argument("--window_size", type=int, default=None, help="Defaults to the dataset's window size")
+    parser.add_argument("--stride", type=int, default=None, help="Defaults to the dataset's stride")
+    parser.add_argument("--percentile", type=float, default=None, help="Threshold percentile (default: 100 - share of anomalous windows)")
+    parser.add_argument("--num_windows", type=int, default=None, help="Evaluate only the first num_windows windows")
+    parser.add_argument("--pattern", type=str, default="ensemble_res_*", help="Glob pattern of the runs in a directory")
+    parser.add_argument("--max_workers", type=int, default=None, help="Processes evaluating runs in parallel")
+    parser.add_argument("--output", type=str, default="evaluations/metrics.csv", help="CSV with one row of metrics per run")
+    parser.add_argument("--json", type=str, default=None, help="Also write the metrics as JSON")
+    parser.add_argument("--scores_dir", type=str, default=None, help="Write per-window scores, labels and flags per run")
+    parser.add_argument("--prefixes", type=str, default=None, help="Evaluate the first N iterations of a single run for every N of a comma-separated list, e.g. 100,200,500")
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    anomalies = parse_anomalies(args.anomalies) if args.anomalies is not None else ANOMALIES[args.dataset]
+    window_size = args.window_size if args.window_size is not None else WINDOW_PARAMS[args.dataset][0]
+    stride = args.stride if args.stride is not None else WINDOW_PARAMS[args.dataset][1]
+    options = dict(anomalies=anomalies, window_size=window_size, stride=stride, percentile=args.percentile,
+                   num_windows=args.num_windows, scores_dir=args.scores_dir)
+
+    if args.prefixes is not None:
+        sizes = [int(size) for size in args.prefixes.split(',')]
+        del options['scores_dir']
+        metrics = evaluate_prefixes(args.path, sizes, **options)
+    elif os.path.isdir(args.path) and not os.path.exists(os.path.join(args.path, 'metadata.json')):
+        metrics = evaluate_directory(args.path, pattern=args.pattern, max_workers=args.max_workers, **options)
+    else:
+        metrics = pd.DataFrame([evaluate_file(args.path, **options)])
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    metrics.to_csv(args.output, index=False)
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(metrics.to_dict(orient='records'), f, indent=2)
+
+    columns = ['run', 'iterations', 'threshold', 'precision', 'recall', 'f1', 'balanced_accuracy', 'roc_auc']
+    print(metrics[columns].to_string(index=False))
+    print(f"Metrics of {len(metrics)} runs saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
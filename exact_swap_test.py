@@ -0,0 +1,54 @@
+import numpy as np
+
+def reduce_ansatz_circuit(circuit, num_qubits):
+    """
+    Restrict a bound encoder-decoder circuit to the qubits it acts on.
+
+    The ansatz circuits are built on 2*num_qubits + 1 qubits (to line up with the
+    amplitude encoding and swap test), but only ever touch the first num_qubits.
+
+    Args:
+    circuit (QuantumCircuit): The bound encoder-decoder circuit.
+    num_qubits (int): Number of qubits of a single amplitude encoding instance.
+
+    Returns:
+    QuantumCircuit: The same operations on a num_qubits register.
+    """
+    # imported here so swap_test_probability stays usable without qiskit (see ensemble.py)
+    from qiskit import QuantumCircuit
+
+    reduced = QuantumCircuit(num_qubits)
+    for instruction in circuit.data:
+        qubits = [circuit.find_bit(qubit).index for qubit in instruction.qubits]
+        if any(qubit >= num_qubits for qubit in qubits):
+            raise ValueError(f"Ansatz acts on qubit(s) {qubits} outside the first {num_qubits} qubits")
+        reduced.append(instruction.operation, qubits)
+    return reduced
+
+def compute_fidelity(prepared_state, reduced_ansatz):
+    """
+    Compute the fidelity between an input state and its encoder->reset->decoder output.
+
+    Args:
+    prepared_state (np.ndarray): Amplitudes of the input state (output of prepare_for_embedding).
+    reduced_ansatz (QuantumCircuit): Bound encoder-decoder circuit on num_qubits qubits.
+
+    Returns:
+    float: The fidelity <psi|rho|psi>.
+    """
+    from qiskit.quantum_info import DensityMatrix, Statevector
+
+    rho = DensityMatrix(Statevector(prepared_state)).evolve(reduced_ansatz)
+    return float(np.real(np.vdot(prepared_state, rho.data @ prepared_state)))
+
+def swap_test_probability(fidelity):
+    """
+    Probability of measuring the swap test ancilla in |0> for a given fidelity.
+
+    Args:
+    fidelity (float or np.ndarray): Fidelity between the two compared states.
+
+    Returns:
+    float or np.ndarray: (1 + fidelity) / 2, the noiseless, infinite-shot proportion_zero.
+    """
+    return (1 + fidelity) / 2
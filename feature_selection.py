@@ -22,7 +22,7 @@ def perform_pca(data):
     
     return pca, pca_data
 
-def select_features(data, num_qubits, strategy='a'):
+def select_features(data, num_qubits, strategy='a', rng=None):
     """
     Select features based on the specified strategy.
     
@@ -30,11 +30,14 @@ def select_features(data, num_qubits, strategy='a'):
     data (pd.DataFrame): Input data
     num_qubits (int): Number of qubits specified in main
     strategy (str): Feature selection strategy (a, b, c, d, or e)
+    rng (np.random.Generator, optional): Generator of the random strategies, the global numpy RNG if None
     
     Returns:
     pd.DataFrame: Data with selected features (including added 0-features if necessary)
     list: Indices of selected features
     """
+    if rng is None:
+        rng = np.random
     num_features = 2**num_qubits - 1
     original_num_features = data.shape[1]
     
@@ -48,7 +51,7 @@ def select_features(data, num_qubits, strategy='a'):
     
     #uniform random selection of features
     if strategy == 'e':
-        selected_features = np.random.choice(data.columns, num_features, replace=False)
+        selected_features = rng.choice(data.columns, num_features, replace=False)
         return data[selected_features], selected_features.tolist()
     
     pca, pca_data = perform_pca(data)
@@ -70,7 +73,7 @@ def select_features(data, num_qubits, strategy='a'):
     
     #weighted random selection based on feature importance
     elif strategy == 'd':
-        selected_indices = np.random.choice(
+        selected_indices = rng.choice(
             len(feature_importance),
             num_features,
             replace=False,
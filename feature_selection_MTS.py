@@ -3,19 +3,27 @@ import pandas as pd
 
 
 
-def time_selector(target_features, num_features, window_size):
+def time_selector(target_features, num_features, window_size, rng=None):
     
+    if rng is None:
+        rng = np.random
     selected_indices = set()
-    time_indices = np.random.choice(window_size, size= target_features // num_features, replace=False)
+    time_indices = rng.choice(window_size, size=max(1, target_features // num_features), replace=False)
+    sensors = range(num_features)
+    if num_features > target_features:
+        # more sensors than features (e.g. the 38 sensors of a full SMD machine): a random subset at one time step
+        sensors = rng.choice(num_features, size=target_features, replace=False)
     for time in time_indices:
-        for s in range(num_features):
+        for s in sensors:
                 selected_indices.add(s * window_size + time)
          
     return sorted(list(selected_indices))[:target_features]    
 
-def sensor_selector(target_features, f, w):
+def sensor_selector(target_features, f, w, rng=None):
+    if rng is None:
+        rng = np.random
     selected_indices = set()
-    sensor_indices = np.random.choice(f, size=target_features // w, replace=False)
+    sensor_indices = rng.choice(f, size=target_features // w, replace=False)
     for s in sensor_indices:
         for time in range(w):
             selected_indices.add(s * w + time)
@@ -23,7 +31,41 @@ def sensor_selector(target_features, f, w):
     return sorted(list(selected_indices))[:target_features]  
 
 
-def select_features(data, num_qubits, window_size, strategy='b'):
+def count_sensors(columns):
+    """
+    Number of sensors of a window matrix with f"{sensor}_t{t}" columns.
+
+    Args:
+    columns (iterable): Column names of the window matrix
+
+    Returns:
+    int: Number of sensors
+    """
+    return sum(1 for column in columns if str(column).endswith('_t0'))
+
+def select_feature_indices(num_qubits, window_size, strategy='b', num_sensors=5, rng=None):
+    """
+    Draw the flattened window features s * window_size + t to encode.
+
+    Args:
+    num_qubits (int): Number of qubits specified in main
+    window_size (int): Number of time steps per window
+    strategy (str): 'a' for whole sensors, 'b' for all sensors at random time steps
+    num_sensors (int): Number of sensors per window (5 for SKAB and the filtered SMD files)
+    rng (np.random.Generator, optional): Generator of the draw, the global numpy RNG if None
+
+    Returns:
+    list: Indices of selected features
+    """
+    num_features_selected = 2**num_qubits - 1
+    num_features = num_sensors
+
+    if strategy == 'a':
+        return sensor_selector(num_features_selected, num_features, window_size, rng)
+    elif strategy == 'b':
+        return time_selector(num_features_selected, num_features, window_size, rng)
+
+def select_features(data, num_qubits, window_size, strategy='b', num_sensors=None, rng=None):
     """
     Select features based on the specified strategy.
     
@@ -31,26 +73,19 @@ def select_features(data, num_qubits, window_size, strategy='b'):
     data (pd.DataFrame): Input data
     num_qubits (int): Number of qubits specified in main
     strategy (str): Feature selection strategy (a, b, c, d, or e)
+    num_sensors (int or None): Number of sensors per window, counted from the columns if None
+    rng (np.random.Generator, optional): Generator of the draw, the global numpy RNG if None
     
     Returns:
     pd.DataFrame: Data with selected features (including added 0-features if necessary)
     list: Indices of selected features
     """
-    num_features_selected = 2**num_qubits - 1 
-    original_num_features = data.shape[1]
-
     # Assume data shape: (samples, features), features = f * w
-    num_features = 5 # set number of sensors
-    w = 20# set number of time steps
-    
-
-    if strategy == 'a':
-        indices = sensor_selector(num_features_selected, num_features, window_size)
-        selected_data = data.iloc[:, indices]
-    elif strategy == 'b':
-        indices = time_selector(num_features_selected, num_features, window_size)
-        selected_data = data.iloc[:, indices]
-
+    if num_sensors is None:
+        # window matrices without f"{sensor}_t{t}" columns keep the 5 sensors of SKAB and SMD
+        num_sensors = count_sensors(data.columns) or 5
+    indices = select_feature_indices(num_qubits, window_size, strategy, num_sensors, rng)
+    selected_data = data.iloc[:, indices]
 
     return selected_data, indices
 
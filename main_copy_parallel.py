@@ -1,45 +1,36 @@
 import argparse
 import os
 import numpy as np
-import pickle
+import pandas as pd
+import signal
+import sys
 import time
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing import shared_memory
 import threading
 import sliding_windows
 import sliding_windows_SMD
+import tempfile
+from window_builder import WindowSet
 from Preprocessing.goldstein_uchida_preprocess import preprocess_goldstein_uchida
 from Preprocessing.ccpp_preprocess import preprocess_ccpp
 from data_bucketing import perform_bucketing
 import feature_selection_MTS
 import feature_selection
-from Embedding.range_amplitude_enc import create_amplitude_encoding_circuit
-# from Ansatzes.ry_cx_ansatz import create_encoder_decoder_circuit, update_circuit_parameters
-from Ansatzes.rx_rz_ansatz import (
-    create_encoder_decoder_circuit as create_encoder_decoder_circuit_rx_rz,
-    update_circuit_parameters as update_circuit_parameters_rx_rz
-)
-
-from Ansatzes.Ansatz_19_tt import (
-    create_encoder_decoder_circuit as create_encoder_decoder_circuit_19_tt,
-    update_circuit_parameters as update_circuit_parameters_19_tt
-)
-
-from Ansatzes.Ansatz_19 import (
-    create_encoder_decoder_circuit as create_encoder_decoder_circuit_19,
-    update_circuit_parameters as update_circuit_parameters_19
-)
-from Ansatzes.Ansatz_19_ttt import (
-    create_encoder_decoder_circuit as create_encoder_decoder_circuit_19_ttt,
-    update_circuit_parameters as update_circuit_parameters_19_ttt
-)
-from Ansatzes.adaptive_Ansatz import (
-    create_encoder_decoder_circuit as create_encoder_decoder_circuit_19_adaptive,
-    update_circuit_parameters as update_circuit_parameters_19_adaptive
-)
-
-
+from Embedding.state_cache import EncodedStateCache
+from window_cache import cache_key, load_or_create_windows
+from Embedding.range_amplitude_enc import create_state_encoding_circuit, prepare_for_embedding
 # from Ansatzes.ry_rz_ansatz import create_encoder_decoder_circuit, update_circuit_parameters
+from Ansatzes.ansatz_selection import create_ansatz_circuit, update_ansatz_parameters
 from swap_test_circuit import create_swap_test_circuit
+from template_cache import TemplateCache, find_parameter_vector
+from exact_swap_test import reduce_ansatz_circuit, compute_fidelity, swap_test_probability
+from numpy_simulator import build_channel, compute_fidelities
+from adaptive_shots import AdaptiveShotSampler
+from results_file import ColumnarResults, ResultsWriter, iter_results, read_early_stopping, write_legacy_pickle
+from ensemble import Ensemble, num_member_angles
+from evaluation import ANOMALIES, ConvergenceMonitor, OnlineAggregator, evaluate_prefixes, parse_anomalies, window_labels
+import streaming
 from qiskit_aer import AerSimulator
 
 from qiskit_aer.noise import (NoiseModel, QuantumError, ReadoutError,
@@ -50,6 +41,8 @@ def parse_arguments():
     parser.add_argument("num_qubits", type=int, help="Number of qubits to use")
     parser.add_argument("decoder_option", type=int, choices=[1, 2], help="Decoder option: 1 for Qiskit's .inverse(), 2 for manual decoder")
     parser.add_argument("--num_threads", type=int, default=4, help="Number of threads to use")
+    parser.add_argument("--executor", type=str, default="thread", choices=["thread", "process"], help="Run iterations in a thread pool or in a process pool with num_threads workers")
+    parser.add_argument("--seed", type=int, default=None, help="Base seed of the per-iteration random streams (buckets, features, angles and binomial shots), reproducible with either executor (fresh entropy if omitted)")
     
     parser.add_argument("--slurm_id", type=int, default=1, help="SLURM array task ID (used to select iteration count)")
     parser.add_argument("--window_size", type=int, default=20, help="")
@@ -59,8 +52,39 @@ def parse_arguments():
     parser.add_argument("--ansatz_choice", type=int, default=1)
     parser.add_argument("--fs", type=int, default=1)
     parser.add_argument("--dataset", type=str, default="SKAB")
-
-
+    parser.add_argument("--window_cache", type=str, default=None, help="Directory of the memory-mapped window cache, keyed by the CSV content and window parameters (also caches the SKAB pivot and top features)")
+    parser.add_argument("--stream_chunksize", type=int, default=None, help="Build the SMD windows out of core: read the CSV in chunks of this many rows into a memory-mapped series")
+    parser.add_argument("--export_ensemble", type=str, default=None, help="Save the drawn members (angles, compression levels, features) with their bucket statistics and the normalizer as an .npz ensemble")
+    parser.add_argument("--pca_solver", type=str, default="full", choices=["full", "randomized", "incremental"], help="PCA used to rank the SKAB sensors")
+    parser.add_argument("--aer_batch", type=str, default="window", choices=["window", "bucket", "iteration"], help="Number of circuits submitted per Aer job when using the 'aer' engine")
+    parser.add_argument("--noisy", action="store_true", help="Simulate with the IBM Brisbane noise model, templates are lowered to its sx/rz/cx basis")
+    parser.add_argument("--template_dir", type=str, default=None, help="Directory to persist the (transpiled) circuit templates as QPY files")
+    parser.add_argument("--state_cache_mb", type=float, default=0, help="Memory cap in MB of the encoded state cache (0, the default, disables it). The cache only hits when an iteration draws a feature subset that an earlier one already drew, e.g. long runs over short windows: SKAB with 4 qubits has C(20, 3) = 1140 subsets, so runs of a few hundred iterations see few repeats")
+    parser.add_argument("--engine", type=str, default="aer", choices=["aer", "exact", "numpy", "binomial"], help="Engine used to obtain the swap test proportions: 'aer' samples the circuits, 'exact' computes them analytically per window, 'numpy' computes them for a whole bucket in one batched contraction, 'binomial' samples shot counts from the 'numpy' probabilities")
+    parser.add_argument("--shots", type=int, default=4096, help="Shots per window for the 'aer' and 'binomial' engines")
+    parser.add_argument("--adaptive_shots", action="store_true", help="Allocate shots per window in rounds with sequential stopping ('aer' and 'binomial' engines), --shots is the per-window cap")
+    parser.add_argument("--min_shots", type=int, default=256, help="Shots per window in the first adaptive round")
+    parser.add_argument("--round_shots", type=int, default=256, help="Shots added to each undecided window per adaptive round")
+    parser.add_argument("--ci_tolerance", type=float, default=0.02, help="Target 95%% confidence interval half-width on proportion_zero for adaptive shots")
+    parser.add_argument("--shot_budget", type=int, default=None, help="Total adaptive shots per iteration, shared between buckets by window count")
+    parser.add_argument("--threshold_percentile", type=float, default=90, help="Percentile of the running score threshold windows are stopped against")
+
+
+    parser.add_argument("--results_file", type=str, default=None, help="Results of the run (default: results/ensemble_res_{slurm_id}.pkl for pickle, results/ensemble_res_{slurm_id}.rec for records, results/ensemble_res_{slurm_id} for columnar)")
+    parser.add_argument("--results_format", type=str, default="pickle", choices=["pickle", "records", "columnar"], help="'pickle' writes the list of iteration results as one pickle at the end of the run, checkpointed to a records file next to it (same name, .rec) that --resume continues from and that is removed once the pickle is written, 'records' appends one pickled result dict per iteration, 'columnar' writes a float32 score matrix with per-iteration seeds, features and angles (buckets are regenerated from the seeds)")
+    parser.add_argument("--resume", action="store_true", help="Keep the iterations of an existing results file and only run the missing ones")
+    parser.add_argument("--live_metrics", type=int, default=0, help="Report the ROC AUC and F1 of the running ensemble every this many completed iterations (0 to disable)")
+    parser.add_argument("--anomalies", type=str, default=None, help="Ground truth intervals 'start:end,start:end' that size the buckets and score the live metrics and sweeps (default: those of the dataset)")
+    parser.add_argument("--compression_schedule", type=str, default="block", choices=["block", "round_robin"], help="'block' runs the iterations of one compression level after another, 'round_robin' cycles through the levels")
+    parser.add_argument("--early_stopping", action="store_true", help="Stop once the window score ranking has converged (implies --compression_schedule round_robin), num_iterations becomes the upper limit")
+    parser.add_argument("--check_every", type=int, default=10, help="Minimum number of iterations between two convergence checkpoints, a checkpoint also needs the same number of iterations at every compression level")
+    parser.add_argument("--stability_top_k", type=int, default=None, help="Number of top windows compared between checkpoints (default: 10%% of the windows)")
+    parser.add_argument("--stability_tolerance", type=float, default=0.005, help="Largest 1 - Spearman correlation of a stable checkpoint")
+    parser.add_argument("--jaccard_tolerance", type=float, default=0.1, help="Largest 1 - top-k Jaccard index of a stable checkpoint, a checkpoint is stable if either criterion holds")
+    parser.add_argument("--stability_patience", type=int, default=3, help="Consecutive stable checkpoints needed to stop")
+    parser.add_argument("--eval_percentile", type=float, default=None, help="Threshold percentile of the live and sweep metrics (default: 100 - share of anomalous windows)")
+    parser.add_argument("--sweep_sizes", type=str, default=None, help="Ensemble sizes evaluated by --test sweep, comma-separated (default: the sizes of --test iterations)")
+    parser.add_argument("--sweep_output", type=str, default=None, help="CSV with the metrics of every sweep size (default: evaluations/sweep_{slurm_id}.csv)")
     return parser.parse_args()
 
 
@@ -125,6 +149,8 @@ def create_realistic_noise_model(num_qubits):
     
     return noise_model
 
+BRISBANE_BASIS_GATES = ['sx', 'rz', 'cx', 'measure']
+
 #mimics Brisbane noise model
 def configure_noisy_simulator(num_qubits):
     """
@@ -138,7 +164,7 @@ def configure_noisy_simulator(num_qubits):
     """
     noise_model = create_realistic_noise_model(num_qubits)
     
-    basis_gates = ['sx', 'rz', 'cx', 'measure']  # Brisbane's basis gates
+    basis_gates = BRISBANE_BASIS_GATES
     simulator = AerSimulator(
         noise_model=noise_model,
         basis_gates=basis_gates,
@@ -147,7 +173,160 @@ def configure_noisy_simulator(num_qubits):
     
     return simulator
 
-def process_iteration(iteration, num_qubits, decoder_option, preprocessed_data, swap_test, simulator, target_proportion, anomaly_likelihood_per_bucket, num_iterations, num_bucketruns, window_size, ansatz_choice, fs, stride):
+def create_simulator(num_qubits, aer_batch="window", max_parallel_threads=None, noisy=False):
+    """
+    Create the AerSimulator used by the 'aer' engine.
+
+    Args:
+    num_qubits (int): Number of qubits for a single amplitude encoding instance.
+    aer_batch (str): Circuits per Aer job, batched jobs run their experiments in parallel.
+    max_parallel_threads (int or None): Thread cap for Aer (None keeps Aer's default).
+    noisy (bool): Use the Brisbane noise model on all 2*num_qubits + 1 qubits.
+
+    Returns:
+    AerSimulator: The simulator.
+    """
+    if noisy:
+        simulator = configure_noisy_simulator(2 * num_qubits + 1)
+    else:
+        simulator = AerSimulator()
+    if aer_batch != "window":
+        # Let Aer run the experiments of a batched job in parallel
+        simulator.set_options(max_parallel_experiments=0)
+    if max_parallel_threads is not None:
+        simulator.set_options(max_parallel_threads=max_parallel_threads)
+    return simulator
+
+def create_template_cache(engine, noisy=False, template_dir=None):
+    """
+    Create the template cache for a run.
+
+    Args:
+    engine (str): Engine used to obtain the swap test proportions.
+    noisy (bool): Whether the noisy simulator is used, its templates are lowered to the Brisbane basis.
+    template_dir (str or None): Directory to persist templates as QPY files.
+
+    Returns:
+    TemplateCache: The cache.
+    """
+    basis_gates = BRISBANE_BASIS_GATES if noisy and engine == "aer" else None
+    return TemplateCache(basis_gates=basis_gates, cache_dir=template_dir)
+
+# Per-process state of the process executor, set up once by init_process_worker
+_worker_state = {}
+
+def init_process_worker(shm_name, shape, dtype, columns, num_qubits, engine, aer_batch, noisy=False, template_dir=None, state_cache_mb=0, adaptive_config=None, windows_path=None, series_args=None):
+    """
+    Initialize a process pool worker.
+
+    The worker attaches to the shared memory window matrix instead of receiving a
+    pickled copy per task, and gets its own simulator.
+
+    Args:
+    shm_name (str or None): Name of the shared memory block holding the window matrix (None when windows_path is set).
+    shape (tuple): Shape of the window matrix.
+    dtype (str): Dtype of the window matrix.
+    columns (list): Column names of the window DataFrame.
+    num_qubits (int): Number of qubits for a single amplitude encoding instance.
+    engine (str): Engine used to obtain the swap test proportions.
+    aer_batch (str): Circuits per Aer job.
+    noisy (bool): Use the Brisbane noise model.
+    template_dir (str or None): Directory of the persisted templates.
+    state_cache_mb (float): Memory cap of the worker's encoded state cache, 0 disables it.
+    adaptive_config (dict or None): Keyword arguments of the worker's AdaptiveShotSampler, None disables adaptive shots.
+    windows_path (str or None): Cached .npy window matrix to memory-map instead of the shared memory block.
+    series_args (tuple or None): (series_path, window_size, stride, feature_names) of a streamed series,
+        the worker builds a WindowSet over the memory-mapped series instead of attaching to a window matrix.
+
+    Returns:
+    None
+    """
+    if series_args is not None:
+        series_path, window_size, stride, feature_names = series_args
+        _worker_state['preprocessed_data'] = WindowSet(np.load(series_path, mmap_mode='r'), window_size, stride, feature_names)
+    else:
+        if windows_path is not None:
+            windows = np.load(windows_path, mmap_mode='r')
+        else:
+            shm = shared_memory.SharedMemory(name=shm_name)
+            windows = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            _worker_state['shm'] = shm
+        _worker_state['preprocessed_data'] = pd.DataFrame(windows, columns=columns, copy=False)
+    _worker_state['swap_test'] = create_swap_test_circuit(num_qubits) if engine == "aer" else None
+    # One Aer thread per worker, the pool provides the parallelism
+    _worker_state['simulator'] = create_simulator(num_qubits, aer_batch, max_parallel_threads=1, noisy=noisy)
+    _worker_state['template_cache'] = create_template_cache(engine, noisy, template_dir)
+    _worker_state['state_cache'] = EncodedStateCache(int(state_cache_mb * 2**20)) if state_cache_mb > 0 else None
+    # The running threshold is per worker, it only steers when windows stop sampling
+    _worker_state['adaptive_sampler'] = AdaptiveShotSampler(**adaptive_config) if adaptive_config else None
+    # SLURM signals the whole job, the main process decides when the workers stop
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+def process_iteration_in_worker(iteration, num_qubits, decoder_option, *args, seed=None):
+    """
+    Run process_iteration in a process pool worker with the worker's data, swap test and simulator.
+
+    Args:
+    iteration (int): The current iteration number.
+    num_qubits (int): Number of qubits for a single amplitude encoding instance.
+    decoder_option (int): Option for decoder circuit (1 or 2).
+    *args: The remaining arguments of process_iteration, starting at target_proportion.
+    seed (int or None): Seed of the iteration's random stream.
+
+    Returns:
+    dict: Results of the iteration.
+    """
+    return process_iteration(
+        iteration,
+        num_qubits,
+        decoder_option,
+        _worker_state['preprocessed_data'],
+        _worker_state['swap_test'],
+        _worker_state['simulator'],
+        *args,
+        template_cache=_worker_state['template_cache'],
+        state_cache=_worker_state['state_cache'],
+        adaptive_sampler=_worker_state['adaptive_sampler'],
+        seed=seed
+    )
+
+def run_swap_test_circuits(simulator, circuits, shots=4096):
+    """
+    Run swap test circuits as a single Aer job.
+
+    Args:
+    simulator (AerSimulator): The quantum circuit simulator.
+    circuits (list): The full swap test circuits.
+    shots (int): Number of shots per circuit.
+
+    Returns:
+    list: proportion_zero of every circuit, in the order of `circuits`.
+    """
+    result = simulator.run(circuits, shots=shots).result()
+    return [result.get_counts(i).get('0', 0) / shots for i in range(len(circuits))]
+
+def compression_level_of(iteration, num_qubits, num_iterations, schedule="block"):
+    """
+    Compression level of an iteration.
+
+    Args:
+    iteration (int): The iteration number.
+    num_qubits (int): Number of qubits, the levels are 1 to num_qubits - 1.
+    num_iterations (int): Total number of iterations.
+    schedule (str): 'block' runs the iterations of one level after another, 'round_robin'
+        cycles through the levels so every prefix of the iterations covers them evenly.
+
+    Returns:
+    int: The compression level.
+    """
+    compression_levels = num_qubits - 1
+    if schedule == "round_robin":
+        return iteration % compression_levels + 1
+    iterations_per_level = num_iterations // compression_levels
+    compression_level = (iteration // iterations_per_level) + 1
+    return min(compression_level, num_qubits - 1)
+
+def process_iteration(iteration, num_qubits, decoder_option, preprocessed_data, swap_test, simulator, target_proportion, anomaly_likelihood_per_bucket, num_iterations, num_bucketruns, window_size, ansatz_choice, fs, stride, engine="aer", aer_batch="window", shots=4096, compression_schedule="block", num_anomalies=None, template_cache=None, state_cache=None, adaptive_sampler=None, seed=None):
     """
     Process a single iteration of the quantum autoencoder optimization.
 
@@ -155,7 +334,7 @@ def process_iteration(iteration, num_qubits, decoder_option, preprocessed_data,
     iteration (int): The current iteration number.
     num_qubits (int): Number of qubits for a single amplitude encoding instance.
     decoder_option (int): Option for decoder circuit (1 or 2).
-    preprocessed_data (pd.DataFrame): The preprocessed input data.
+    preprocessed_data (pd.DataFrame or WindowSet): The preprocessed input data, a WindowSet is only read bucket by bucket.
     high_risk_indices (list): Indices of high-risk data points.
     swap_test (QuantumCircuit): The swap test circuit.
     simulator (AerSimulator): The quantum circuit simulator.
@@ -163,127 +342,203 @@ def process_iteration(iteration, num_qubits, decoder_option, preprocessed_data,
     anomaly_likelihood_per_bucket (float): The anomaly likelihood per bucket.
     num_iterations (int): Total number of iterations.
     num_bucketruns (int): Number of random angle runs per bucket.
+    engine (str): 'aer' to sample the swap test circuits, 'exact' or 'numpy' to compute the proportions analytically,
+        'binomial' to sample shot counts from the analytic probabilities.
+    aer_batch (str): Circuits per Aer job for the 'aer' engine: one 'window', one 'bucket' or the whole 'iteration'.
+    shots (int): Shots per window for the 'aer' and 'binomial' engines.
+    compression_schedule (str): Assignment of compression levels to iterations, see compression_level_of.
+    num_anomalies (int or None): Number of anomalous windows the buckets are sized for, see perform_bucketing.
+    template_cache (TemplateCache or None): Cache of ansatz and swap test templates shared across iterations.
+    state_cache (EncodedStateCache or None): Cache of prepared amplitude matrices keyed by the selected features.
+    adaptive_sampler (AdaptiveShotSampler or None): Allocates shots per window for the 'aer' and 'binomial' engines,
+        one batched job per bucket and round. None runs a fixed number of shots per window.
+    seed (int or None): Seed of the iteration's random stream (buckets, features, angles and binomial shots), stored
+        with the results so the buckets can be regenerated. The buckets are drawn first so they only depend on the seed.
 
     Returns:
     dict: Results of the iteration, including buckets, selected features, and optimization results.
     """
-    # Calculate the compression level based on the iteration number
-    compression_levels = num_qubits - 1
-    iterations_per_level = num_iterations // compression_levels
-    compression_level = (iteration // iterations_per_level) + 1
-    compression_level = min(compression_level, num_qubits - 1)
+    compression_level = compression_level_of(iteration, num_qubits, num_iterations, compression_schedule)
 
     print(f"\nStarting iteration {iteration + 1} with compression_level {compression_level}")
 
+    # All random draws of the iteration come from its own stream, so the results do not depend on
+    # which worker or thread runs it
+    rng = np.random.default_rng(seed)
+
     # Run the preprocessed data through the bucketing algorithm
     target_probability = anomaly_likelihood_per_bucket
-    buckets, bucket_size = perform_bucketing(preprocessed_data, target_probability)
+    buckets, bucket_size = perform_bucketing(preprocessed_data, target_probability, rng, num_anomalies)
     
     print(f"Number of buckets created: {len(buckets)}")
     print(f"Bucket size: {bucket_size}")
 
     # Run feature selection on the data to select features for amplitude encoding
-    if (fs == 1):
-        selected_data, selected_features = feature_selection_MTS.select_features(preprocessed_data, num_qubits, window_size,  strategy='b')
+    if isinstance(preprocessed_data, WindowSet):
+        selected_features = feature_selection_MTS.select_feature_indices(num_qubits, window_size, strategy='b',
+                                                                         num_sensors=len(preprocessed_data.feature_names), rng=rng)
+    elif (fs == 1):
+        selected_data, selected_features = feature_selection_MTS.select_features(preprocessed_data, num_qubits, window_size,  strategy='b', rng=rng)
     elif (fs == 2):
-        selected_data, selected_features = feature_selection.select_features(preprocessed_data, num_qubits, strategy='e')
+        selected_data, selected_features = feature_selection.select_features(preprocessed_data, num_qubits, strategy='e', rng=rng)
+        # Results store window column positions (as the other strategies return), not column names
+        selected_features = preprocessed_data.columns.get_indexer(selected_features).tolist()
 
     
     print(f"Number of features selected: {len(selected_features)}")
     print("Selected features:", selected_features)
 
-    # Create amplitude encoding circuits for each datapoint+feature set
-    amplitude_encoding_circuits = {}
-    for idx, row in selected_data.iterrows():
-        selected_row = row.values
-        circuit = create_amplitude_encoding_circuit(selected_row, num_qubits)
-        amplitude_encoding_circuits[idx] = circuit
+    # Prepare the amplitude encoded states in vectorized passes, circuits (if any) are only
+    # materialised when a window is executed
+    def prepare_bucket(bucket):
+        # Pull only the selected features of the bucket's windows from the (memory-mapped) WindowSet
+        return prepare_for_embedding(preprocessed_data.take(bucket, selected_features).astype(np.float64))
+
+    def prepare_selected():
+        if not isinstance(preprocessed_data, WindowSet):
+            return prepare_for_embedding(selected_data.to_numpy())
+        prepared = np.empty((len(preprocessed_data), len(selected_features) + 1))
+        for bucket in buckets:
+            prepared[bucket] = prepare_bucket(bucket)
+        return prepared
+
+    if state_cache is not None:
+        prepared_states = state_cache.get_or_prepare(tuple(selected_features), prepare_selected)
+    elif isinstance(preprocessed_data, WindowSet):
+        # Each bucket is read and prepared when it is scored, so only one bucket of windows is in memory
+        prepared_states = None
+    else:
+        prepared_states = prepare_selected()
 
-    print(f"Created amplitude encoding circuits for {len(amplitude_encoding_circuits)} datapoints")
+    if prepared_states is not None:
+        print(f"Prepared amplitude encoded states for {len(prepared_states)} datapoints")
 
-    # Create the "encoder-decoder" ansatz
-    if ansatz_choice == 1:
-        ansatz, encoder_params, decoder_params = create_encoder_decoder_circuit_rx_rz(
-        num_qubits, compression_level, decoder_option
-    )
-    elif ansatz_choice == 2:
-        ansatz, encoder_params, decoder_params = create_encoder_decoder_circuit_19(
-        num_qubits, compression_level, decoder_option
-    )
-    elif ansatz_choice == 3:
-        ansatz, encoder_params, decoder_params = create_encoder_decoder_circuit_19_tt(
-        num_qubits, compression_level, decoder_option
-    )
-    elif ansatz_choice == 4:
-        ansatz, encoder_params, decoder_params = create_encoder_decoder_circuit_19_ttt(
-        num_qubits, compression_level, decoder_option
+    # Get the "encoder-decoder" ansatz, built (and lowered for the noisy backend) once per key
+    if template_cache is None:
+        template_cache = TemplateCache()
+    ansatz = template_cache.get(
+        ("ansatz", ansatz_choice, num_qubits, compression_level, decoder_option),
+        lambda: create_ansatz_circuit(ansatz_choice, num_qubits, compression_level, decoder_option)[0]
     )
-    elif ansatz_choice == 5:
-        ansatz, encoder_params, decoder_params = create_encoder_decoder_circuit_19_adaptive(
-        num_qubits, compression_level, decoder_option
-    )
-    else:
-        raise ValueError(f"Unknown ansatz_choice: {ansatz_choice}")
+    encoder_params = find_parameter_vector(ansatz, 'θ_enc')
+    decoder_params = find_parameter_vector(ansatz, 'θ_dec')
+
+    # Adaptive shots share the iteration budget between buckets by window count
+    remaining_budget = adaptive_sampler.shot_budget if adaptive_sampler is not None else None
+    remaining_windows = num_bucketruns * sum(len(bucket) for bucket in buckets)
+    bucket_shots = []
+    bucket_angles = []
 
-    
     # Run random angle iterations for each bucket
-    iteration_results = []
+    bucket_final_results = []
+    pending_circuits = []  # (bucket_idx, circuit) pairs for the single Aer job of the iteration
     for bucket_idx, bucket in enumerate(buckets):
         # print(f"\nProcessing bucket {bucket_idx + 1}/{len(buckets)}")
-        bucket_circuits = [amplitude_encoding_circuits[idx] for idx in bucket]
         
         final_results = []
+        shots_used = []
+        run_angles = []
+        bucket_states = prepared_states[bucket] if prepared_states is not None else prepare_bucket(bucket)
         for _ in range(num_bucketruns):
             if decoder_option == 1:
-                random_angles = np.random.uniform(0, 2*np.pi, len(encoder_params))
+                random_angles = rng.uniform(0, 2*np.pi, len(encoder_params))
             else:
-                random_angles = np.random.uniform(0, 2*np.pi, len(encoder_params) + len(decoder_params))
+                random_angles = rng.uniform(0, 2*np.pi, len(encoder_params) + len(decoder_params))
+            run_angles.append(random_angles)
             
-            if ansatz_choice == 1:
-                random_ansatz = update_circuit_parameters_rx_rz(
-                ansatz, encoder_params, decoder_params, random_angles
-            )
-            elif ansatz_choice == 2:
-                random_ansatz = update_circuit_parameters_19(
-                ansatz, encoder_params, decoder_params, random_angles
-            )
-            elif ansatz_choice == 3:
-                random_ansatz = update_circuit_parameters_19_tt(
-                ansatz, encoder_params, decoder_params, random_angles
-            )
-            elif ansatz_choice == 4:
-                random_ansatz = update_circuit_parameters_19_ttt(
-                ansatz, encoder_params, decoder_params, random_angles
-            )
-            elif ansatz_choice == 5:
-                random_ansatz = update_circuit_parameters_19_adaptive(
-                ansatz, encoder_params, decoder_params, random_angles
-            )
+            random_ansatz = update_ansatz_parameters(ansatz_choice, ansatz, encoder_params, decoder_params, random_angles)
+
+            if engine == "exact":
+                # proportion_zero of an ideal swap test is (1 + F) / 2
+                reduced_ansatz = reduce_ansatz_circuit(random_ansatz, num_qubits)
+                for state in bucket_states:
+                    fidelity = compute_fidelity(state, reduced_ansatz)
+                    final_results.append(swap_test_probability(fidelity))
+            elif adaptive_sampler is not None:
+                if engine == "binomial":
+                    kraus_ops = build_channel(random_ansatz, num_qubits)
+                    probabilities = np.clip(swap_test_probability(compute_fidelities(bucket_states, kraus_ops)), 0, 1)
+
+                    def sample_counts(indices, round_shots):
+                        return rng.binomial(round_shots, probabilities[indices])
+                else:
+                    circuits = [
+                        create_state_encoding_circuit(state, num_qubits).compose(random_ansatz).compose(swap_test)
+                        for state in bucket_states
+                    ]
+
+                    def sample_counts(indices, round_shots):
+                        proportions = run_swap_test_circuits(simulator, [circuits[i] for i in indices], round_shots)
+                        return np.rint(np.array(proportions) * round_shots)
+
+                budget = None
+                if remaining_budget is not None:
+                    budget = int(remaining_budget * len(bucket) / remaining_windows)
+                proportions, window_shots = adaptive_sampler.sample(sample_counts, len(bucket), budget)
+                if remaining_budget is not None:
+                    remaining_budget -= int(window_shots.sum())
+                remaining_windows -= len(bucket)
+                final_results.extend(proportions.tolist())
+                shots_used.extend(window_shots.tolist())
+            elif engine in ("numpy", "binomial"):
+                # One channel per angle draw, all windows of the bucket in one contraction
+                kraus_ops = build_channel(random_ansatz, num_qubits)
+                fidelities = compute_fidelities(bucket_states, kraus_ops)
+                final_results.extend(swap_test_probability(fidelities).tolist())
             else:
-                raise ValueError(f"Unknown ansatz_choice: {ansatz_choice}")
+                # Build the circuit for each datapoint in the bucket, one at a time as they are executed
+                circuits = (
+                    create_state_encoding_circuit(state, num_qubits).compose(random_ansatz).compose(swap_test)
+                    for state in bucket_states
+                )
+                if aer_batch == "window":
+                    for full_circuit in circuits:
+                        final_results.extend(run_swap_test_circuits(simulator, [full_circuit], shots))
+                elif aer_batch == "bucket":
+                    final_results.extend(run_swap_test_circuits(simulator, list(circuits), shots))
+                else:
+                    pending_circuits.extend((bucket_idx, full_circuit) for full_circuit in circuits)
+
+        bucket_final_results.append(final_results)
+        bucket_shots.append(shots_used)
+        bucket_angles.append(run_angles)
+
+    if pending_circuits:
+        # Submit the whole iteration as one job and map the proportions back to their buckets
+        proportions = run_swap_test_circuits(simulator, [full_circuit for _, full_circuit in pending_circuits], shots)
+        for (bucket_idx, _), proportion_zero in zip(pending_circuits, proportions):
+            bucket_final_results[bucket_idx].append(proportion_zero)
+
+    if adaptive_sampler is not None:
+        total_shots = sum(sum(shots_used) for shots_used in bucket_shots)
+        fixed_shots = sum(len(final_results) for final_results in bucket_final_results) * adaptive_sampler.max_shots
+        print(f"Adaptive shots: {total_shots} of {fixed_shots} ({total_shots / fixed_shots:.1%})")
+    elif engine == "binomial":
+        # Emulate finite shots: one vectorized Binomial(shots, P0) draw for all windows of the iteration
+        probabilities = np.clip(np.concatenate(bucket_final_results), 0, 1)
+        proportions = rng.binomial(shots, probabilities) / shots
+        split_points = np.cumsum([len(final_results) for final_results in bucket_final_results])[:-1]
+        bucket_final_results = [chunk.tolist() for chunk in np.split(proportions, split_points)]
 
-        
-        # Run the circuit for each datapoint in the bucket
-            for idx in bucket:
-                # print('here',bucket_idx, idx)
-                full_circuit = amplitude_encoding_circuits[idx].compose(random_ansatz).compose(swap_test)
-                result = simulator.run(full_circuit, shots=4096).result()
-                proportion_zero = result.get_counts(full_circuit).get('0', 0) / 4096
-                final_results.append(proportion_zero)
-        
+    iteration_results = []
+    for bucket_idx, final_results in enumerate(bucket_final_results):
         average_proportion = np.mean(final_results)
 
         bucket_result = {
             'bucket_idx': bucket_idx,
             'final_results': final_results,
             'average_proportion': average_proportion,
-            'encoder_params': encoder_params
+            'encoder_params': encoder_params,
+            'angles': bucket_angles[bucket_idx]  # one array of ansatz angles per bucket run
         }
+        if adaptive_sampler is not None:
+            bucket_result['shots'] = bucket_shots[bucket_idx]
         # print("done")
         iteration_results.append(bucket_result)
 
     return {
         'iteration': iteration,
+        'seed': seed,
         'buckets': buckets,
         'selected_features': selected_features,
         'bucket_results': iteration_results,
@@ -319,6 +574,30 @@ def main():
     window_size = args.window_size
     stride = args.stride
     ansatz_choice = args.ansatz_choice
+    engine = args.engine
+    aer_batch = args.aer_batch
+    shots = args.shots
+    adaptive_config = None
+    if args.adaptive_shots:
+        if args.engine not in ("aer", "binomial"):
+            raise ValueError("--adaptive_shots requires the 'aer' or 'binomial' engine")
+        adaptive_config = {
+            'min_shots': min(args.min_shots, shots),
+            'max_shots': shots,
+            'round_shots': args.round_shots,
+            'tolerance': args.ci_tolerance,
+            'shot_budget': args.shot_budget,
+            'percentile': args.threshold_percentile,
+        }
+    executor_type = args.executor
+    noisy = args.noisy
+    template_dir = args.template_dir
+    state_cache_mb = args.state_cache_mb
+    window_cache = args.window_cache
+    stream_chunksize = args.stream_chunksize
+    seed = args.seed
+    # Early stopping needs every prefix of the iterations to cover all compression levels
+    compression_schedule = "round_robin" if args.early_stopping else args.compression_schedule
     fs = 1
 
 
@@ -355,6 +634,12 @@ def main():
         print(f"window_size = {window_size}")       
     elif tester == "ogfts":
         fs = 2
+    elif tester == "sweep":
+        # One run of the largest ensemble, every smaller size is one of its prefixes
+        sweep_sizes = sorted(int(size) for size in args.sweep_sizes.split(',')) if args.sweep_sizes else sorted(slurm_id_to_iterations.values())
+        num_iterations = sweep_sizes[-1]
+        compression_schedule = "round_robin"
+        print(f"num_iterations = {num_iterations}, evaluated at {sweep_sizes}")
     else:
         print("Unknown tester type.")
 
@@ -369,64 +654,271 @@ def main():
     # preprocessed_data, high_risk_indices, _ = preprocess_goldstein_uchida(file_path)
     
     if dataset == "SKAB":
-        windwows_info = sliding_windows.create_sliding_windows_from_csv(file_path, window_size, stride)
+        window_module = sliding_windows
+        window_params = {'window_size': window_size, 'stride': stride, 'pca_solver': args.pca_solver}
+        # The pivot and PCA feature ranking are cached next to the windows
+        build_params = {'cache_dir': window_cache}
     elif dataset == "SMD":
         file_path = './Data/filtered_5_features.csv'
-        windwows_info = sliding_windows_SMD.create_sliding_windows_from_csv(file_path)
+        window_module = sliding_windows_SMD
+        window_params = {'window_size': 100, 'stride': 50}
+        build_params = {}
     elif dataset  == "SMD2":
         file_path = './Data/filtered_5_features_2.csv'
-        windwows_info = sliding_windows_SMD.create_sliding_windows_from_csv(file_path)
+        window_module = sliding_windows_SMD
+        window_params = {'window_size': 100, 'stride': 50}
+        build_params = {}
 
     # windwows_info = sliding_windows.create_sliding_windows_from_csv(file_path, slurm_id_to_iterations[slurm_id], stride)
-    preprocessed_data = windwows_info[0]
+    windows_path = None
+    series_args = None
+    stream_dir = None
+    if stream_chunksize is not None and dataset in ("SMD", "SMD2"):
+        # Only the normalized series is stored (on disk), the windows are strided views over it
+        if window_cache is not None:
+            series_dir = window_cache
+        else:
+            stream_dir = tempfile.TemporaryDirectory()
+            series_dir = stream_dir.name
+        series_path = os.path.join(series_dir, f"{cache_key(file_path, dataset=dataset, stream=True)}_series.npy")
+        if os.path.exists(series_path):
+            feature_names = list(pd.read_csv(file_path, nrows=0).columns)
+            preprocessed_data = WindowSet(np.load(series_path, mmap_mode='r'), feature_names=feature_names, **window_params)
+        else:
+            preprocessed_data, _ = sliding_windows_SMD.create_sliding_windows_streaming(
+                file_path, series_path, chunksize=stream_chunksize, **window_params
+            )
+        series_args = (series_path, preprocessed_data.window_size, preprocessed_data.stride, preprocessed_data.feature_names)
+    elif window_cache is not None:
+        # Repeated runs memory-map the windows instead of preprocessing the CSV again
+        windows, columns, mapping, windows_path = load_or_create_windows(
+            file_path,
+            lambda: window_module.create_sliding_windows_from_csv(file_path, as_window_set=True, **window_params, **build_params),
+            window_cache,
+            dataset=dataset,
+            **window_params
+        )
+        preprocessed_data = pd.DataFrame(windows, columns=columns, copy=False)
+    else:
+        windwows_info = window_module.create_sliding_windows_from_csv(file_path, **window_params)
+        preprocessed_data = windwows_info[0]
     
     print(f"Initial dataset size: {len(preprocessed_data)}")
 
-    swap_test = create_swap_test_circuit(num_qubits)
-
-    simulator = AerSimulator()
-    # simulator = configure_noisy_simulator(num_qubits)
-
-    all_results = []
-    all_results_lock = threading.Lock()
-
-    with ThreadPoolExecutor(max_workers=num_threads) as executor:
-        futures = []
-        for iteration in range(num_iterations):
-            future = executor.submit(
-                process_iteration,
-                iteration,
-                num_qubits,
-                decoder_option,
-                preprocessed_data,
-                swap_test,
-                simulator,
-                target_proportion,
-                anomaly_likelihood_per_bucket,
-                num_iterations,
-                num_bucketruns,  # Add this new parameter
-                window_size,
-                ansatz_choice,
-                fs,
-                stride,
-            )
-            futures.append(future)
-
-        for future in futures:
-            result = future.result()
-            with all_results_lock:
-                all_results.append(result)
+    # The analytic engines never build swap test circuits
+    swap_test = create_swap_test_circuit(num_qubits) if engine == "aer" else None
+
+    # Ground truth of the windows: the number of anomalous windows sets the bucket size
+    anomalies = parse_anomalies(args.anomalies) if args.anomalies is not None else ANOMALIES[dataset]
+    labels = window_labels(len(preprocessed_data), window_params['window_size'], window_params['stride'], anomalies)
+    num_anomalies = int(labels.sum())
+    if num_anomalies == 0:
+        raise ValueError(f"No window overlaps the anomalies {anomalies}")
+    print(f"Anomalous windows: {num_anomalies}")
+
+    # Completed iterations are streamed to an append-only results file, a requeued job resumes from it
+    results_path = args.results_file
+    if results_path is None:
+        results_path = f"results/ensemble_res_{slurm_id}" + {"pickle": ".pkl", "records": ".rec", "columnar": ""}[args.results_format]
+    # The pickle is only written at the end, until then the records file next to it is the checkpoint
+    checkpoint_path = os.path.splitext(results_path)[0] + ".rec" if args.results_format == "pickle" else results_path
+    # One seed per iteration for its random stream, recorded with its results
+    iteration_seeds = np.random.SeedSequence(seed).generate_state(num_iterations, dtype=np.uint32).astype(np.int64)
+    results_config = {
+        'num_qubits': num_qubits, 'decoder_option': decoder_option, 'dataset': dataset, 'window_size': window_size,
+        'stride': stride, 'ansatz_choice': ansatz_choice, 'fs': fs, 'engine': engine, 'shots': shots,
+        'adaptive_shots': adaptive_config is not None, 'compression_schedule': compression_schedule,
+        'num_anomalies': num_anomalies,
+    }
+    if args.results_format == "columnar":
+        results_writer = ColumnarResults.open_writer(
+            results_path, results_config, resume=args.resume,
+            seeds=iteration_seeds,
+            num_windows=len(preprocessed_data),
+            num_bucketruns=num_bucketruns,
+            num_features=2**num_qubits - 1,
+            max_angles=max(num_member_angles(num_qubits, level, decoder_option, ansatz_choice) for level in range(1, num_qubits)),
+            target_probability=anomaly_likelihood_per_bucket,
+            num_anomalies=num_anomalies,
+            with_shots=adaptive_config is not None
+        )
+        # a resumed run keeps the seeds of the interrupted one
+        iteration_seeds = np.array(results_writer.seeds)
+    else:
+        results_writer = ResultsWriter(checkpoint_path, results_config, resume=args.resume)
+    remaining_iterations = [iteration for iteration in range(num_iterations) if iteration not in results_writer.completed]
+    if args.resume:
+        print(f"Resuming from {checkpoint_path}: {num_iterations - len(remaining_iterations)} of {num_iterations} iterations done")
+
+    # Window scores of the completed iterations, reported against the ground truth while the run goes on
+    aggregator = None
+    if args.live_metrics > 0 or args.early_stopping:
+        aggregator = OnlineAggregator(len(preprocessed_data), labels, args.eval_percentile)
+        if results_writer.completed:
+            aggregator.load(checkpoint_path)
+    monitor = None
+    if args.early_stopping:
+        monitor = ConvergenceMonitor(aggregator, num_qubits - 1, args.check_every, args.stability_top_k,
+                                     args.stability_tolerance, args.jaccard_tolerance, args.stability_patience)
+        monitor.add_levels(compression_level_of(iteration, num_qubits, num_iterations, compression_schedule)
+                           for iteration in results_writer.completed)
+        previous = read_early_stopping(checkpoint_path) if args.resume else None
+        if previous is not None and previous['stopping_iteration'] is not None:
+            # the interrupted run had already converged, only its running iterations were missing
+            monitor.trace, monitor.stopping_iteration = previous['trace'], previous['stopping_iteration']
+            remaining_iterations = []
+            print(f"Window ranking converged after {monitor.stopping_iteration} iterations in {checkpoint_path}")
+
+    # Arguments of process_iteration after the data, swap test and simulator
+    iteration_args = (
+        target_proportion,
+        anomaly_likelihood_per_bucket,
+        num_iterations,
+        num_bucketruns,  # Add this new parameter
+        window_size,
+        ansatz_choice,
+        fs,
+        stride,
+        engine,
+        aer_batch,
+        shots,
+        compression_schedule,
+        num_anomalies,
+    )
 
-    print("\nAll iterations completed.")
+    shm = None
+    if executor_type == "process":
+        # Share the window matrix with the workers instead of pickling it into every task,
+        # cached windows are memory-mapped by the workers directly
+        windows = preprocessed_data.data if series_args is not None else preprocessed_data.to_numpy()
+        if windows_path is None and series_args is None:
+            shm = shared_memory.SharedMemory(create=True, size=max(windows.nbytes, 1))
+            np.ndarray(windows.shape, dtype=windows.dtype, buffer=shm.buf)[:] = windows
+
+        executor = ProcessPoolExecutor(
+            max_workers=num_threads,
+            initializer=init_process_worker,
+            initargs=(shm.name if shm is not None else None, windows.shape, windows.dtype.str, list(preprocessed_data.columns),
+                      num_qubits, engine, aer_batch, noisy, template_dir, state_cache_mb, adaptive_config,
+                      windows_path, series_args)
+        )
+    else:
+        simulator = create_simulator(num_qubits, aer_batch, noisy=noisy)
+        template_cache = create_template_cache(engine, noisy, template_dir)
+        state_cache = EncodedStateCache(int(state_cache_mb * 2**20)) if state_cache_mb > 0 else None
+        adaptive_sampler = AdaptiveShotSampler(**adaptive_config) if adaptive_config else None
+        executor = ThreadPoolExecutor(max_workers=num_threads)
+
+    # On SIGTERM (time limit, preemption) no new iterations are started, the running ones are still written
+    terminate = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: terminate.set())
+    try:
+        with executor:
+            # Only unfinished futures are referenced, a written result is dropped from memory
+            pending = set()
+            for iteration in remaining_iterations:
+                if executor_type == "process":
+                    future = executor.submit(process_iteration_in_worker, iteration, num_qubits, decoder_option, *iteration_args,
+                                             seed=int(iteration_seeds[iteration]))
+                else:
+                    future = executor.submit(
+                        process_iteration,
+                        iteration,
+                        num_qubits,
+                        decoder_option,
+                        preprocessed_data,
+                        swap_test,
+                        simulator,
+                        *iteration_args,
+                        template_cache=template_cache,
+                        state_cache=state_cache,
+                        adaptive_sampler=adaptive_sampler,
+                        seed=int(iteration_seeds[iteration])
+                    )
+                pending.add(future)
+
+            stopping = False
+            while pending:
+                done, pending = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.cancelled():
+                        continue
+                    result = future.result()
+                    if monitor is not None and monitor.stopping_iteration is not None:
+                        # the stored ensemble is the converged, level-balanced one, later iterations are dropped
+                        continue
+                    results_writer.append(result)
+                    if aggregator is not None:
+                        aggregator.update(result)
+                        if args.live_metrics > 0 and (aggregator.num_iterations % args.live_metrics == 0 or aggregator.num_iterations == num_iterations):
+                            print(aggregator.report(), flush=True)
+                    if monitor is not None and monitor.update(result['compression_level']) and not stopping:
+                        stopping = True
+                        print(f"Window ranking converged after {monitor.stopping_iteration} iterations, the running iterations are not kept")
+                        for future in pending:
+                            future.cancel()
+                if terminate.is_set() and not stopping:
+                    stopping = True
+                    print("SIGTERM received, finishing the running iterations")
+                    for future in pending:
+                        future.cancel()
+    finally:
+        if monitor is not None:
+            results_writer.record_early_stopping(monitor.summary())
+        results_writer.close()
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+        if stream_dir is not None:
+            stream_dir.cleanup()
+
+    if len(results_writer.completed) < num_iterations and (monitor is None or monitor.stopping_iteration is None):
+        print(f"Stopped after {len(results_writer.completed)} of {num_iterations} iterations, results: {checkpoint_path}, rerun with --resume")
+        sys.exit(128 + signal.SIGTERM)
+
+    if len(results_writer.completed) < num_iterations:
+        print(f"\nStopped early with {len(results_writer.completed)} of {num_iterations} iterations.")
+    else:
+        print("\nAll iterations completed.")
+    if executor_type == "thread" and state_cache is not None:
+        print(f"Encoded state cache: {state_cache.stats()}")
 
     end_time = time.time()
     execution_time = end_time - start_time
     print(f"Total execution time: {execution_time:.2f} seconds")
     
-    os.makedirs("results", exist_ok=True)
-    with open(f'results/ensemble_res_{slurm_id}.pkl', 'wb') as f:
-        pickle.dump(all_results, f)
-    print(f"Results saved to ensemble_res_{slurm_id}.pkl")
+    if args.results_format == "pickle":
+        write_legacy_pickle(results_path, iter_results(checkpoint_path))
+        # an early stopped run keeps its checkpoint, the stopping trace is only recorded there
+        if monitor is None:
+            os.remove(checkpoint_path)
+    print(f"Results saved to {results_path}")
+
+    if tester == "sweep":
+        # an early stopped run only covers its completed prefixes
+        sizes = [size for size in sweep_sizes if all(iteration in results_writer.completed for iteration in range(size))]
+        sweep = evaluate_prefixes(results_path, sizes, anomalies, window_params['window_size'], window_params['stride'], args.eval_percentile)
+        sweep_output = args.sweep_output or f"evaluations/sweep_{slurm_id}.csv"
+        os.makedirs(os.path.dirname(sweep_output) or '.', exist_ok=True)
+        sweep.to_csv(sweep_output, index=False)
+        print(sweep[['iterations', 'threshold', 'precision', 'recall', 'f1', 'roc_auc']].to_string(index=False))
+        print(f"Sweep metrics saved to {sweep_output}")
+
+    if args.export_ensemble is not None:
+        if isinstance(preprocessed_data, WindowSet):
+            get_windows = preprocessed_data.take
+        else:
+            window_matrix = preprocessed_data.to_numpy()
+            get_windows = lambda rows: window_matrix[rows]
+        # The features index windows of the length the data was built with (SMD: 100)
+        ensemble = Ensemble.from_results(
+            iter_results(results_path), num_qubits, decoder_option, ansatz_choice, window_params['window_size'], get_windows,
+            stride=window_params['stride']
+        )
+        # The batch windows were normalized with the same fit on the raw series
+        reference, _, normalizer = streaming.load_reference(file_path, "SKAB" if dataset == "SKAB" else "SMD", args.pca_solver)
+        ensemble.save(args.export_ensemble, normalizer, list(reference.columns))
+        print(f"Ensemble of {len(ensemble)} members saved to {args.export_ensemble}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
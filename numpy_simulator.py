@@ -0,0 +1,136 @@
+import numpy as np
+
+def rx_matrix(theta):
+    cos, sin = np.cos(theta / 2), np.sin(theta / 2)
+    return np.array([[cos, -1j * sin], [-1j * sin, cos]])
+
+def ry_matrix(theta):
+    cos, sin = np.cos(theta / 2), np.sin(theta / 2)
+    return np.array([[cos, -sin], [sin, cos]], dtype=complex)
+
+def rz_matrix(theta):
+    return np.array([[np.exp(-0.5j * theta), 0], [0, np.exp(0.5j * theta)]])
+
+X_MATRIX = np.array([[0, 1], [1, 0]], dtype=complex)
+
+SINGLE_QUBIT_GATES = {'rx': rx_matrix, 'ry': ry_matrix, 'rz': rz_matrix}
+CONTROLLED_GATES = {'cx': lambda: X_MATRIX, 'crx': rx_matrix}
+
+# Kraus operators of a single qubit reset: |0><0| and |0><1|
+RESET_KRAUS = (np.array([[1, 0], [0, 0]], dtype=complex), np.array([[0, 1], [0, 0]], dtype=complex))
+
+def apply_single_qubit_matrix(kraus_ops, matrix, qubit, num_qubits):
+    """
+    Left-multiply a stack of operators by a single qubit matrix acting on `qubit`.
+
+    Args:
+    kraus_ops (np.ndarray): Operators of shape (m, 2**num_qubits, 2**num_qubits).
+    matrix (np.ndarray): 2x2 matrix.
+    qubit (int): Qubit the matrix acts on (Qiskit's little-endian ordering).
+    num_qubits (int): Number of qubits.
+
+    Returns:
+    np.ndarray: The updated operators.
+    """
+    dim = 2**num_qubits
+    tensor = kraus_ops.reshape((-1,) + (2,) * num_qubits + (dim,))
+    axis = num_qubits - qubit  # axis 0 is the operator stack, axis 1 the most significant qubit
+    tensor = np.moveaxis(np.tensordot(matrix, tensor, axes=([1], [axis])), 0, axis)
+    return tensor.reshape(-1, dim, dim)
+
+def apply_controlled_matrix(kraus_ops, matrix, control, target, num_qubits):
+    """
+    Left-multiply a stack of operators by a controlled single qubit matrix.
+
+    Args:
+    kraus_ops (np.ndarray): Operators of shape (m, 2**num_qubits, 2**num_qubits).
+    matrix (np.ndarray): 2x2 matrix applied to the target if the control is |1>.
+    control (int): Control qubit.
+    target (int): Target qubit.
+    num_qubits (int): Number of qubits.
+
+    Returns:
+    np.ndarray: The updated operators.
+    """
+    dim = 2**num_qubits
+    tensor = kraus_ops.reshape((-1,) + (2,) * num_qubits + (dim,)).copy()
+    tensor = np.moveaxis(tensor, [num_qubits - control, num_qubits - target], [1, 2])
+    tensor[:, 1] = np.einsum('ij,mj...->mi...', matrix, tensor[:, 1])
+    tensor = np.moveaxis(tensor, [1, 2], [num_qubits - control, num_qubits - target])
+    return tensor.reshape(-1, dim, dim)
+
+def apply_reset(kraus_ops, qubit, num_qubits):
+    """
+    Compose a stack of Kraus operators with the reset channel of `qubit`.
+
+    Every operator K is replaced by the pair (|0><0| K, |0><1| K), doubling the stack.
+
+    Args:
+    kraus_ops (np.ndarray): Operators of shape (m, 2**num_qubits, 2**num_qubits).
+    qubit (int): Qubit to reset.
+    num_qubits (int): Number of qubits.
+
+    Returns:
+    np.ndarray: Operators of shape (2m, 2**num_qubits, 2**num_qubits).
+    """
+    return np.concatenate([
+        apply_single_qubit_matrix(kraus_ops, reset_op, qubit, num_qubits)
+        for reset_op in RESET_KRAUS
+    ])
+
+def build_channel(circuit, num_qubits):
+    """
+    Build the Kraus operators of a bound encoder->reset->decoder circuit.
+
+    The circuit is walked gate by gate, so any ansatz made of rx/ry/rz/cx/crx
+    gates and resets (all ansatzes in Ansatzes/) is supported. Gates on qubits
+    >= num_qubits are not allowed, the ansatzes only act on the first register.
+
+    Args:
+    circuit (QuantumCircuit): The bound encoder-decoder circuit.
+    num_qubits (int): Number of qubits of a single amplitude encoding instance.
+
+    Returns:
+    np.ndarray: Kraus operators of shape (2**num_resets, 2**num_qubits, 2**num_qubits).
+    """
+    kraus_ops = np.eye(2**num_qubits, dtype=complex)[np.newaxis]
+    for instruction in circuit.data:
+        name = instruction.operation.name
+        qubits = [circuit.find_bit(qubit).index for qubit in instruction.qubits]
+        if name == 'barrier':
+            continue
+        if any(qubit >= num_qubits for qubit in qubits):
+            raise ValueError(f"Gate {name} acts on qubit(s) {qubits} outside the first {num_qubits} qubits")
+
+        if name == 'reset':
+            kraus_ops = apply_reset(kraus_ops, qubits[0], num_qubits)
+        elif name in SINGLE_QUBIT_GATES:
+            matrix = SINGLE_QUBIT_GATES[name](float(instruction.operation.params[0]))
+            kraus_ops = apply_single_qubit_matrix(kraus_ops, matrix, qubits[0], num_qubits)
+        elif name in CONTROLLED_GATES:
+            matrix = CONTROLLED_GATES[name](*[float(p) for p in instruction.operation.params])
+            kraus_ops = apply_controlled_matrix(kraus_ops, matrix, qubits[0], qubits[1], num_qubits)
+        else:
+            raise ValueError(f"Unsupported gate for the NumPy simulator: {name}")
+
+    return kraus_ops
+
+def compute_fidelities(prepared_states, kraus_ops):
+    """
+    Compute the fidelity <psi|E(|psi><psi|)|psi> for a batch of input states.
+
+    With E(rho) = sum_k K_k rho K_k^dagger the fidelity is sum_k |<psi|K_k|psi>|^2,
+    so all windows are scored with a single matrix product against the stacked
+    Kraus operators.
+
+    Args:
+    prepared_states (np.ndarray): State matrix of shape (N_windows, 2**num_qubits).
+    kraus_ops (np.ndarray): Kraus operators of shape (m, 2**num_qubits, 2**num_qubits).
+
+    Returns:
+    np.ndarray: Fidelities of shape (N_windows,).
+    """
+    num_ops, dim, _ = kraus_ops.shape
+    transformed = prepared_states @ kraus_ops.reshape(num_ops * dim, dim).T
+    overlaps = np.einsum('nkd,nd->nk', transformed.reshape(-1, num_ops, dim), prepared_states.conj())
+    return np.sum(np.abs(overlaps)**2, axis=1)
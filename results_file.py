@@ -0,0 +1,487 @@
+import json
+import os
+import pickle
+import struct
+import threading
+import numpy as np
+from data_bucketing import create_data_buckets, estimate_bucket_size
+
+RESULTS_VERSION = 1
+COLUMNAR_VERSION = 1
+
+# Every record is an 8-byte little-endian length followed by the pickled record
+_LENGTH = struct.Struct('<Q')
+
+def _iter_records(f):
+    """
+    Yield (record, end offset) for every complete record of an open results file.
+    """
+    while True:
+        prefix = f.read(_LENGTH.size)
+        if len(prefix) < _LENGTH.size:
+            return
+        length = _LENGTH.unpack(prefix)[0]
+        payload = f.read(length)
+        if len(payload) < length:
+            return
+        try:
+            record = pickle.loads(payload)
+        except (pickle.UnpicklingError, EOFError, ValueError):
+            return
+        yield record, f.tell()
+
+def _write_metadata(path, metadata):
+    metadata_path = os.path.join(path, 'metadata.json')
+    with open(metadata_path + '.tmp', 'w') as f:
+        json.dump(metadata, f)
+    os.replace(metadata_path + '.tmp', metadata_path)
+
+def _check_header(header, path):
+    if header.get('version') != RESULTS_VERSION:
+        raise ValueError(f"Unsupported results file version {header.get('version')} in {path} (expected {RESULTS_VERSION})")
+    return header
+
+class UnpickledQiskitObject:
+    """
+    Stand-in for the qiskit objects of legacy pickles (the encoder
+    ParameterVectors and their symengine parameters) that the installed
+    versions can no longer unpickle, the state is kept as is.
+    """
+
+    def __new__(cls, *args, **kwargs):
+        return object.__new__(cls)
+
+    def __setstate__(self, state):
+        self.state = state
+
+class _LegacyUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if module.split('.')[0] in ('qiskit', 'symengine'):
+            return UnpickledQiskitObject
+        return super().find_class(module, name)
+
+def load_legacy_pickle(path):
+    """
+    Load a legacy .pkl result list, with placeholders for qiskit parameters that fail to unpickle.
+
+    Args:
+    path (str): Path of the pickle.
+
+    Returns:
+    list: The iteration results.
+    """
+    with open(path, 'rb') as f:
+        try:
+            return pickle.load(f)
+        except TypeError:
+            f.seek(0)
+            return _LegacyUnpickler(f).load()
+
+def write_legacy_pickle(path, results):
+    """
+    Write iteration results as one pickled list, the ensemble_res_{slurm_id}.pkl output the notebooks load.
+
+    Args:
+    path (str): Path of the pickle.
+    results (iterable): Iteration results, e.g. iter_results of a records file.
+
+    Returns:
+    None
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump(list(results), f)
+    os.replace(path + '.tmp', path)
+
+class ResultsWriter:
+    """
+    Append-only results file, one record per completed iteration.
+
+    The first record is a header with the run configuration, every further
+    record one iteration result, in the order the iterations completed (or an
+    {'early_stopping': ...} record with the stopping trace of the run). Each
+    record is flushed and fsync'ed when it is appended, so the file doubles as
+    checkpoint: a job killed at any point loses at most the iteration that was
+    being written, and a torn last record is dropped when the file is reopened.
+    Only the iteration numbers are kept in memory.
+    """
+
+    def __init__(self, path, config, resume=False):
+        """
+        Args:
+        path (str): Path of the results file.
+        config (dict): Run parameters that have to match when resuming (num_qubits, dataset, ...).
+        resume (bool): Keep the iterations of an existing file, otherwise it is started over.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.completed = set()
+
+        if resume and os.path.exists(path):
+            header, self.completed, valid_bytes = scan_results(path)
+            if header is not None and header['config'] != config:
+                raise ValueError(f"Results file {path} was written with {header['config']}, not {config}")
+            self.file = open(path, 'r+b')
+            # cut off a record that was torn by the kill
+            self.file.truncate(valid_bytes)
+            self.file.seek(valid_bytes)
+            if header is None:
+                self._write({'version': RESULTS_VERSION, 'config': config})
+        else:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self.file = open(path, 'wb')
+            self._write({'version': RESULTS_VERSION, 'config': config})
+
+    def _write(self, record):
+        payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        self.file.write(_LENGTH.pack(len(payload)) + payload)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def append(self, result):
+        """
+        Args:
+        result (dict): Result of process_iteration (with its 'iteration').
+
+        Returns:
+        None
+        """
+        with self.lock:
+            self._write(result)
+            self.completed.add(result['iteration'])
+
+    def record_early_stopping(self, summary):
+        """
+        Args:
+        summary (dict): ConvergenceMonitor.summary of the run.
+
+        Returns:
+        None
+        """
+        with self.lock:
+            self._write({'early_stopping': summary})
+
+    def close(self):
+        self.file.close()
+
+def scan_results(path):
+    """
+    Find the complete records of a results file, one record in memory at a time.
+
+    Args:
+    path (str): Path of the results file.
+
+    Returns:
+    dict or None: The header record (None for an empty file).
+    set: Iterations with a completely written result.
+    int: Bytes up to the end of the last complete record.
+    """
+    header = None
+    completed = set()
+    valid_bytes = 0
+    with open(path, 'rb') as f:
+        for record, valid_bytes in _iter_records(f):
+            if header is None:
+                header = _check_header(record, path)
+            elif 'iteration' in record:
+                completed.add(record['iteration'])
+    return header, completed, valid_bytes
+
+def read_header(path):
+    """
+    Args:
+    path (str): Path of the results file.
+
+    Returns:
+    dict: The header record with the version and the run configuration.
+    """
+    with open(path, 'rb') as f:
+        for record, _ in _iter_records(f):
+            return _check_header(record, path)
+    raise ValueError(f"Results file {path} has no header")
+
+def iter_results(path):
+    """
+    Lazily iterate the iteration results of a run, in the order they were written.
+
+    Drop-in for `for iteration_result in all_results` loops over a loaded
+    pickle, legacy .pkl result files are read with load_legacy_pickle. Columnar
+    results directories are rebuilt iteration by iteration, in iteration order.
+
+    Args:
+    path (str): Path of a results file, a columnar results directory or a legacy pickle.
+
+    Yields:
+    dict: Result of process_iteration.
+    """
+    if os.path.isdir(path):
+        yield from ColumnarResults(path).iter_results()
+        return
+    if path.endswith('.pkl'):
+        yield from load_legacy_pickle(path)
+        return
+    with open(path, 'rb') as f:
+        records = _iter_records(f)
+        header = next(records, None)
+        if header is None:
+            return
+        _check_header(header[0], path)
+        for record, _ in records:
+            if 'iteration' in record:
+                yield record
+
+def read_early_stopping(path):
+    """
+    Args:
+    path (str): Path of a results file or a columnar results directory.
+
+    Returns:
+    dict or None: The last recorded early stopping summary (stopping iteration and trace), None if there is none.
+    """
+    if os.path.isdir(path):
+        return ColumnarResults(path).metadata.get('early_stopping')
+    summary = None
+    with open(path, 'rb') as f:
+        for record, _ in _iter_records(f):
+            if 'early_stopping' in record:
+                summary = record['early_stopping']
+    return summary
+
+class ColumnarResults:
+    """
+    Results of a run as dense arrays, one .npy file per column in a directory.
+
+    scores.npy holds the proportion_zero of every window as a float32 matrix of
+    shape (num_iterations, num_bucketruns, num_windows), the other columns the
+    per-iteration bucketing seed, compression level, int32 selected features and
+    the ansatz angles of every bucket and run. Buckets are not stored, they are
+    regenerated from the seed. Rows are written in place through memory maps and
+    marked in completed.npy last, so the directory is also the --resume
+    checkpoint. result() rebuilds the dict of process_iteration on demand.
+    """
+
+    def __init__(self, path, writable=False):
+        """
+        Args:
+        path (str): Directory of the results.
+        writable (bool): Open the columns for writing further iterations.
+        """
+        self.path = path
+        with open(os.path.join(path, 'metadata.json')) as f:
+            self.metadata = json.load(f)
+        if self.metadata['version'] != COLUMNAR_VERSION:
+            raise ValueError(f"Unsupported columnar results version {self.metadata['version']} in {path} (expected {COLUMNAR_VERSION})")
+        mode = 'r+' if writable else 'r'
+        self.columns = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode) for name in self.metadata['columns']}
+        self.scores = self.columns['scores']
+        self.seeds = self.columns['seeds']
+        self.compression_levels = self.columns['compression_levels']
+        self.features = self.columns['features']
+        self.angles = self.columns['angles']
+        self.num_angles = self.columns['num_angles']
+        self.shots = self.columns.get('shots')
+        self.completed = set(np.flatnonzero(self.columns['completed']).tolist())
+        self.lock = threading.Lock()
+
+    @classmethod
+    def create(cls, path, config, seeds, num_windows, num_bucketruns, num_features, max_angles, target_probability, num_anomalies, with_shots=False):
+        """
+        Create an empty results directory (an existing one is started over).
+
+        Args:
+        path (str): Directory of the results.
+        config (dict): Run parameters (num_qubits, decoder_option, ansatz_choice, ...), JSON serializable.
+        seeds (array-like): Bucketing seed of every iteration.
+        num_windows (int): Number of windows of the data.
+        num_bucketruns (int): Number of random angle runs per bucket.
+        num_features (int): Number of selected features per iteration.
+        max_angles (int): Largest number of ansatz angles over the compression levels.
+        target_probability (float): Anomaly likelihood per bucket the buckets were drawn with.
+        num_anomalies (int): Number of anomalous windows the buckets were sized for.
+        with_shots (bool): Add a column with the adaptive shots of every window.
+
+        Returns:
+        ColumnarResults: The results, open for writing.
+        """
+        os.makedirs(path, exist_ok=True)
+        # The metadata is written last, so its presence marks a complete directory
+        metadata_path = os.path.join(path, 'metadata.json')
+        if os.path.exists(metadata_path):
+            os.remove(metadata_path)
+
+        num_iterations = len(seeds)
+        bucket_size = estimate_bucket_size(num_anomalies / num_windows, target_probability)
+        num_buckets = -(-num_windows // bucket_size)
+        columns = {
+            'scores': ((num_iterations, num_bucketruns, num_windows), np.float32, np.nan),
+            'seeds': ((num_iterations,), np.int64, np.asarray(seeds)),
+            'compression_levels': ((num_iterations,), np.int32, 0),
+            'features': ((num_iterations, num_features), np.int32, -1),
+            'num_angles': ((num_iterations,), np.int32, 0),
+            'angles': ((num_iterations, num_buckets, num_bucketruns, max_angles), np.float64, np.nan),
+            'completed': ((num_iterations,), np.uint8, 0),
+        }
+        if with_shots:
+            columns['shots'] = ((num_iterations, num_bucketruns, num_windows), np.int32, 0)
+        for name, (shape, dtype, fill) in columns.items():
+            column = np.lib.format.open_memmap(os.path.join(path, f"{name}.npy"), mode='w+', dtype=dtype, shape=shape)
+            column[:] = fill
+            column.flush()
+            del column
+
+        metadata = {
+            'version': COLUMNAR_VERSION,
+            'config': config,
+            'num_iterations': num_iterations,
+            'num_windows': num_windows,
+            'num_bucketruns': num_bucketruns,
+            'num_buckets': num_buckets,
+            'target_probability': target_probability,
+            'num_anomalies': num_anomalies,
+            'columns': list(columns),
+        }
+        _write_metadata(path, metadata)
+        return cls(path, writable=True)
+
+    @classmethod
+    def open_writer(cls, path, config, resume=False, **create_args):
+        """
+        Open the results of a run for writing, resuming an existing directory if requested.
+
+        Args:
+        path (str): Directory of the results.
+        config (dict): Run parameters that have to match when resuming.
+        resume (bool): Keep the iterations of an existing directory, otherwise it is started over.
+        **create_args: Remaining arguments of create (seeds, num_windows, ...).
+
+        Returns:
+        ColumnarResults: The results, open for writing. When resuming, the stored seeds are kept.
+        """
+        if resume and os.path.exists(os.path.join(path, 'metadata.json')):
+            results = cls(path, writable=True)
+            # compare through JSON, as stored
+            if results.metadata['config'] != json.loads(json.dumps(config)):
+                raise ValueError(f"Results {path} were written with {results.metadata['config']}, not {config}")
+            if results.metadata['num_iterations'] != len(create_args['seeds']):
+                raise ValueError(f"Results {path} hold {results.metadata['num_iterations']} iterations, not {len(create_args['seeds'])}")
+            return results
+        return cls.create(path, config, **create_args)
+
+    def append(self, result):
+        """
+        Write the row of one iteration.
+
+        Args:
+        result (dict): Result of process_iteration (with its 'iteration' and 'seed').
+
+        Returns:
+        None
+        """
+        iteration = result['iteration']
+        num_bucketruns = self.metadata['num_bucketruns']
+        with self.lock:
+            scores = self.scores[iteration]
+            for bucket_result in result['bucket_results']:
+                bucket_idx = bucket_result['bucket_idx']
+                bucket = result['buckets'][bucket_idx]
+                # final_results are run-major: all windows of the first run, then the second, ...
+                scores[:, bucket] = np.reshape(bucket_result['final_results'], (num_bucketruns, len(bucket)))
+                for run, run_angles in enumerate(bucket_result['angles']):
+                    self.angles[iteration, bucket_idx, run, :len(run_angles)] = run_angles
+                if self.shots is not None and 'shots' in bucket_result:
+                    self.shots[iteration][:, bucket] = np.reshape(bucket_result['shots'], (num_bucketruns, len(bucket)))
+            self.num_angles[iteration] = len(result['bucket_results'][0]['angles'][0])
+            self.seeds[iteration] = -1 if result['seed'] is None else result['seed']
+            self.compression_levels[iteration] = result['compression_level']
+            self.features[iteration] = result['selected_features']
+            for name, column in self.columns.items():
+                if name != 'completed':
+                    column.flush()
+            # marks the row complete once everything else is on disk
+            self.columns['completed'][iteration] = 1
+            self.columns['completed'].flush()
+            self.completed.add(iteration)
+
+    def record_early_stopping(self, summary):
+        """
+        Args:
+        summary (dict): ConvergenceMonitor.summary of the run, stored in metadata.json.
+
+        Returns:
+        None
+        """
+        with self.lock:
+            self.metadata['early_stopping'] = summary
+            _write_metadata(self.path, self.metadata)
+
+    def close(self):
+        for column in self.columns.values():
+            if isinstance(column, np.memmap) and column.mode == 'r+':
+                column.flush()
+
+    def buckets(self, iteration):
+        """
+        Args:
+        iteration (int): Iteration number.
+
+        Returns:
+        list: The buckets of the iteration, regenerated from its seed.
+        """
+        seed = int(self.seeds[iteration])
+        if seed < 0:
+            raise ValueError(f"Iteration {iteration} was run without a seed, its buckets cannot be regenerated")
+        return create_data_buckets(self.metadata['num_windows'], self.metadata['num_anomalies'],
+                                   self.metadata['target_probability'], np.random.default_rng(seed))
+
+    def result(self, iteration, with_encoder_params=True):
+        """
+        Rebuild the result dict of process_iteration for one iteration.
+
+        Args:
+        iteration (int): Iteration number.
+        with_encoder_params (bool): Rebuild the encoder ParameterVector (builds the ansatz with qiskit).
+
+        Returns:
+        dict: The iteration result, with float32 proportions.
+        """
+        config = self.metadata['config']
+        compression_level = int(self.compression_levels[iteration])
+        num_angles = int(self.num_angles[iteration])
+        encoder_params = None
+        if with_encoder_params:
+            # imported here, reading the scores does not need qiskit
+            from ensemble import get_ansatz
+            encoder_params = get_ansatz(config['ansatz_choice'], config['num_qubits'], compression_level, config['decoder_option'])[1]
+
+        buckets = self.buckets(iteration)
+        scores = np.asarray(self.scores[iteration])
+        bucket_results = []
+        for bucket_idx, bucket in enumerate(buckets):
+            final_results = scores[:, bucket].reshape(-1).tolist()
+            bucket_result = {
+                'bucket_idx': bucket_idx,
+                'final_results': final_results,
+                'average_proportion': np.mean(final_results),
+                'encoder_params': encoder_params,
+                'angles': [np.array(run_angles[:num_angles]) for run_angles in self.angles[iteration, bucket_idx]],
+            }
+            if self.shots is not None:
+                bucket_result['shots'] = np.asarray(self.shots[iteration])[:, bucket].reshape(-1).tolist()
+            bucket_results.append(bucket_result)
+
+        return {
+            'iteration': iteration,
+            'seed': int(self.seeds[iteration]),
+            'buckets': buckets,
+            'selected_features': self.features[iteration].tolist(),
+            'bucket_results': bucket_results,
+            'compression_level': compression_level,
+        }
+
+    def iter_results(self, with_encoder_params=True):
+        """
+        Yields:
+        dict: Rebuilt result of every completed iteration, in iteration order.
+        """
+        for iteration in sorted(self.completed):
+            yield self.result(iteration, with_encoder_params)
@@ -21,6 +21,9 @@
 #SBATCH --mem=1000MB
 #SBATCH --array=1-8
 #
+# requeue on preemption, the task resumes from its checkpoint
+#SBATCH --requeue
+#
 
 OMP_NUM_THREADS=$SLURM_CPUS_PER_TASK
 python main_copy_parallel.py \
@@ -32,6 +35,7 @@ python main_copy_parallel.py \
     --stride 5 \
     --num_iterations 500 \
     --test window_size \
-    --ansatz 1
+    --ansatz 1 \
+    --resume
 # Done
 exit 0
\ No newline at end of file
@@ -0,0 +1,71 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+import sliding_windows
+from ensemble import Ensemble
+from window_builder import WindowSet
+
+def load_raw_series(csv_path, dataset, sensors):
+    """
+    Load the raw samples of the scored sensors.
+
+    Args:
+    csv_path (str): SKAB long-format CSV or a wide SMD-style CSV.
+    dataset (str): 'SKAB' or 'SMD'.
+    sensors (list): Names of the scored sensors, in window order.
+
+    Returns:
+    pd.DataFrame: Raw samples (time x sensors).
+    """
+    if dataset == "SKAB":
+        df_pivot, _, _ = sliding_windows.load_pivot(csv_path)
+        return df_pivot[sensors]
+    return pd.read_csv(csv_path)[sensors]
+
+def score_windows(ensemble, windows, batch_size=1024):
+    """
+    Score windows in batches with a frozen ensemble.
+
+    Args:
+    ensemble (Ensemble): Calibrated ensemble.
+    windows (WindowSet): Windows to score.
+    batch_size (int): Windows per vectorized pass.
+
+    Returns:
+    np.ndarray: Anomaly scores of shape (num_windows,).
+    """
+    return np.concatenate([
+        ensemble.score(windows.take(np.arange(start, min(start + batch_size, len(windows)))))
+        for start in range(0, len(windows), batch_size)
+    ])
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Score a CSV with a saved quantum autoencoder ensemble")
+    parser.add_argument("ensemble", type=str, help="Ensemble .npz saved by main_copy_parallel.py --export_ensemble")
+    parser.add_argument("csv_path", type=str, help="Data to score")
+    parser.add_argument("--dataset", type=str, default="SMD", choices=["SKAB", "SMD"], help="Format of the CSV")
+    parser.add_argument("--stride", type=int, default=None, help="Step between windows (defaults to the stride of the ensemble)")
+    parser.add_argument("--batch_size", type=int, default=1024)
+    parser.add_argument("--output", type=str, default="scores.csv", help="Output CSV with one row per window")
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+
+    start_time = time.time()
+    ensemble, normalizer, sensors = Ensemble.load(args.ensemble)
+    print(f"Loaded {len(ensemble)} members in {time.time() - start_time:.2f} seconds")
+
+    start_time = time.time()
+    raw = load_raw_series(args.csv_path, args.dataset, sensors)
+    stride = args.stride if args.stride is not None else ensemble.stride
+    windows = WindowSet(normalizer.transform(raw.to_numpy()), ensemble.window_size, stride)
+    scores = score_windows(ensemble, windows, args.batch_size)
+    print(f"Scored {len(windows)} windows in {time.time() - start_time:.2f} seconds")
+
+    pd.DataFrame({'start': windows.starts, 'score': scores}).to_csv(args.output, index=False)
+    print(f"Scores saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+import argparse
+import http.client
+import json
+import os
+import queue
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+class MicroBatcher:
+    """
+    Coalesces score requests of many producers into micro-batches.
+
+    A batch is closed once it holds `max_batch_size` windows or its oldest
+    request has waited `max_delay` seconds, then all of its windows are scored
+    in one vectorized pass and the scores are handed back per request.
+    """
+
+    def __init__(self, score_fn, max_batch_size=256, max_delay=0.002, max_latencies=100000):
+        """
+        Args:
+        score_fn (callable): Maps windows of shape (N, D) to scores of shape (N,).
+        max_batch_size (int): Windows per batch.
+        max_delay (float): Seconds the oldest request of a batch waits for more requests.
+        max_latencies (int): Number of most recent request latencies kept for the percentiles.
+        """
+        self.score_fn = score_fn
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.queue = queue.Queue()
+        self.latencies = deque(maxlen=max_latencies)
+        self.batch_sizes = deque(maxlen=max_latencies)
+        self.num_requests = 0
+        self.num_windows = 0
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, windows):
+        """
+        Args:
+        windows (np.ndarray): Normalized windows of shape (k, D).
+
+        Returns:
+        Future: Resolves to the scores of shape (k,).
+        """
+        future = Future()
+        self.queue.put((time.perf_counter(), windows, future))
+        return future
+
+    def score(self, windows):
+        return self.submit(windows).result()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            first = self.queue.get()
+            if first is None:
+                return
+            batch = [first]
+            size = len(first[1])
+            deadline = first[0] + self.max_delay
+            closing = False
+            while size < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+                size += len(item[1])
+            self._score_batch(batch)
+            if closing:
+                return
+
+    def _score_batch(self, batch):
+        # Requests of different widths cannot share a matrix, each width is scored on its own
+        groups = {}
+        for item in batch:
+            groups.setdefault(np.shape(item[1])[1:], []).append(item)
+        for group in groups.values():
+            self._score_group(group)
+
+    def _score_group(self, batch):
+        # Any failure is handed to the requests, it must never end the batching thread
+        try:
+            windows = np.concatenate([item[1] for item in batch])
+            scores = self.score_fn(windows)
+        except Exception as error:
+            for _, _, future in batch:
+                future.set_exception(error)
+            return
+
+        done = time.perf_counter()
+        offsets = np.cumsum([len(item[1]) for item in batch])[:-1]
+        for (received, _, future), request_scores in zip(batch, np.split(scores, offsets)):
+            future.set_result(request_scores)
+        with self.lock:
+            self.latencies.extend(done - received for received, _, _ in batch)
+            self.batch_sizes.append(len(windows))
+            self.num_requests += len(batch)
+            self.num_windows += len(windows)
+
+    def stats(self):
+        """
+        Returns:
+        dict: Request and window counts, mean batch size and request latency percentiles in ms.
+        """
+        with self.lock:
+            latencies = np.array(self.latencies) * 1e3
+            batch_sizes = np.array(self.batch_sizes)
+            stats = {'requests': self.num_requests, 'windows': self.num_windows}
+        if len(latencies):
+            p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+            stats.update({'mean_batch_size': float(batch_sizes.mean()),
+                          'latency_p50_ms': float(p50), 'latency_p90_ms': float(p90), 'latency_p99_ms': float(p99)})
+        return stats
+
+def normalize_windows(normalizer, windows, window_size):
+    """
+    Normalize raw flattened windows with the normalizer of the reference series.
+
+    Args:
+    normalizer (RangeNormalizer): Normalizer fitted on the raw reference series.
+    windows (np.ndarray): Raw windows of shape (k, f * window_size), flattened sensor-major.
+    window_size (int): Number of time steps per window.
+
+    Returns:
+    np.ndarray: Normalized windows of the same shape.
+    """
+    num_windows = len(windows)
+    samples = windows.reshape(num_windows, -1, window_size).transpose(0, 2, 1)  # (k, window_size, f)
+    normalized = normalizer.transform(samples.reshape(-1, samples.shape[2]))
+    return normalized.reshape(samples.shape).transpose(0, 2, 1).reshape(num_windows, -1)
+
+class ScoringService:
+    """
+    Request handling shared by the HTTP and the Unix socket front end.
+
+    A request is a JSON object {"windows": [[...], ...], "raw": false}: one or
+    more flattened windows, already normalized unless "raw" is true.
+    """
+
+    def __init__(self, ensemble, normalizer, batcher, num_sensors=None):
+        """
+        Args:
+        ensemble (Ensemble): Calibrated ensemble.
+        normalizer (RangeNormalizer or None): Normalizer of raw windows.
+        batcher (MicroBatcher): Batcher scoring with the ensemble.
+        num_sensors (int or None): Sensors per window, defaults to those of the normalizer.
+        """
+        self.ensemble = ensemble
+        self.normalizer = normalizer
+        self.batcher = batcher
+        if num_sensors is None and normalizer is not None:
+            num_sensors = len(normalizer.mean_)
+        self.num_sensors = num_sensors
+
+    def parse_windows(self, request):
+        """
+        Args:
+        request (dict): Decoded JSON request.
+
+        Returns:
+        np.ndarray: Normalized windows of shape (k, D).
+        """
+        windows = np.atleast_2d(np.asarray(request['windows'], dtype=np.float64))
+        if windows.ndim != 2 or windows.shape[1] % self.ensemble.window_size:
+            raise ValueError(f"windows must have a multiple of window_size={self.ensemble.window_size} values")
+        if self.num_sensors is not None and windows.shape[1] != self.num_sensors * self.ensemble.window_size:
+            raise ValueError(f"windows must have {self.num_sensors} sensors x window_size={self.ensemble.window_size} "
+                             f"= {self.num_sensors * self.ensemble.window_size} values, not {windows.shape[1]}")
+        if windows.shape[1] <= self.ensemble.features.max():
+            raise ValueError(f"windows have {windows.shape[1]} values, the ensemble reads up to index {self.ensemble.features.max()}")
+        if request.get('raw', False):
+            if self.normalizer is None:
+                raise ValueError("the ensemble was saved without a normalizer, send normalized windows")
+            windows = normalize_windows(self.normalizer, windows, self.ensemble.window_size)
+        return windows
+
+    def handle(self, request):
+        """
+        Args:
+        request (dict): Decoded JSON request.
+
+        Returns:
+        dict: {"scores": [...]} for a score request, the batcher stats for {"stats": true}.
+        """
+        if request.get('stats', False):
+            return self.batcher.stats()
+        scores = self.batcher.score(self.parse_windows(request))
+        return {'scores': scores.tolist()}
+
+class HTTPHandler(BaseHTTPRequestHandler):
+    """POST /score with a JSON request, GET /stats for the latency percentiles."""
+
+    def do_POST(self):
+        if self.path != '/score':
+            self._reply(404, {'error': f"unknown path {self.path}"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            self._reply(200, self.server.service.handle(request))
+        except (ValueError, KeyError, TypeError) as error:
+            self._reply(400, {'error': str(error)})
+
+    def do_GET(self):
+        if self.path != '/stats':
+            self._reply(404, {'error': f"unknown path {self.path}"})
+            return
+        self._reply(200, self.server.service.batcher.stats())
+
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+class UnixHandler(socketserver.StreamRequestHandler):
+    """One JSON request per line, one JSON reply per line, on a persistent connection."""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                reply = self.server.service.handle(json.loads(line))
+            except (ValueError, KeyError, TypeError) as error:
+                reply = {'error': str(error)}
+            self.wfile.write(json.dumps(reply).encode() + b'\n')
+            self.wfile.flush()
+
+class ScoringHTTPServer(ThreadingHTTPServer):
+    # many producers connect at once, the default backlog of 5 resets connections
+    request_queue_size = 128
+
+class ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+def request_scores(address, windows, raw=False):
+    """
+    Score windows on a running server (standard library only, no qiskit import).
+
+    Args:
+    address (str): 'host:port' of the HTTP server or the path of its Unix socket.
+    windows (array-like): Flattened windows of shape (k, D) or a single window.
+    raw (bool): The windows are raw sensor values and are normalized by the server.
+
+    Returns:
+    list: Scores of the windows.
+    """
+    payload = json.dumps({'windows': np.atleast_2d(windows).tolist(), 'raw': raw})
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+        connection = http.client.HTTPConnection(host, int(port))
+        try:
+            connection.request('POST', '/score', payload, {'Content-Type': 'application/json'})
+            reply = json.loads(connection.getresponse().read())
+        finally:
+            connection.close()
+    else:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client, client.makefile('rwb') as stream:
+            client.connect(address)
+            stream.write(payload.encode() + b'\n')
+            stream.flush()
+            reply = json.loads(stream.readline())
+    if 'error' in reply:
+        raise ValueError(reply['error'])
+    return reply['scores']
+
+def report_stats(batcher, interval, stop):
+    while not stop.wait(interval):
+        print(f"Stats: {json.dumps(batcher.stats())}", file=sys.stderr, flush=True)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Long-lived micro-batching scoring server for a saved quantum autoencoder ensemble")
+    parser.add_argument("ensemble", type=str, help="Ensemble .npz saved by main_copy_parallel.py --export_ensemble")
+    parser.add_argument("--http", type=str, default="127.0.0.1:8765", help="HOST:PORT of the HTTP front end")
+    parser.add_argument("--unix", type=str, default=None, help="Serve on this Unix socket path instead of HTTP")
+    parser.add_argument("--max_batch_size", type=int, default=256, help="Windows per micro-batch")
+    parser.add_argument("--max_delay_ms", type=float, default=2.0, help="Longest wait of a request for a batch to fill up")
+    parser.add_argument("--report_interval", type=float, default=30.0, help="Seconds between latency reports on stderr (0 to disable)")
+    return parser.parse_args()
+
+def main():
+    """
+    Load the ensemble once and serve score requests until SIGINT/SIGTERM.
+
+    Args:
+    None
+
+    Returns:
+    None
+    """
+    args = parse_arguments()
+    # Imported here so producers can use request_scores without the scoring dependencies,
+    # the server itself loads the stored Kraus operators and needs no qiskit
+    from ensemble import Ensemble
+
+    start_time = time.time()
+    ensemble, normalizer, sensors = Ensemble.load(args.ensemble)
+    batcher = MicroBatcher(ensemble.score, args.max_batch_size, args.max_delay_ms / 1e3)
+    print(f"Loaded {len(ensemble)} members in {time.time() - start_time:.2f} seconds", file=sys.stderr)
+
+    if args.unix is not None:
+        if os.path.exists(args.unix):
+            os.remove(args.unix)
+        server = ThreadingUnixServer(args.unix, UnixHandler)
+        address = args.unix
+    else:
+        host, port = args.http.rsplit(':', 1)
+        server = ScoringHTTPServer((host, int(port)), HTTPHandler)
+        address = f"http://{args.http}"
+    server.service = ScoringService(ensemble, normalizer, batcher, len(sensors) if sensors is not None else None)
+
+    stop = threading.Event()
+    if args.report_interval > 0:
+        threading.Thread(target=report_stats, args=(batcher, args.report_interval, stop), daemon=True).start()
+    # serve_forever runs in the main thread, shut it down from a helper thread on SIGTERM
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+
+    print(f"Serving on {address}", file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+        batcher.close()
+        if args.unix is not None and os.path.exists(args.unix):
+            os.remove(args.unix)
+        print(f"Stats: {json.dumps(batcher.stats())}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
 import numpy as np
 import pandas as pd
-from sklearn.preprocessing import StandardScaler
 import os
 import pickle
-from sklearn.decomposition import PCA
+from window_builder import WindowSet
+from Preprocessing.normalization import RangeNormalizer
+from sklearn.decomposition import PCA, IncrementalPCA
+from window_cache import code_hash, file_hash
 
 
 # def create_sliding_windows_from_csv(
@@ -85,67 +87,105 @@ from sklearn.decomposition import PCA
 
 #     return X_windows, original_to_window, window_size
 
-def range_based_normalize(data):
+def load_pivot(csv_path, cache_dir=None):
     """
-    Normalize the data using range-based normalization.
+    Load the long-format SKAB CSV (datetime, id, value) as a datetime x sensor matrix.
+
+    Args:
+    csv_path (str): Path to the SKAB CSV.
+    cache_dir (str or None): Directory of the pivot artifacts, keyed by the CSV content (None disables caching).
+
+    Returns:
+    pd.DataFrame: The pivoted matrix, sorted by datetime.
+    dict: The artifact's cached top-feature lists, keyed by (solver, n_features) (empty without cache_dir).
+    str or None: Path of the artifact.
     """
-    num_features = data.shape[1]
-    max_value = 1 / num_features
-    normalized_data = pd.DataFrame()
+    artifact_path = None
+    if cache_dir is not None:
+        base = os.path.splitext(os.path.basename(csv_path))[0].replace(' ', '_')
+        artifact_path = os.path.join(cache_dir, f"{base}_{file_hash(csv_path)[:16]}_{code_hash()[:8]}_pivot.pkl")
+        if os.path.exists(artifact_path):
+            with open(artifact_path, 'rb') as f:
+                artifact = pickle.load(f)
+            return artifact['pivot'], artifact['top_features'], artifact_path
 
-    for column in data.columns:
-        min_val = data[column].min()
-        max_val = data[column].max()
-        normalized_data[column] = ((data[column] - min_val) / (max_val - min_val)) * max_value
+    df = pd.read_csv(csv_path, sep=';', decimal='.')
+    df_pivot = df.pivot(index='datetime', columns='id', values='value').sort_index()
+    if artifact_path is not None:
+        save_pivot_artifact(artifact_path, df_pivot, {})
+    return df_pivot, {}, artifact_path
+
+def save_pivot_artifact(artifact_path, df_pivot, top_features):
+    os.makedirs(os.path.dirname(artifact_path) or '.', exist_ok=True)
+    # write and rename, so concurrent array tasks never read a partial file
+    tmp_path = f"{artifact_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump({'pivot': df_pivot, 'top_features': top_features}, f)
+    os.replace(tmp_path, artifact_path)
+
+def rank_features(data, n_features=5, pca_solver='full'):
+    """
+    Pick the features with the largest absolute loadings on the top principal components.
 
-    return normalized_data
+    Args:
+    data (pd.DataFrame): Normalized data (time x features).
+    n_features (int): Number of features (and principal components) to use.
+    pca_solver (str): 'full' for an exact PCA, 'randomized' for a randomized SVD of the top
+        components only, 'incremental' for a batched IncrementalPCA.
 
+    Returns:
+    list: Names of the selected features, in increasing order of importance.
+    """
+    n_components = min(n_features, *data.shape)
+    if pca_solver == 'full':
+        pca = PCA(n_components=n_components, svd_solver='full')
+    elif pca_solver == 'randomized':
+        pca = PCA(n_components=n_components, svd_solver='randomized', random_state=0)
+    elif pca_solver == 'incremental':
+        pca = IncrementalPCA(n_components=n_components, batch_size=max(5 * data.shape[1], 1024))
+    else:
+        raise ValueError(f"Unknown pca_solver: {pca_solver}")
+
+    pca.fit(data)
+    importance = np.sum(np.abs(pca.components_), axis=0)
+    return list(data.columns[np.argsort(importance)[-n_features:]])
 
 def create_sliding_windows_from_csv(
     csv_path,
     window_size=20,
     stride=5,
     save_output=False,
-    output_dir='sliding_windows_data'
+    output_dir='sliding_windows_data',
+    as_window_set=False,
+    cache_dir=None,
+    pca_solver='full'
 ):
-    # 1) Load and pivot
-    df = pd.read_csv(csv_path, sep=';', decimal='.')
-    df_pivot = df.pivot(index='datetime', columns='id', values='value').sort_index()
+    # 1) Load and pivot (cached per source file if cache_dir is set)
+    df_pivot, top_features, artifact_path = load_pivot(csv_path, cache_dir)
 
     # 2) Standardize then range‑normalize
-    scaler = StandardScaler()
-    scaled = pd.DataFrame(scaler.fit_transform(df_pivot),
-                          index=df_pivot.index,
-                          columns=df_pivot.columns)
-    data = range_based_normalize(scaled)
-
-    # 3) PCA to pick top-k features
-    pca = PCA()
-    pca.fit(data)
-    comps = pca.components_[:5]
-    importance = np.sum(np.abs(comps), axis=0)
-    top_feats = data.columns[np.argsort(importance)[-5:]]
+    data = RangeNormalizer().fit_transform(df_pivot)
+
+    # 3) PCA to pick top-k features, reused from the artifact when available
+    feature_key = (pca_solver, 5)
+    if feature_key in top_features:
+        top_feats = top_features[feature_key]
+    else:
+        top_feats = rank_features(data, 5, pca_solver)
+        if artifact_path is not None:
+            save_pivot_artifact(artifact_path, df_pivot, {**top_features, feature_key: top_feats})
     data = data[top_feats]
 
     # 4) Build windows
-    T, f = data.shape
-    windows = []
-    window_idx = []
-    for start in range(0, T - window_size + 1, stride):
-        win = data.iloc[start:start + window_size].values.T.flatten()
-        windows.append(win)
-        window_idx.append(start)
-
-    X_windows = pd.DataFrame(windows,
-                             columns=[f"{feat}_t{t}"
-                                      for feat in top_feats
-                                      for t in range(window_size)])
-    mapping = dict(zip(window_idx, range(len(window_idx))))
+    # Strided view over the normalized series, windows are flattened sensor-major
+    window_set = WindowSet(data, window_size, stride)
+    X_windows = window_set if as_window_set else window_set.to_frame()
+    mapping = window_set.mapping
 
     if save_output:
         os.makedirs(output_dir, exist_ok=True)
         base = os.path.splitext(os.path.basename(csv_path))[0]
-        X_windows.to_numpy().tofile(f"{output_dir}/{base}_windows.npy")
+        np.save(f"{output_dir}/{base}_windows.npy", window_set.to_numpy())
         with open(f"{output_dir}/{base}_mapping.pkl", "wb") as f:
             pickle.dump(mapping, f)
 
@@ -1,67 +1,117 @@
 import numpy as np
 import pandas as pd
-from sklearn.preprocessing import StandardScaler
 import os
 import pickle
-
-def range_based_normalize(data):
-    """
-    Normalize the data using range-based normalization.
-    """
-    num_features = data.shape[1]
-    max_value = 1 / num_features
-    normalized_data = pd.DataFrame()
-
-    for column in data.columns:
-        min_val = data[column].min()
-        max_val = data[column].max()
-        if max_val != min_val:
-            normalized_data[column] = ((data[column] - min_val) / (max_val - min_val)) * max_value
-        else:
-            normalized_data[column] = 0.0  # avoid division by zero
-
-    return normalized_data
+from window_builder import WindowSet
+from Preprocessing.normalization import RangeNormalizer
 
 def create_sliding_windows_from_csv(
     csv_path,
     window_size=100,
     stride=50,
     save_output=False,
-    output_dir='sliding_windows_data'
+    output_dir='sliding_windows_data',
+    as_window_set=False
 ):
     # 1) Load CSV directly (no datetime/id)
     df = pd.read_csv(csv_path)
     
     # 2) Standardize then range normalize
-    scaler = StandardScaler()
-    scaled = pd.DataFrame(scaler.fit_transform(df), columns=df.columns)
-    data = range_based_normalize(scaled)
+    data = RangeNormalizer().fit_transform(df)
 
     # 3) Create sliding windows
-    T, f = data.shape
-    windows = []
-    window_idx = []
-
-    for start in range(0, T - window_size + 1, stride):
-        win = data.iloc[start:start + window_size].values.T.flatten()
-        windows.append(win)
-        window_idx.append(start)
-
-    # 4) Create column names for flattened windows
-    X_windows = pd.DataFrame(windows,
-                             columns=[f"{feat}_t{t}"
-                                      for feat in data.columns
-                                      for t in range(window_size)])
-    mapping = dict(zip(window_idx, range(len(window_idx))))
-
-    # 5) Save if needed
+    # Strided view over the normalized series, windows are flattened sensor-major
+    window_set = WindowSet(data, window_size, stride)
+    X_windows = window_set if as_window_set else window_set.to_frame()
+    mapping = window_set.mapping
+
+    # 4) Save if needed
     if save_output:
         os.makedirs(output_dir, exist_ok=True)
         base = os.path.splitext(os.path.basename(csv_path))[0]
-        X_windows.to_numpy().tofile(f"{output_dir}/{base}_windows.npy")
+        np.save(f"{output_dir}/{base}_windows.npy", window_set.to_numpy())
         with open(f"{output_dir}/{base}_mapping.pkl", "wb") as f:
             pickle.dump(mapping, f)
             
     print(X_windows.shape)
 
     return X_windows, mapping, window_size
+
+
+def iter_csv_chunks(csv_path, chunksize=10000, dtype=np.float32):
+    """
+    Read a CSV in chunks of rows.
+
+    Args:
+    csv_path (str): Path to the CSV file.
+    chunksize (int): Rows per chunk.
+    dtype (np.dtype): Dtype of the chunks.
+
+    Yields:
+    pd.DataFrame: The next chunk of rows.
+    """
+    with pd.read_csv(csv_path, chunksize=chunksize, dtype=dtype) as reader:
+        for chunk in reader:
+            yield chunk
+
+def fit_normalizer_streaming(csv_path, chunksize=10000):
+    """
+    Fit the normalizer in one pass over the CSV chunks, without loading the whole file.
+
+    Args:
+    csv_path (str): Path to the CSV file.
+    chunksize (int): Rows per chunk.
+
+    Returns:
+    RangeNormalizer: The fitted normalizer.
+    list: The column names.
+    """
+    normalizer = RangeNormalizer(dtype=np.float32)
+    columns = None
+    for chunk in iter_csv_chunks(csv_path, chunksize):
+        columns = list(chunk.columns) if columns is None else columns
+        normalizer.partial_fit(chunk)
+    return normalizer, columns
+
+def iter_normalized_chunks(csv_path, normalizer, chunksize=10000):
+    for chunk in iter_csv_chunks(csv_path, chunksize):
+        yield normalizer.transform(chunk.to_numpy())
+
+def create_sliding_windows_streaming(csv_path, series_path, window_size=100, stride=50, chunksize=10000):
+    """
+    Out-of-core variant of create_sliding_windows_from_csv.
+
+    The CSV is read twice in chunks: once to fit the normalizer, once to write the
+    normalized float32 series to a .npy memmap. The windows are a strided view
+    over that memmap, so every sample is stored once on disk regardless of the
+    stride and only the windows that are taken are loaded into memory.
+
+    Args:
+    csv_path (str): Path to the CSV file.
+    series_path (str): Path of the .npy file for the normalized series.
+    window_size (int): Number of time steps per window.
+    stride (int): Step between window starts.
+    chunksize (int): Rows per chunk.
+
+    Returns:
+    WindowSet: Windows over the memory-mapped series.
+    RangeNormalizer: The fitted normalizer.
+    """
+    normalizer, columns = fit_normalizer_streaming(csv_path, chunksize)
+
+    os.makedirs(os.path.dirname(series_path) or '.', exist_ok=True)
+    tmp_path = f"{series_path}.{os.getpid()}.tmp.npy"
+    series = np.lib.format.open_memmap(
+        tmp_path, mode='w+', dtype=np.float32, shape=(normalizer.n_samples_seen_, len(columns))
+    )
+    row = 0
+    for chunk in iter_normalized_chunks(csv_path, normalizer, chunksize):
+        series[row:row + len(chunk)] = chunk
+        row += len(chunk)
+    series.flush()
+    del series
+    os.replace(tmp_path, series_path)
+
+    window_set = WindowSet(np.load(series_path, mmap_mode='r'), window_size, stride, feature_names=columns)
+    print(window_set.shape)
+    return window_set, normalizer
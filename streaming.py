@@ -0,0 +1,262 @@
+import argparse
+import os
+import socket
+import sys
+import time
+import numpy as np
+import pandas as pd
+import sliding_windows
+from ensemble import Ensemble
+from Preprocessing.normalization import RangeNormalizer
+from window_builder import WindowSet
+
+class RingBuffer:
+    """
+    The last `window_size` samples of every sensor.
+
+    Samples are written twice (at i and i + window_size) into a buffer of
+    2 * window_size rows, so the current window is always one contiguous slice.
+    """
+
+    def __init__(self, window_size, num_sensors, dtype=np.float64):
+        """
+        Args:
+        window_size (int): Number of time steps per window.
+        num_sensors (int): Number of sensors per sample.
+        dtype (np.dtype): Dtype of the buffer.
+        """
+        self.window_size = window_size
+        self.buffer = np.zeros((2 * window_size, num_sensors), dtype=dtype)
+        self.position = 0
+        self.count = 0
+
+    def append(self, sample):
+        """
+        Args:
+        sample (np.ndarray): One sample of shape (num_sensors,).
+        """
+        self.buffer[self.position] = sample
+        self.buffer[self.position + self.window_size] = sample
+        self.position = (self.position + 1) % self.window_size
+        self.count += 1
+
+    def window(self):
+        """
+        Returns:
+        np.ndarray: The last window_size samples flattened sensor-major, shape (num_sensors * window_size,).
+        """
+        return self.buffer[self.position:self.position + self.window_size].T.reshape(-1)
+
+class StreamingScorer:
+    """
+    Scores a stream of samples: every `stride` new samples (once the first
+    window is full) the newest window gets its ensemble anomaly score.
+    """
+
+    def __init__(self, ensemble, normalizer, window_size, stride, columns=None):
+        """
+        Args:
+        ensemble (Ensemble): Calibrated ensemble.
+        normalizer (RangeNormalizer): Normalizer fitted on the reference series.
+        window_size (int): Number of time steps per window.
+        stride (int): Step between scored windows.
+        columns (array-like or None): Positions of the ensemble's sensors in an incoming sample (None for all).
+        """
+        self.ensemble = ensemble
+        self.normalizer = normalizer
+        self.stride = stride
+        self.columns = None if columns is None else np.asarray(columns)
+        num_sensors = len(normalizer.mean_)
+        self.ring = RingBuffer(window_size, num_sensors)
+
+    def push(self, sample):
+        """
+        Add one raw sample.
+
+        Args:
+        sample (array-like): Raw sensor values.
+
+        Returns:
+        tuple or None: (window start, score) if a window was completed, None otherwise.
+        """
+        sample = np.asarray(sample, dtype=np.float64)
+        if self.columns is not None:
+            sample = sample[self.columns]
+        self.ring.append(self.normalizer.transform(sample[np.newaxis])[0])
+
+        start = self.ring.count - self.ring.window_size
+        if start < 0 or start % self.stride:
+            return None
+        return start, float(self.ensemble.score(self.ring.window()))
+
+def load_reference(csv_path, dataset, pca_solver='full'):
+    """
+    Load the raw reference series the ensemble is calibrated on, with the normalizer of the batch windows.
+
+    Args:
+    csv_path (str): Reference CSV (SKAB long format or a wide SMD-style CSV).
+    dataset (str): 'SKAB' or 'SMD'.
+    pca_solver (str): PCA used to rank the SKAB sensors.
+
+    Returns:
+    pd.DataFrame: Raw reference samples (time x sensors), restricted to the scored sensors.
+    list: Names of all sensors of an incoming sample, in feed order.
+    RangeNormalizer: Normalizer of the scored sensors.
+    """
+    if dataset == "SKAB":
+        # SKAB sensors are normalized together, then ranked by PCA
+        df_pivot, _, _ = sliding_windows.load_pivot(csv_path)
+        normalizer = RangeNormalizer().fit(df_pivot)
+        top_feats = sliding_windows.rank_features(normalizer.transform(df_pivot), 5, pca_solver)
+        columns = [df_pivot.columns.get_loc(feat) for feat in top_feats]
+        return df_pivot[top_feats], list(df_pivot.columns), normalizer.select(columns)
+    df = pd.read_csv(csv_path)
+    return df, list(df.columns), RangeNormalizer().fit(df)
+
+def parse_sample(line, sep=','):
+    """
+    Returns:
+    list or None: The sensor values of a CSV line, None for headers and empty lines.
+    """
+    try:
+        return [float(value) for value in line.strip().split(sep)]
+    except ValueError:
+        return None
+
+def tail_file(path, from_start=False, poll_interval=0.05):
+    """
+    Follow a growing file, like tail -f.
+
+    Args:
+    path (str): File to follow.
+    from_start (bool): Start with the existing lines instead of only new ones.
+    poll_interval (float): Seconds between polls at the end of the file.
+
+    Yields:
+    str: Complete lines.
+    """
+    with open(path) as f:
+        if not from_start:
+            f.seek(0, os.SEEK_END)
+        partial = ''
+        while True:
+            line = f.readline()
+            if not line:
+                time.sleep(poll_interval)
+                continue
+            partial += line
+            if partial.endswith('\n'):
+                yield partial
+                partial = ''
+
+def socket_lines(address):
+    """
+    Accept one connection on a local socket and yield its lines.
+
+    Args:
+    address (str): 'host:port' for TCP or a filesystem path for a Unix socket.
+
+    Yields:
+    str: Lines sent by the client.
+    """
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((host, int(port)))
+    else:
+        if os.path.exists(address):
+            os.remove(address)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(address)
+    server.listen(1)
+    print(f"Waiting for a connection on {address}", file=sys.stderr)
+    try:
+        connection, _ = server.accept()
+        with connection, connection.makefile('r') as lines:
+            yield from lines
+    finally:
+        server.close()
+        if server.family == socket.AF_UNIX:
+            os.remove(address)
+
+def replay_file(path):
+    """
+    Yield the lines of a file as fast as they can be scored (for latency measurements).
+    """
+    with open(path) as f:
+        yield from f
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Streaming anomaly scoring with a fixed quantum autoencoder ensemble")
+    parser.add_argument("num_qubits", type=int, help="Number of qubits to use")
+    parser.add_argument("decoder_option", type=int, choices=[1, 2], help="Decoder option: 1 for Qiskit's .inverse(), 2 for manual decoder")
+    parser.add_argument("--reference", type=str, required=True, help="CSV the normalizer and the ensemble are calibrated on")
+    parser.add_argument("--dataset", type=str, default="SMD", choices=["SKAB", "SMD"], help="Format of the reference CSV, SKAB feeds send one value per pivoted sensor")
+    parser.add_argument("--source", type=str, required=True, help="'tail:PATH' to follow a file, 'socket:HOST:PORT' or 'socket:PATH' for a local socket, 'replay:PATH' to score a file as fast as possible")
+    parser.add_argument("--sep", type=str, default=",", help="Separator of the incoming sample lines")
+    parser.add_argument("--window_size", type=int, default=20)
+    parser.add_argument("--stride", type=int, default=5)
+    parser.add_argument("--num_members", type=int, default=300, help="Number of ensemble members (iterations of a batch run)")
+    parser.add_argument("--ansatz_choice", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=None, help="Seed for drawing the ensemble")
+    parser.add_argument("--pca_solver", type=str, default="full", choices=["full", "randomized", "incremental"])
+    return parser.parse_args()
+
+def main():
+    """
+    Draw and calibrate an ensemble on the reference series, then print the
+    anomaly score of every completed window of the input stream.
+
+    Args:
+    None
+
+    Returns:
+    None
+    """
+    args = parse_arguments()
+
+    reference, feed_columns, normalizer = load_reference(args.reference, args.dataset, args.pca_solver)
+    reference_windows = WindowSet(normalizer.transform(reference.to_numpy()), args.window_size, args.stride).to_numpy()
+
+    start_time = time.time()
+    ensemble = Ensemble.draw(args.num_members, args.num_qubits, args.decoder_option, args.ansatz_choice, args.window_size, args.seed,
+                             num_sensors=len(reference.columns))
+    ensemble.calibrate(reference_windows)
+    print(f"Calibrated {len(ensemble)} members on {len(reference_windows)} windows in {time.time() - start_time:.2f} seconds", file=sys.stderr)
+
+    columns = [feed_columns.index(column) for column in reference.columns]
+    scorer = StreamingScorer(ensemble, normalizer, args.window_size, args.stride, columns)
+
+    kind, _, target = args.source.partition(':')
+    if kind == "tail":
+        lines = tail_file(target)
+    elif kind == "socket":
+        lines = socket_lines(target)
+    elif kind == "replay":
+        lines = replay_file(target)
+    else:
+        raise ValueError(f"Unknown source: {args.source}")
+
+    latencies = []
+    print("start,score,latency_ms")
+    try:
+        for line in lines:
+            sample = parse_sample(line, args.sep)
+            if sample is None:
+                continue
+            received = time.perf_counter()
+            result = scorer.push(sample)
+            if result is not None:
+                latency = (time.perf_counter() - received) * 1e3
+                latencies.append(latency)
+                print(f"{result[0]},{result[1]:.6f},{latency:.3f}", flush=True)
+    except KeyboardInterrupt:
+        pass
+
+    if latencies:
+        p50, p99 = np.percentile(latencies, [50, 99])
+        print(f"Scored {len(latencies)} windows, latency p50 {p50:.2f} ms, p99 {p99:.2f} ms", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import os
+import threading
+from qiskit import qpy, transpile
+from qiskit.circuit import ParameterVectorElement
+
+def find_parameter_vector(circuit, name):
+    """
+    Find the ParameterVector with the given name among a circuit's parameters.
+
+    Circuits loaded from QPY carry rebuilt ParameterVectors, so the vectors are
+    looked up on the circuit instead of being kept next to it.
+
+    Args:
+    circuit (QuantumCircuit): The parameterized circuit.
+    name (str): Name of the ParameterVector (e.g. 'θ_enc').
+
+    Returns:
+    ParameterVector or None: The full vector, or None if the circuit has no such parameters.
+    """
+    for param in circuit.parameters:
+        if isinstance(param, ParameterVectorElement) and param.vector.name == name:
+            return param.vector
+    return None
+
+class TemplateCache:
+    """
+    Cache of parameterized circuit templates, e.g. one encoder-decoder circuit per
+    (ansatz, num_qubits, compression level, decoder option).
+
+    Templates live in memory and, if cache_dir is set, are persisted as QPY files
+    so later runs (and other SLURM array tasks) skip construction and transpilation.
+    """
+
+    def __init__(self, basis_gates=None, cache_dir=None):
+        """
+        Args:
+        basis_gates (list or None): Basis the templates are transpiled to (None keeps them as built).
+        cache_dir (str or None): Directory for the QPY files (None keeps the cache in memory only).
+        """
+        self.basis_gates = basis_gates
+        self.cache_dir = cache_dir
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        basis = "_".join(self.basis_gates) if self.basis_gates else "raw"
+        name = "_".join(str(part) for part in key)
+        return os.path.join(self.cache_dir, f"{name}_{basis}.qpy")
+
+    def get(self, key, build):
+        """
+        Return the template for `key`, building (and transpiling) it on first use.
+
+        Args:
+        key (tuple): Identifies the template, also used as the QPY file name.
+        build (callable): Builds the untranspiled parameterized circuit.
+
+        Returns:
+        QuantumCircuit: The parameterized template.
+        """
+        with self._lock:
+            if key in self._templates:
+                return self._templates[key]
+
+            path = self._path(key) if self.cache_dir else None
+            if path and os.path.exists(path):
+                with open(path, 'rb') as f:
+                    template = qpy.load(f)[0]
+            else:
+                template = build()
+                if self.basis_gates:
+                    template = transpile(template, basis_gates=self.basis_gates, optimization_level=1)
+                if path:
+                    os.makedirs(self.cache_dir, exist_ok=True)
+                    # write and rename, so concurrent array tasks never read a partial file
+                    tmp_path = f"{path}.{os.getpid()}.tmp"
+                    with open(tmp_path, 'wb') as f:
+                        qpy.dump(template, f)
+                    os.replace(tmp_path, path)
+
+            self._templates[key] = template
+            return template
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from qiskit.quantum_info import DensityMatrix, Statevector
+from Ansatzes.ansatz_selection import create_ansatz_circuit, update_ansatz_parameters
+from Embedding.range_amplitude_enc import prepare_for_embedding
+from exact_swap_test import compute_fidelity, reduce_ansatz_circuit, swap_test_probability
+from numpy_simulator import build_channel, compute_fidelities
+from swap_test_circuit import create_swap_test_circuit
+from template_cache import find_parameter_vector
+
+NUM_QUBITS = 4
+
+def random_ansatz(ansatz_choice, compression_level, decoder_option, rng):
+    ansatz = create_ansatz_circuit(ansatz_choice, NUM_QUBITS, compression_level, decoder_option)[0]
+    encoder_params = find_parameter_vector(ansatz, 'θ_enc')
+    decoder_params = find_parameter_vector(ansatz, 'θ_dec')
+    num_angles = len(encoder_params) + (len(decoder_params) if decoder_option == 2 else 0)
+    angles = rng.uniform(0, 2*np.pi, num_angles)
+    return update_ansatz_parameters(ansatz_choice, ansatz, encoder_params, decoder_params, angles)
+
+def reference_probabilities(prepared_states, bound_ansatz):
+    """
+    proportion_zero of the full swap test circuit, evolved as a density matrix on all 2*num_qubits + 1 qubits.
+    """
+    swap_test = create_swap_test_circuit(NUM_QUBITS).remove_final_measurements(inplace=False)
+    circuit = bound_ansatz.compose(swap_test)
+    ancilla = 2 * NUM_QUBITS
+    probabilities = []
+    for state in prepared_states:
+        # |0> ancilla, then the second and the first register (little-endian)
+        initial = Statevector(np.kron([1, 0], np.kron(state, state)))
+        rho = DensityMatrix(initial).evolve(circuit)
+        probabilities.append(rho.probabilities([ancilla])[0])
+    return np.array(probabilities)
+
+@pytest.fixture
+def prepared_states():
+    rng = np.random.default_rng(0)
+    windows = rng.uniform(0, 1 / 15, size=(6, 2**NUM_QUBITS - 1))
+    windows[0] = 0  # an all-zero window is prepared as the trash state alone
+    return prepare_for_embedding(windows)
+
+@pytest.mark.parametrize("ansatz_choice", [1, 2])
+@pytest.mark.parametrize("compression_level", [1, 2, 3])
+@pytest.mark.parametrize("decoder_option", [1, 2])
+def test_engines_match_density_matrix_reference(prepared_states, ansatz_choice, compression_level, decoder_option):
+    rng = np.random.default_rng(100 * ansatz_choice + 10 * compression_level + decoder_option)
+    bound_ansatz = random_ansatz(ansatz_choice, compression_level, decoder_option, rng)
+
+    expected = reference_probabilities(prepared_states, bound_ansatz)
+
+    reduced_ansatz = reduce_ansatz_circuit(bound_ansatz, NUM_QUBITS)
+    exact = [swap_test_probability(compute_fidelity(state, reduced_ansatz)) for state in prepared_states]
+    numpy_engine = swap_test_probability(compute_fidelities(prepared_states, build_channel(bound_ansatz, NUM_QUBITS)))
+
+    np.testing.assert_allclose(exact, expected, atol=1e-10)
+    np.testing.assert_allclose(numpy_engine, expected, atol=1e-10)
+    # the swap test never drops below 1/2, and the compression loses information
+    assert np.all(expected >= 0.5 - 1e-12) and np.all(expected <= 1 + 1e-12)
+
+def test_channel_is_trace_preserving():
+    bound_ansatz = random_ansatz(1, 2, 1, np.random.default_rng(1))
+
+    kraus_ops = build_channel(bound_ansatz, NUM_QUBITS)
+
+    completeness = np.einsum('kji,kjl->il', kraus_ops.conj(), kraus_ops)
+    np.testing.assert_allclose(completeness, np.eye(2**NUM_QUBITS), atol=1e-10)
+
+def test_prepare_for_embedding_adds_the_trash_state():
+    windows = np.array([[0.1, 0.2, 0.3], [0.0, 0.0, 0.0], [1.0, 1.0, 1.0]])
+
+    states = prepare_for_embedding(windows)
+
+    np.testing.assert_allclose(np.sum(states**2, axis=1), 1)
+    np.testing.assert_allclose(states[0], np.sqrt([0.01, 0.04, 0.09, 0.86]))
+    np.testing.assert_allclose(states[1], [0, 0, 0, 1])
+    np.testing.assert_allclose(states[2], np.sqrt([1, 1, 1, 0]) / np.sqrt(3))
+    np.testing.assert_allclose(prepare_for_embedding(windows[0]), states[0])
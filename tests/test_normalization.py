@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+from Preprocessing.normalization import RangeNormalizer, range_based_normalize
+
+def reference_normalize(data, standardize=True):
+    """
+    The StandardScaler + range_based_normalize loop of the original preprocessing modules.
+    """
+    from sklearn.preprocessing import StandardScaler
+
+    if standardize:
+        data = pd.DataFrame(StandardScaler().fit_transform(data), columns=data.columns)
+    max_value = 1 / data.shape[1]
+    normalized = pd.DataFrame()
+    for column in data.columns:
+        min_val, max_val = data[column].min(), data[column].max()
+        if max_val != min_val:
+            normalized[column] = (data[column] - min_val) / (max_val - min_val) * max_value
+        else:
+            normalized[column] = 0.0
+    return normalized
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame(rng.normal(3.0, 2.0, size=(500, 6)), columns=list("abcdef"))
+    frame['d'] = -4.0
+    return frame
+
+@pytest.mark.parametrize("standardize", [True, False])
+def test_fit_transform_matches_reference(data, standardize):
+    normalized = RangeNormalizer(standardize=standardize).fit_transform(data)
+
+    assert isinstance(normalized, pd.DataFrame)
+    pd.testing.assert_frame_equal(normalized, reference_normalize(data, standardize), atol=1e-12)
+    assert normalized.to_numpy().min() >= -1e-12
+    assert normalized.to_numpy().max() <= 1 / data.shape[1] + 1e-12
+    assert (normalized['d'] == 0).all()
+
+def test_range_based_normalize_matches_reference(data):
+    pd.testing.assert_frame_equal(range_based_normalize(data), reference_normalize(data, standardize=False), atol=1e-12)
+
+def test_partial_fit_matches_fit(data):
+    full = RangeNormalizer().fit(data)
+    chunked = RangeNormalizer()
+    for start in range(0, len(data), 73):
+        chunked.partial_fit(data.iloc[start:start + 73])
+
+    assert chunked.n_samples_seen_ == full.n_samples_seen_ == len(data)
+    for name in ('mean_', 'var_', 'data_min_', 'data_max_'):
+        np.testing.assert_allclose(getattr(chunked, name), getattr(full, name), rtol=1e-12, atol=1e-12)
+    np.testing.assert_allclose(chunked.transform(data.to_numpy()), full.transform(data.to_numpy()), atol=1e-12)
+
+def test_transform_uses_fitted_parameters(data):
+    normalizer = RangeNormalizer(clip=True).fit(data)
+    # later data is not refitted, values outside the fitted range are clipped
+    later = data.to_numpy()[:10] * 10
+
+    transformed = normalizer.transform(later)
+
+    expected = np.clip(RangeNormalizer().fit(data).transform(later), 0, 1 / data.shape[1])
+    np.testing.assert_allclose(transformed, expected)
+    assert transformed.max() <= 1 / data.shape[1]
+
+def test_select_keeps_the_full_fit(data):
+    normalizer = RangeNormalizer().fit(data)
+    columns = [4, 0, 2]
+
+    selected = normalizer.select(columns)
+
+    np.testing.assert_allclose(selected.transform(data.to_numpy()[:, columns]), normalizer.transform(data.to_numpy())[:, columns])
+    assert selected.max_value_ == 1 / data.shape[1]
+
+def test_params_round_trip(data):
+    normalizer = RangeNormalizer().fit(data)
+
+    restored = RangeNormalizer.from_params(normalizer.get_params())
+
+    np.testing.assert_array_equal(restored.transform(data.to_numpy()), normalizer.transform(data.to_numpy()))
+
+def test_transform_before_fit_raises():
+    with pytest.raises(ValueError):
+        RangeNormalizer().transform(np.zeros((2, 3)))
@@ -0,0 +1,141 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from main_copy_parallel import process_iteration
+from results_file import ColumnarResults, ResultsWriter, iter_results, read_early_stopping, read_header, write_legacy_pickle
+from window_builder import WindowSet
+
+NUM_QUBITS = 4
+NUM_SENSORS = 5
+WINDOW_SIZE = 10
+STRIDE = 5
+NUM_ANOMALIES = 4
+TARGET_PROBABILITY = 0.5
+NUM_BUCKETRUNS = 2
+CONFIG = {'num_qubits': NUM_QUBITS, 'decoder_option': 1, 'ansatz_choice': 1, 'window_size': WINDOW_SIZE, 'stride': STRIDE}
+
+@pytest.fixture(scope="module")
+def windows():
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(rng.uniform(0, 1 / NUM_SENSORS, size=(200, NUM_SENSORS)), columns=[f"sensor_{s}" for s in range(NUM_SENSORS)])
+    return WindowSet(data, WINDOW_SIZE, STRIDE)
+
+@pytest.fixture(scope="module")
+def seeds():
+    return np.random.SeedSequence(7).generate_state(3).tolist()
+
+@pytest.fixture(scope="module")
+def results(windows, seeds):
+    return [process_iteration(iteration, NUM_QUBITS, 1, windows, None, None, 0.5, TARGET_PROBABILITY, len(seeds), NUM_BUCKETRUNS,
+                              WINDOW_SIZE, 1, 1, STRIDE, engine="numpy", num_anomalies=NUM_ANOMALIES, seed=seed)
+            for iteration, seed in enumerate(seeds)]
+
+def assert_same_result(actual, expected, rtol=1e-12):
+    assert actual['iteration'] == expected['iteration']
+    assert actual['seed'] == expected['seed']
+    assert [list(bucket) for bucket in actual['buckets']] == [list(bucket) for bucket in expected['buckets']]
+    assert list(actual['selected_features']) == list(expected['selected_features'])
+    assert actual['compression_level'] == expected['compression_level']
+    assert len(actual['bucket_results']) == len(expected['bucket_results'])
+    for actual_bucket, expected_bucket in zip(actual['bucket_results'], expected['bucket_results']):
+        assert actual_bucket['bucket_idx'] == expected_bucket['bucket_idx']
+        np.testing.assert_allclose(actual_bucket['final_results'], expected_bucket['final_results'], rtol=rtol)
+        for actual_angles, expected_angles in zip(actual_bucket['angles'], expected_bucket['angles']):
+            np.testing.assert_array_equal(actual_angles, expected_angles)
+
+def test_results_writer_resumes_completed_iterations(tmp_path, results):
+    path = str(tmp_path / "run.rec")
+    writer = ResultsWriter(path, CONFIG)
+    writer.append(results[0])
+    writer.append(results[1])
+    writer.close()
+
+    writer = ResultsWriter(path, CONFIG, resume=True)
+    assert writer.completed == {0, 1}
+    writer.append(results[2])
+    writer.record_early_stopping({'stopped_at': 2})
+    writer.close()
+
+    assert read_header(path)['config'] == CONFIG
+    read_back = list(iter_results(path))
+    assert len(read_back) == 3
+    for actual, expected in zip(read_back, results):
+        assert_same_result(actual, expected)
+    assert read_early_stopping(path) == {'stopped_at': 2}
+
+def test_results_writer_drops_a_torn_record(tmp_path, results):
+    path = str(tmp_path / "run.rec")
+    writer = ResultsWriter(path, CONFIG)
+    writer.append(results[0])
+    writer.close()
+    complete_size = os.path.getsize(path)
+    # a job killed while writing the second record
+    with open(path, 'ab') as f:
+        f.write(b'\x80\x00\x00\x00\x00\x00\x00\x00partial')
+
+    writer = ResultsWriter(path, CONFIG, resume=True)
+    assert writer.completed == {0}
+    assert os.path.getsize(path) == complete_size
+    writer.append(results[1])
+    writer.close()
+
+    assert [result['iteration'] for result in iter_results(path)] == [0, 1]
+
+def test_results_writer_rejects_another_config(tmp_path, results):
+    path = str(tmp_path / "run.rec")
+    ResultsWriter(path, CONFIG).close()
+
+    with pytest.raises(ValueError):
+        ResultsWriter(path, dict(CONFIG, ansatz_choice=2), resume=True)
+
+def open_columnar(path, seeds, windows, resume=False):
+    return ColumnarResults.open_writer(path, CONFIG, resume, seeds=seeds, num_windows=len(windows), num_bucketruns=NUM_BUCKETRUNS,
+                                       num_features=2**NUM_QUBITS - 1, max_angles=64, target_probability=TARGET_PROBABILITY,
+                                       num_anomalies=NUM_ANOMALIES)
+
+def test_columnar_results_resume_and_rebuild(tmp_path, results, seeds, windows):
+    path = str(tmp_path / "run")
+    writer = open_columnar(path, seeds, windows)
+    writer.append(results[0])
+    writer.close()
+
+    # the stored seeds are kept when resuming, whatever the seeds of the new job are
+    writer = open_columnar(path, [1, 2, 3], windows, resume=True)
+    assert writer.completed == {0}
+    assert writer.seeds.tolist() == seeds
+    writer.append(results[2])
+    writer.record_early_stopping({'stopped_at': 2})
+    writer.close()
+
+    stored = ColumnarResults(path)
+    assert stored.completed == {0, 2}
+    assert stored.metadata['num_anomalies'] == NUM_ANOMALIES
+    # the buckets are regenerated from the seed, the scores are stored as float32
+    assert stored.buckets(2) == [list(bucket) for bucket in results[2]['buckets']]
+    assert_same_result(stored.result(0, with_encoder_params=False), results[0], rtol=1e-6)
+    assert_same_result(stored.result(2, with_encoder_params=False), results[2], rtol=1e-6)
+    assert read_early_stopping(path) == {'stopped_at': 2}
+    assert [result['iteration'] for result in iter_results(path)] == [0, 2]
+
+def test_columnar_results_reject_other_iteration_counts(tmp_path, seeds, windows):
+    path = str(tmp_path / "run")
+    open_columnar(path, seeds, windows).close()
+
+    with pytest.raises(ValueError):
+        open_columnar(path, seeds + [5], windows, resume=True)
+
+def test_legacy_pickle_round_trip(tmp_path, results):
+    records_path = str(tmp_path / "run.rec")
+    writer = ResultsWriter(records_path, CONFIG)
+    for result in results:
+        writer.append(result)
+    writer.close()
+    pickle_path = str(tmp_path / "results" / "ensemble_res_1.pkl")
+
+    write_legacy_pickle(pickle_path, iter_results(records_path))
+
+    read_back = list(iter_results(pickle_path))
+    assert len(read_back) == len(results)
+    for actual, expected in zip(read_back, results):
+        assert_same_result(actual, expected)
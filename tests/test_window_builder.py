@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+import sliding_windows_SMD
+from window_builder import WindowSet, build_windows_loop
+
+def random_series(num_rows, num_sensors, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(rng.normal(size=(num_rows, num_sensors)), columns=[f"sensor_{s}" for s in range(num_sensors)])
+
+@pytest.mark.parametrize("num_rows, window_size, stride", [(103, 20, 5), (100, 100, 50), (57, 10, 10), (64, 7, 3)])
+def test_window_set_matches_loop_builder(num_rows, window_size, stride):
+    data = random_series(num_rows, 5)
+    expected, expected_mapping = build_windows_loop(data, window_size, stride)
+
+    window_set = WindowSet(data, window_size, stride)
+
+    pd.testing.assert_frame_equal(window_set.to_frame(), expected)
+    assert window_set.shape == expected.shape
+    assert window_set.mapping == expected_mapping
+
+def test_take_selects_rows_and_flattened_features():
+    data = random_series(80, 5)
+    expected, _ = build_windows_loop(data, 20, 5)
+    window_set = WindowSet(data, 20, 5)
+    rows = [12, 0, 7, 3]
+    cols = [0, 19, 20, 45, 99]
+
+    np.testing.assert_array_equal(window_set.take(rows, cols), expected.to_numpy()[np.ix_(rows, cols)])
+    np.testing.assert_array_equal(window_set.take(rows), expected.to_numpy()[rows])
+
+def test_window_set_is_a_view():
+    data = random_series(40, 3).to_numpy().copy()
+    window_set = WindowSet(data, 10, 5)
+
+    assert np.shares_memory(window_set.view, data)
+    data[12, 1] = 42.0
+    # row 12 is time step 2 of window 2 and time step 7 of window 1
+    assert window_set.take([2], [1 * 10 + 2])[0, 0] == 42.0
+    assert window_set.take([1], [1 * 10 + 7])[0, 0] == 42.0
+
+def test_smd_windows_match_loop_builder_on_normalized_csv(tmp_path):
+    from sklearn.preprocessing import StandardScaler
+
+    data = random_series(260, 5, seed=1)
+    data['sensor_3'] = 1.5  # constant sensors are mapped to 0
+    csv_path = tmp_path / "series.csv"
+    data.to_csv(csv_path, index=False)
+
+    windows, mapping, window_size = sliding_windows_SMD.create_sliding_windows_from_csv(str(csv_path), window_size=40, stride=20)
+
+    # the loop builder over the normalization of the original pipeline (StandardScaler, then per-column ranges)
+    scaled = pd.DataFrame(StandardScaler().fit_transform(data), columns=data.columns)
+    normalized = (scaled - scaled.min()) / (scaled.max() - scaled.min()) / data.shape[1]
+    normalized['sensor_3'] = 0.0
+    expected, expected_mapping = build_windows_loop(normalized, 40, 20)
+
+    assert window_size == 40
+    assert mapping == expected_mapping
+    np.testing.assert_allclose(windows.to_numpy(), expected.to_numpy(), atol=1e-12)
+    assert list(windows.columns) == list(expected.columns)
@@ -0,0 +1,118 @@
+import time
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+class WindowSet:
+    """
+    Sliding windows over a (T, f) time series as a strided view.
+
+    Window i covers rows i*stride .. i*stride + window_size - 1 and is flattened
+    sensor-major (all time steps of the first sensor, then the second, ...),
+    matching the f"{feat}_t{t}" columns of the window DataFrames. No data is
+    copied until windows are taken or materialised.
+    """
+
+    def __init__(self, data, window_size, stride, feature_names=None):
+        """
+        Args:
+        data (np.ndarray or pd.DataFrame): Normalized time series of shape (T, f).
+        window_size (int): Number of time steps per window.
+        stride (int): Step between window starts.
+        feature_names (list or None): Sensor names (defaults to the DataFrame columns or sensor{s}).
+        """
+        if isinstance(data, pd.DataFrame):
+            feature_names = list(data.columns) if feature_names is None else feature_names
+            data = data.to_numpy()
+        self.data = np.asarray(data)
+        self.window_size = window_size
+        self.stride = stride
+        self.feature_names = feature_names if feature_names is not None else [f"sensor{s}" for s in range(self.data.shape[1])]
+
+        # (num_windows, f, window_size) view, the last two axes flatten sensor-major
+        self.view = sliding_window_view(self.data, window_size, axis=0)[::stride]
+        self.starts = np.arange(len(self.view)) * stride
+        self.mapping = dict(zip(self.starts.tolist(), range(len(self.starts))))
+
+    @property
+    def shape(self):
+        return (len(self.view), self.data.shape[1] * self.window_size)
+
+    def __len__(self):
+        return len(self.view)
+
+    @property
+    def columns(self):
+        return [f"{feat}_t{t}" for feat in self.feature_names for t in range(self.window_size)]
+
+    def take(self, rows=None, cols=None):
+        """
+        Materialise a subset of the flattened window matrix.
+
+        Args:
+        rows (array-like or None): Window indices (None for all windows).
+        cols (array-like or None): Flattened feature indices s * window_size + t (None for all).
+
+        Returns:
+        np.ndarray: Array of shape (len(rows), len(cols)).
+        """
+        view = self.view if rows is None else self.view[np.asarray(rows)]
+        if cols is None:
+            return view.reshape(len(view), -1)
+        sensors, times = np.divmod(np.asarray(cols), self.window_size)
+        return view[:, sensors, times]
+
+    def to_numpy(self):
+        """
+        Returns:
+        np.ndarray: The full (num_windows, f * window_size) window matrix.
+        """
+        return self.take()
+
+    def to_frame(self):
+        """
+        Returns:
+        pd.DataFrame: The window matrix with f"{feat}_t{t}" columns, backed by a single array.
+        """
+        return pd.DataFrame(self.to_numpy(), columns=self.columns, copy=False)
+
+def build_windows_loop(data, window_size, stride):
+    """
+    The previous window construction (one .iloc slice per window), kept for the benchmark.
+    """
+    T, f = data.shape
+    windows = []
+    window_idx = []
+    for start in range(0, T - window_size + 1, stride):
+        win = data.iloc[start:start + window_size].values.T.flatten()
+        windows.append(win)
+        window_idx.append(start)
+
+    X_windows = pd.DataFrame(windows,
+                             columns=[f"{feat}_t{t}"
+                                      for feat in data.columns
+                                      for t in range(window_size)])
+    mapping = dict(zip(window_idx, range(len(window_idx))))
+    return X_windows, mapping
+
+if __name__ == "__main__":
+    # Benchmark on a series of the size of the SMD files
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(rng.random((28479, 5)), columns=[f"feature_{s}" for s in range(5)])
+
+    for window_size, stride in [(20, 5), (100, 50), (20, 1)]:
+        start_time = time.time()
+        X_loop, mapping_loop = build_windows_loop(data, window_size, stride)
+        loop_time = time.time() - start_time
+
+        start_time = time.time()
+        window_set = WindowSet(data, window_size, stride)
+        view_time = time.time() - start_time
+        X_view = window_set.to_frame()
+        frame_time = time.time() - start_time
+
+        assert np.array_equal(X_loop.to_numpy(), X_view.to_numpy())
+        assert list(X_loop.columns) == list(X_view.columns) and mapping_loop == window_set.mapping
+        print(f"window_size={window_size} stride={stride} windows={len(window_set)}: "
+              f"loop {loop_time:.3f}s, view {view_time * 1e3:.2f}ms, to_frame {frame_time:.3f}s "
+              f"({loop_time / frame_time:.0f}x)")
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+from functools import lru_cache
+import numpy as np
+
+CACHE_VERSION = 2
+
+# Modules whose code determines the cached windows, series and pivots
+PREPROCESSING_MODULES = (
+    'sliding_windows.py',
+    'sliding_windows_SMD.py',
+    'window_builder.py',
+    os.path.join('Preprocessing', 'normalization.py'),
+)
+
+def file_hash(path, chunk_size=2**20):
+    """
+    SHA-256 of a file's content.
+
+    Args:
+    path (str): Path to the file.
+    chunk_size (int): Bytes read per chunk.
+
+    Returns:
+    str: Hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+@lru_cache(maxsize=None)
+def code_hash():
+    """
+    SHA-256 of the preprocessing modules, so a code change invalidates the cached artifacts.
+
+    Returns:
+    str: Hex digest.
+    """
+    digest = hashlib.sha256()
+    root = os.path.dirname(os.path.abspath(__file__))
+    for module in PREPROCESSING_MODULES:
+        digest.update(module.encode())
+        digest.update(file_hash(os.path.join(root, module)).encode())
+    return digest.hexdigest()
+
+def cache_key(csv_path, **params):
+    """
+    Key of the preprocessed windows of a CSV file.
+
+    Args:
+    csv_path (str): Path to the input CSV.
+    **params: Preprocessing parameters (dataset, window_size, stride, ...).
+
+    Returns:
+    str: Short hex key, changes with the file content, any parameter and the preprocessing code.
+    """
+    payload = json.dumps({'version': CACHE_VERSION, 'code': code_hash(), 'file': file_hash(csv_path), 'params': params}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+class WindowCache:
+    """
+    On-disk cache of preprocessed window matrices.
+
+    Each entry is a {key}_windows.npy file, opened memory-mapped so workers share
+    the page cache instead of rebuilding windows, and a {key}.json file with the
+    column names, window starts and preprocessing parameters.
+    """
+
+    def __init__(self, cache_dir):
+        """
+        Args:
+        cache_dir (str): Directory of the cache files.
+        """
+        self.cache_dir = cache_dir
+
+    def windows_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}_windows.npy")
+
+    def metadata_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def load(self, key):
+        """
+        Args:
+        key (str): Cache key.
+
+        Returns:
+        tuple or None: (read-only memmap of the windows, metadata dict), None on a miss.
+        """
+        # The metadata is written last, so its presence marks a complete entry
+        if not os.path.exists(self.metadata_path(key)):
+            return None
+        with open(self.metadata_path(key)) as f:
+            metadata = json.load(f)
+        windows = np.load(self.windows_path(key), mmap_mode='r')
+        return windows, metadata
+
+    def save(self, key, windows, columns, starts, params):
+        """
+        Args:
+        key (str): Cache key.
+        windows (np.ndarray): Window matrix of shape (num_windows, num_columns).
+        columns (list): Column names of the window matrix.
+        starts (list): Start row of every window.
+        params (dict): Preprocessing parameters, stored for reference.
+
+        Returns:
+        None
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # write and rename, so concurrent array tasks never read a partial entry
+        tmp_suffix = f".{os.getpid()}.tmp"
+        with open(self.windows_path(key) + tmp_suffix, 'wb') as f:
+            np.save(f, np.ascontiguousarray(windows))
+        os.replace(self.windows_path(key) + tmp_suffix, self.windows_path(key))
+
+        metadata = {
+            'version': CACHE_VERSION,
+            'columns': [str(column) for column in columns],
+            'starts': [int(start) for start in starts],
+            'shape': list(windows.shape),
+            'params': params,
+        }
+        with open(self.metadata_path(key) + tmp_suffix, 'w') as f:
+            json.dump(metadata, f)
+        os.replace(self.metadata_path(key) + tmp_suffix, self.metadata_path(key))
+
+def load_or_create_windows(csv_path, create_windows, cache_dir, **params):
+    """
+    Load preprocessed windows from the cache, or build and cache them.
+
+    Args:
+    csv_path (str): Path to the input CSV.
+    create_windows (callable): Builds the windows, returns (WindowSet, mapping, window_size)
+        like create_sliding_windows_from_csv(..., as_window_set=True).
+    cache_dir (str): Directory of the cache files.
+    **params: Preprocessing parameters that identify the windows.
+
+    Returns:
+    tuple: (read-only memmap of the windows, column names, start -> window mapping, path of the .npy file)
+    """
+    cache = WindowCache(cache_dir)
+    key = cache_key(csv_path, **params)
+    entry = cache.load(key)
+    if entry is None:
+        window_set, _, _ = create_windows()
+        cache.save(key, window_set.to_numpy(), window_set.columns, window_set.starts, params)
+        entry = cache.load(key)
+        print(f"Cached windows under key {key}")
+    else:
+        print(f"Loaded cached windows for key {key}")
+
+    windows, metadata = entry
+    mapping = {start: idx for idx, start in enumerate(metadata['starts'])}
+    return windows, metadata['columns'], mapping, cache.windows_path(key)